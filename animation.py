@@ -0,0 +1,258 @@
+"""
+Animated GIF processing: frame deduplication and animated re-encoding
+"""
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+import hashlib
+import io
+import logging
+
+import numpy as np
+from PIL import Image, ImageSequence
+
+from imaging import ImageProcessingError, check_encoding, encoder_options, check_pixels, OUTPUT_FORMATS, CROP_MIN_ALPHA, alpha_bbox, compose
+
+logger = logging.getLogger(__name__)
+
+# Output formats that can carry an animation (PNG as APNG)
+ANIMATED_FORMATS = ("gif", "webp", "png")
+
+# Thumbnail side used to compare consecutive frames
+_THUMBNAIL_SIDE = 64
+
+
+class AnimatedMatte:
+    """
+    Per-frame mattes of an animation. Frames that repeat (or barely change
+    from) an earlier frame share its matte, so only `unique` frames were
+    segmented: plan maps every frame to the frame whose matte it uses.
+    Only the encoded animation and the unique mattes are kept; frames are
+    decoded again, one at a time, whenever they are rendered.
+    """
+
+    def __init__(self, data: bytes, plan: List[int], mattes: Dict[int, Image.Image], durations: List[int], loop: int):
+        self.data = data
+        self.plan = plan
+        self.mattes = mattes
+        self.durations = durations
+        self.loop = loop
+        self.unique = len(mattes)
+
+    def frames(self) -> Iterator[Tuple[Image.Image, Image.Image]]:
+        """Decode the frames one at a time, each with its matte"""
+        image = open_animation(self.data)
+        for index, (frame, _) in enumerate(iter_frames(image, len(self.plan))):
+            yield frame, self.mattes[self.plan[index]]
+
+
+def is_gif(data: Optional[bytes]) -> bool:
+    """Whether bytes are a GIF, from the magic number"""
+    return bool(data) and data[:6] in (b"GIF87a", b"GIF89a")
+
+
+def open_animation(data: bytes) -> Optional[Image.Image]:
+    """Open an animation without decoding its frames; None for a still image"""
+    try:
+        image = Image.open(io.BytesIO(data))
+        check_pixels(image)
+        if getattr(image, "n_frames", 1) < 2:
+            return None
+    except ImageProcessingError:
+        raise
+    except Exception as e:
+        raise ImageProcessingError(f"Could not decode animation: {str(e)}")
+    return image
+
+
+def iter_frames(image: Image.Image, max_frames: int) -> Iterator[Tuple[Image.Image, int]]:
+    """
+    Decode an opened animation frame by frame into full-canvas RGB frames,
+    yielding (frame, duration in ms); only the current frame is held
+    """
+    try:
+        for index, frame in enumerate(ImageSequence.Iterator(image)):
+            if index == max_frames:
+                raise ImageProcessingError(f"Animation has more than {max_frames} frames")
+            yield frame.convert("RGB"), frame.info.get("duration", image.info.get("duration", 100))
+    except ImageProcessingError:
+        raise
+    except Exception as e:
+        raise ImageProcessingError(f"Could not decode animation: {str(e)}")
+
+
+def plan_frames(
+    frames: Iterable[Tuple[Image.Image, int]],
+    static_threshold: float
+) -> Iterator[Tuple[int, Image.Image, int]]:
+    """
+    Map each frame to the frame whose matte it will use: itself if it has
+    to be segmented, an earlier identical frame, or the previous segmented
+    frame when the picture has barely changed (mean absolute difference of
+    grayscale thumbnails below static_threshold, on a 0-255 scale).
+
+    Consumes (frame, duration) pairs lazily and yields (matte frame index,
+    frame, duration) for each; only the last segmented frame's thumbnail
+    and a digest per distinct frame are remembered.
+    """
+    seen = {}
+    last_unique, last_thumbnail = None, None
+
+    for index, (frame, duration) in enumerate(frames):
+        digest = hashlib.blake2b(frame.tobytes(), digest_size=16).digest()
+        if digest in seen:
+            yield seen[digest], frame, duration
+            continue
+
+        thumbnail = np.asarray(
+            frame.convert("L").resize((_THUMBNAIL_SIDE, _THUMBNAIL_SIDE), Image.BILINEAR),
+            dtype=np.int16
+        )
+        if last_thumbnail is not None and np.abs(thumbnail - last_thumbnail).mean() < static_threshold:
+            seen[digest] = last_unique
+            yield last_unique, frame, duration
+            continue
+
+        seen[digest] = index
+        last_unique, last_thumbnail = index, thumbnail
+        yield index, frame, duration
+
+
+def _gif_palette(frames: Iterable[Image.Image]) -> Tuple[Image.Image, bool]:
+    """
+    One 255-color palette for every frame, from a strip of thumbnails of
+    the frames, with index 255 left free for transparency; returns
+    (palette, whether the frames have alpha). A shared palette avoids color
+    flicker and lets the encoder store only the pixels that change between
+    frames.
+    """
+    strip_side = 128
+    thumbnails, transparent = [], False
+    for frame in frames:
+        transparent = transparent or frame.mode == "RGBA"
+        thumbnails.append(frame.convert("RGB").resize((strip_side, strip_side), Image.BILINEAR))
+    strip = Image.new("RGB", (strip_side * len(thumbnails), strip_side))
+    for index, thumbnail in enumerate(thumbnails):
+        strip.paste(thumbnail, (index * strip_side, 0))
+    palette = strip.quantize(colors=255, method=Image.Quantize.MEDIANCUT)
+    # Pad to a full 256-entry palette so index 255 exists for transparency
+    entries = palette.getpalette()[:255 * 3]
+    palette.putpalette(entries + [0] * (768 - len(entries)))
+    return palette, transparent
+
+
+def _gif_frame(frame: Image.Image, palette: Image.Image) -> Image.Image:
+    """Quantize a frame to the shared palette, with index 255 for transparency"""
+    indexed = frame.convert("RGB").quantize(palette=palette, dither=Image.Dither.FLOYDSTEINBERG)
+    if frame.mode == "RGBA":
+        # GIF transparency is on/off: pixels under half opacity drop out
+        mask = frame.getchannel("A").point(lambda a: 255 if a < 128 else 0)
+        indexed.paste(255, mask=mask)
+    return indexed
+
+
+def encode_animation(
+    frames: Callable[[], Iterator[Image.Image]],
+    durations: List[int],
+    loop: int,
+    output_format: str,
+    profile: str = "balanced",
+    lossless: bool = False,
+    palette: bool = False
+) -> Tuple[bytes, str]:
+    """
+    Encode composited frames as an animated GIF, WebP or PNG (APNG).
+    frames() yields the frames one at a time and is called once per pass
+    (GIF takes two: the shared palette, then the frames themselves); only
+    what Pillow's encoder keeps is held at once, 1 byte per pixel for GIF.
+    lossless selects lossless WebP; palette output is still images only,
+    as APNG frames must share one palette and that loses soft alpha.
+    """
+    output_format = output_format.lower()
+    if output_format not in ANIMATED_FORMATS:
+        raise ImageProcessingError(f"Format '{output_format}' can't hold an animation")
+    check_encoding(output_format, lossless, palette)
+    if palette:
+        raise ImageProcessingError("palette is not available for animated output")
+
+    pil_format, content_type = OUTPUT_FORMATS[output_format]
+    options = encoder_options(pil_format, profile, lossless)
+
+    if pil_format == "GIF":
+        shared, transparent = _gif_palette(frames())
+        encoded = [_gif_frame(frame, shared) for frame in frames()]
+        if transparent:
+            options["transparency"] = 255
+        # Clear each frame before the next so transparent areas don't keep old pixels
+        options["disposal"] = 2
+        # The palette is already shared and minimal; Pillow's palette
+        # optimization would renumber it and lose the transparent index
+        options["optimize"] = False
+    elif pil_format == "PNG":
+        encoded = list(frames())
+    else:
+        encoded = [frame.convert("RGB") if frame.mode == "L" else frame for frame in frames()]
+
+    buffer = io.BytesIO()
+    encoded[0].save(
+        buffer,
+        format=pil_format,
+        save_all=True,
+        append_images=encoded[1:],
+        duration=durations,
+        loop=loop,
+        **options
+    )
+    return buffer.getvalue(), content_type
+
+
+def _union(boxes: Iterable[Optional[Tuple[int, int, int, int]]]) -> Optional[Tuple[int, int, int, int]]:
+    boxes = [box for box in boxes if box is not None]
+    if not boxes:
+        return None
+    return (
+        min(box[0] for box in boxes), min(box[1] for box in boxes),
+        max(box[2] for box in boxes), max(box[3] for box in boxes)
+    )
+
+
+def render_animation(animation: AnimatedMatte, options: dict, sizes: List[int]) -> List[Tuple[bytes, str]]:
+    """
+    Composite and encode the animation at each size (longest side in
+    pixels, 0 = original); returns one (bytes, content type) per size.
+    Frames are decoded, composited and resized one at a time, so memory
+    holds the encoder's output frames rather than every decoded frame.
+    """
+    frame_options = {**options, "auto_crop": False}
+
+    # Frames share one canvas, so auto_crop uses the union of their boxes
+    box = None
+    if options.get("auto_crop"):
+        mask_options = {**frame_options, "mask_only": True}
+        box = _union(
+            alpha_bbox(np.asarray(compose(frame, matte, mask_options)), options.get("crop_padding", 0), CROP_MIN_ALPHA)
+            for frame, matte in animation.frames()
+        )
+
+    canvas = (box[2] - box[0], box[3] - box[1]) if box else open_animation(animation.data).size
+
+    outputs = []
+    for max_side in sizes:
+        size = None
+        if max_side and max(canvas) > max_side:
+            scale = max_side / max(canvas)
+            size = (max(1, round(canvas[0] * scale)), max(1, round(canvas[1] * scale)))
+
+        def frames(size=size) -> Iterator[Image.Image]:
+            for frame, matte in animation.frames():
+                result = compose(frame, matte, frame_options)
+                if box:
+                    result = result.crop(box)
+                if size:
+                    result = result.resize(size, Image.LANCZOS, reducing_gap=3.0)
+                yield result
+
+        outputs.append(encode_animation(
+            frames, animation.durations, animation.loop,
+            options.get("format", "gif"), options.get("encoding", "balanced"),
+            options.get("lossless", False), options.get("palette", False)
+        ))
+    return outputs
@@ -0,0 +1,847 @@
+"""
+Inference backends for background removal
+"""
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+from concurrent.futures import ProcessPoolExecutor
+import asyncio
+import base64
+import importlib.util
+import itertools
+import multiprocessing
+import os
+import random
+import time
+import logging
+
+import httpx
+import numpy as np
+from fastapi import HTTPException
+from PIL import Image
+import replicate
+
+from config import settings
+from fetch import download_image, result_size_limit
+from upstream import upstream, UpstreamClient
+from imaging import apply_matte, encode_image, decode_image, decode_matte, working_copy, mime_type, ImageProcessingError
+from resilience import LatencyTracker, AdaptiveDeadline, CircuitBreaker, AdmissionController
+from scheduler import TierScheduler
+import segmentation
+
+logger = logging.getLogger(__name__)
+
+
+class InferenceError(Exception):
+    """Raised when a backend is unavailable or fails to produce a result"""
+
+
+class ServiceUnavailableError(InferenceError):
+    """Raised when a request is rejected without trying the upstream"""
+
+    def __init__(self, message: str, retry_after: int):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+def is_client_error(error: Exception) -> bool:
+    """
+    Whether an error is the request's fault (unreadable image, 4xx), as
+    opposed to the backend failing; timeouts are never the client's fault
+    """
+    if isinstance(error, ImageProcessingError):
+        return True
+    return isinstance(error, HTTPException) and 400 <= error.status_code < 500 and error.status_code != 408
+
+
+def error_message(error: Exception) -> str:
+    """An error's message; HTTPException keeps it in detail (its str() is empty)"""
+    if isinstance(error, HTTPException):
+        return str(error.detail)
+    return str(error) or type(error).__name__
+
+
+class InferenceResult:
+    """
+    Output of a backend: either a URL hosted by the backend, or image bytes
+    that the API stores and serves itself.
+    """
+
+    def __init__(
+        self,
+        backend: str,
+        url: Optional[str] = None,
+        data: Optional[bytes] = None,
+        content_type: Optional[str] = None
+    ):
+        self.backend = backend
+        self.url = url
+        self.data = data
+        self.content_type = content_type
+
+
+class MatteResult:
+    """
+    Output of segment(): the decoded source image and its 8-bit alpha matte.
+    The matte may be smaller than the image (e.g. when inference ran on a
+    downscaled copy); it is upsampled when composited.
+    """
+
+    def __init__(self, backend: str, image: Image.Image, matte: Image.Image):
+        self.backend = backend
+        self.image = image
+        self.matte = matte
+
+
+# Model options that produce a plain cut-out, whose alpha channel is the matte
+MATTE_OPTIONS = {"format": "png", "reverse": False, "threshold": 0, "background_type": "rgba"}
+
+
+def data_uri(data: bytes, content_type: str) -> str:
+    """Inline image bytes as a data URI the model accepts in place of a URL"""
+    return f"data:{content_type};base64,{base64.b64encode(data).decode()}"
+
+
+class InferenceBackend:
+    """Base class for inference backends"""
+
+    name = "base"
+
+    async def remove_background(self, image_url: str, options: dict) -> InferenceResult:
+        """
+        Remove the background from the image at image_url.
+        Options: format, reverse, threshold, background_type.
+        """
+        raise NotImplementedError
+
+    async def segment(
+        self,
+        image_url: str,
+        max_side: int = 0,
+        image_bytes: Optional[bytes] = None,
+        inline: bool = False
+    ) -> MatteResult:
+        """
+        Get the alpha matte for the image at image_url, from which any output
+        variant can be rendered locally. By default this asks the model for a
+        plain RGBA cut-out and keeps its alpha channel.
+
+        With max_side set, images larger than that are downscaled here and
+        the model is sent the small copy instead of the original URL.
+        image_bytes, when given, is the image itself, already fetched from
+        image_url. With inline, image_bytes is what gets segmented (an
+        upload, a tile, a frame) and is always sent to the model as a data
+        URI; image_url then only labels it.
+        """
+        image, model_url = await self.prepare(image_url, max_side, image_bytes, inline)
+        matte = await self.predict_matte(model_url)
+        return MatteResult(backend=self.name, image=image, matte=matte)
+
+    async def prepare(
+        self,
+        image_url: str,
+        max_side: int = 0,
+        image_bytes: Optional[bytes] = None,
+        inline: bool = False
+    ) -> Tuple[Image.Image, str]:
+        """
+        The client's side of segment(): fetch and decode the source and
+        choose what the model is sent. Returns (decoded image, model input
+        URL or data URI). Failures here are the source's, not the backend's.
+        """
+        if inline and image_bytes is None:
+            raise ValueError("inline segmentation needs image_bytes")
+        source = image_bytes if image_bytes is not None else await download_image(image_url)
+        image = await asyncio.to_thread(decode_image, source)
+
+        model_url = image_url
+        small = await asyncio.to_thread(working_copy, image, max_side)
+        if small is not None:
+            data, content_type = await asyncio.to_thread(encode_image, small, "jpg")
+            model_url = data_uri(data, content_type)
+            logger.debug(f"Segmenting {image_url} at {small.size[0]}x{small.size[1]} ({len(data)} bytes)")
+        elif inline:
+            model_url = data_uri(source, mime_type(source))
+        return image, model_url
+
+    async def predict_matte(self, model_url: str) -> Image.Image:
+        """The backend's side of segment(): run the model on model_url and decode the matte"""
+        result = await self.remove_background(model_url, MATTE_OPTIONS)
+        data = result.data
+        if data is None:
+            data = await download_image(result.url, max_bytes=result_size_limit())
+        return await asyncio.to_thread(decode_matte, data)
+
+    def stats(self) -> dict:
+        """Get backend statistics"""
+        return {}
+
+    def shutdown(self):
+        """Release backend resources"""
+
+
+class ReplicateBackend(InferenceBackend):
+    """Runs the configured Replicate model through the async upstream client"""
+
+    name = "replicate"
+
+    def __init__(self, client: UpstreamClient = upstream):
+        self.client = client
+
+    async def remove_background(self, image_url: str, options: dict) -> InferenceResult:
+        try:
+            # Only the model's own inputs (local-only options such as the
+            # encoding profile are dropped)
+            model_input = {key: value for key, value in options.items() if key in MATTE_OPTIONS}
+            output = await self.client.run({"image": image_url, **model_input})
+        except replicate.exceptions.ReplicateError as e:
+            raise InferenceError(str(e)) from e
+        except (httpx.HTTPError, asyncio.TimeoutError) as e:
+            raise InferenceError(f"Replicate request failed: {type(e).__name__}: {e}") from e
+        except Exception as e:
+            # Anything else from the client (malformed response, ...) is an upstream fault too
+            raise InferenceError(f"Replicate request failed: {e}") from e
+
+        output_url = output.url() if hasattr(output, 'url') else str(output)
+        return InferenceResult(backend=self.name, url=output_url)
+
+    def stats(self) -> dict:
+        return self.client.stats()
+
+
+class LocalBackend(InferenceBackend):
+    """
+    Runs an ONNX salient-object model (e.g. U2-Net) on local CPU cores.
+    Inference happens in a process pool so it never blocks the event loop.
+    """
+
+    name = "local"
+
+    def __init__(
+        self,
+        model_path: str = "models/u2netp.onnx",
+        input_size: int = 320,
+        workers: int = 2,
+        threads_per_worker: int = 1
+    ):
+        if importlib.util.find_spec("onnxruntime") is None:
+            raise RuntimeError("The local backend requires onnxruntime (pip install onnxruntime)")
+        if not os.path.isfile(model_path):
+            raise RuntimeError(f"Local segmentation model not found at '{model_path}' (set LOCAL_MODEL_PATH)")
+
+        self.model_path = model_path
+        self.input_size = input_size
+        self.workers = workers
+        self.threads_per_worker = threads_per_worker
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self.in_flight = 0
+        self.completed = 0
+        self.failed = 0
+
+    @property
+    def executor(self) -> ProcessPoolExecutor:
+        """Process pool, started on first use"""
+        if self._executor is None:
+            # spawn: forking a process that already runs an event loop and threads is unsafe
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.workers,
+                mp_context=multiprocessing.get_context("spawn")
+            )
+        return self._executor
+
+    async def remove_background(self, image_url: str, options: dict) -> InferenceResult:
+        image_bytes = await download_image(image_url)
+
+        self.in_flight += 1
+        try:
+            loop = asyncio.get_running_loop()
+            data, content_type = await loop.run_in_executor(
+                self.executor,
+                segmentation.remove_background,
+                image_bytes,
+                options,
+                self.model_path,
+                self.input_size,
+                self.threads_per_worker
+            )
+            self.completed += 1
+        except Exception:
+            self.failed += 1
+            raise
+        finally:
+            self.in_flight -= 1
+
+        return InferenceResult(backend=self.name, data=data, content_type=content_type)
+
+    async def segment(
+        self,
+        image_url: str,
+        max_side: int = 0,
+        image_bytes: Optional[bytes] = None,
+        inline: bool = False
+    ) -> MatteResult:
+        # The model runs at input_size regardless; the matte comes back at
+        # that resolution and is upsampled to the image by the caller
+        if image_bytes is None:
+            image_bytes = await download_image(image_url)
+
+        self.in_flight += 1
+        try:
+            loop = asyncio.get_running_loop()
+            rgb, alpha = await loop.run_in_executor(
+                self.executor,
+                segmentation.segment,
+                image_bytes,
+                self.model_path,
+                self.input_size,
+                self.threads_per_worker
+            )
+            self.completed += 1
+        except Exception:
+            self.failed += 1
+            raise
+        finally:
+            self.in_flight -= 1
+
+        return MatteResult(
+            backend=self.name,
+            image=Image.fromarray(rgb, mode="RGB"),
+            matte=Image.fromarray(alpha, mode="L")
+        )
+
+    def stats(self) -> dict:
+        return {
+            "model": os.path.basename(self.model_path),
+            "workers": self.workers,
+            "in_flight": self.in_flight,
+            "completed": self.completed,
+            "failed": self.failed
+        }
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+
+class SimulatedBackend(InferenceBackend):
+    """
+    Stand-in for the upstream model for load and capacity testing.
+
+    Sleeps for a latency drawn from a configurable distribution, fails at a
+    configurable rate and returns a synthetic RGBA cut-out rendered locally,
+    so benchmarks cost nothing and need no network access.
+
+    Latency distributions:
+    - fixed: always latency_ms
+    - lognormal: median latency_ms with shape sigma
+    - replay: recorded timings (ms, one per line) replayed in order
+    """
+
+    name = "simulated"
+
+    def __init__(
+        self,
+        distribution: str = "fixed",
+        latency_ms: float = 3000,
+        sigma: float = 0.5,
+        replay_file: Optional[str] = None,
+        error_rate: float = 0.0,
+        output_size: int = 512,
+        max_concurrency: int = 32,
+        seed: Optional[int] = None
+    ):
+        if distribution not in ("fixed", "lognormal", "replay"):
+            raise ValueError(f"Unknown simulated latency distribution '{distribution}'")
+
+        self.distribution = distribution
+        self.latency_ms = latency_ms
+        self.sigma = sigma
+        self.error_rate = error_rate
+        self.output_size = output_size
+        self.max_concurrency = max_concurrency
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self._random = random.Random(seed)
+        self._replay = None
+        if distribution == "replay":
+            self._replay = itertools.cycle(self._load_timings(replay_file))
+
+        # Synthetic source and matte, and encoded outputs by
+        # (format, reverse, threshold, background_type)
+        self._synthetic: Optional[Tuple[Image.Image, Image.Image]] = None
+        self._outputs: Dict[Tuple, Tuple[bytes, str]] = {}
+        self.in_flight = 0
+        self.completed = 0
+        self.failed = 0
+
+    @staticmethod
+    def _load_timings(path: Optional[str]) -> List[float]:
+        """Load recorded latencies in milliseconds, one per line"""
+        if not path or not os.path.isfile(path):
+            raise ValueError(f"Simulated latency replay file not found: '{path}'")
+
+        with open(path) as f:
+            timings = [float(line) for line in (raw.strip() for raw in f) if line and not line.startswith("#")]
+
+        if not timings:
+            raise ValueError(f"No timings in replay file '{path}'")
+        return timings
+
+    def sample_latency(self) -> float:
+        """Draw the next latency in seconds"""
+        if self.distribution == "lognormal":
+            latency_ms = self.latency_ms * self._random.lognormvariate(0, self.sigma)
+        elif self.distribution == "replay":
+            latency_ms = next(self._replay)
+        else:
+            latency_ms = self.latency_ms
+        return latency_ms / 1000
+
+    def _source(self) -> Tuple[Image.Image, Image.Image]:
+        """Synthetic source image (a gradient) and matte (a soft-edged disc)"""
+        if self._synthetic is None:
+            size = self.output_size
+            y, x = np.mgrid[0:size, 0:size].astype(np.float32)
+            distance = np.hypot(x - size / 2, y - size / 2) / (size * 0.35)
+            matte = np.clip((1.0 - distance) * 8, 0, 1)
+            gradient = np.dstack([x / size * 255, y / size * 255, np.full_like(x, 160)]).astype(np.uint8)
+            self._synthetic = (
+                Image.fromarray(gradient, mode="RGB"),
+                Image.fromarray((matte * 255).astype(np.uint8), mode="L")
+            )
+        return self._synthetic
+
+    def _render(self, options: dict) -> Tuple[bytes, str]:
+        """Render (once per option set) a synthetic cut-out"""
+        key = (options.get("format", "png"), options.get("reverse", False),
+               options.get("threshold", 0), options.get("background_type", "rgba"))
+
+        if key not in self._outputs:
+            source, matte = self._source()
+            image = apply_matte(
+                source,
+                matte,
+                reverse=key[1],
+                threshold=key[2],
+                background_type=key[3]
+            )
+            self._outputs[key] = encode_image(image, key[0])
+
+        return self._outputs[key]
+
+    async def _simulate_call(self):
+        """Wait out one simulated upstream call, failing at the configured rate"""
+        async with self._semaphore:
+            self.in_flight += 1
+            try:
+                await asyncio.sleep(self.sample_latency())
+
+                if self._random.random() < self.error_rate:
+                    self.failed += 1
+                    raise InferenceError("Simulated upstream error")
+
+                self.completed += 1
+            finally:
+                self.in_flight -= 1
+
+    async def remove_background(self, image_url: str, options: dict) -> InferenceResult:
+        await self._simulate_call()
+        data, content_type = self._render(options)
+        return InferenceResult(backend=self.name, data=data, content_type=content_type)
+
+    async def prepare(
+        self,
+        image_url: str,
+        max_side: int = 0,
+        image_bytes: Optional[bytes] = None,
+        inline: bool = False
+    ) -> Tuple[Image.Image, str]:
+        # Nothing is fetched: every image is the synthetic source
+        return self._source()[0], image_url
+
+    async def predict_matte(self, model_url: str) -> Image.Image:
+        await self._simulate_call()
+        return self._source()[1]
+
+    def stats(self) -> dict:
+        return {
+            "distribution": self.distribution,
+            "latency_ms": self.latency_ms,
+            "error_rate": self.error_rate,
+            "max_concurrency": self.max_concurrency,
+            "in_flight": self.in_flight,
+            "completed": self.completed,
+            "failed": self.failed
+        }
+
+
+class GuardedBackend(InferenceBackend):
+    """
+    Wraps a remote backend with a circuit breaker, adaptive deadlines and
+    optional hedging.
+
+    Every call gets a deadline derived from the rolling latency distribution.
+    With hedging on, a second identical call is launched once the first has
+    run past the hedge percentile; the first to succeed wins and the other is
+    canceled. At most hedge_max_ratio of calls are hedged, so a slow upstream
+    is never hit with double load.
+    """
+
+    def __init__(
+        self,
+        backend: InferenceBackend,
+        tracker: LatencyTracker,
+        deadline: AdaptiveDeadline,
+        breaker: Optional[CircuitBreaker] = None,
+        hedging: bool = False,
+        hedge_percentile: float = 95,
+        hedge_max_ratio: float = 0.1
+    ):
+        self.backend = backend
+        self.name = backend.name
+        self.tracker = tracker
+        self.deadline = deadline
+        self.breaker = breaker
+        self.hedging = hedging
+        self.hedge_percentile = hedge_percentile
+        self.hedge_max_ratio = hedge_max_ratio
+        self.calls = 0
+        self.timeouts = 0
+        self.hedges_launched = 0
+        self.hedges_won = 0
+
+    def _hedge_delay(self) -> Optional[float]:
+        """Seconds to wait before hedging, or None if this call can't be hedged"""
+        if not self.hedging or self.hedges_launched >= self.hedge_max_ratio * self.calls:
+            return None
+        return self.tracker.percentile(self.hedge_percentile)
+
+    async def remove_background(self, image_url: str, options: dict) -> InferenceResult:
+        return await self._guarded(image_url, lambda: self.backend.remove_background(image_url, options))
+
+    async def segment(
+        self,
+        image_url: str,
+        max_side: int = 0,
+        image_bytes: Optional[bytes] = None,
+        inline: bool = False
+    ) -> MatteResult:
+        # The source is fetched and decoded outside the guard: a slow or
+        # broken image host must not count against the upstream's deadline,
+        # latency or circuit breaker, nor be fetched again by a hedge
+        image, model_url = await self.backend.prepare(image_url, max_side, image_bytes, inline)
+        matte = await self._guarded(image_url, lambda: self.backend.predict_matte(model_url))
+        return MatteResult(backend=self.name, image=image, matte=matte)
+
+    async def _guarded(self, image_url: str, call: Callable[[], Awaitable]):
+        """Run call() behind the circuit breaker"""
+        if self.breaker is None:
+            return await self._call(image_url, call)
+
+        if not self.breaker.allow():
+            raise ServiceUnavailableError(
+                f"{self.name} backend unavailable (circuit open)",
+                retry_after=self.breaker.retry_after()
+            )
+
+        start = time.monotonic()
+        try:
+            result = await self._call(image_url, call)
+        except InferenceError:
+            self.breaker.record(False)
+            raise
+        except Exception as e:
+            if is_client_error(e):
+                # The upstream answered; the request itself was bad
+                self.breaker.record(True)
+                raise
+            self.breaker.record(False)
+            raise InferenceError(f"{self.name} backend failed: {error_message(e)}") from e
+
+        self.breaker.record(True, latency=time.monotonic() - start)
+        return result
+
+    async def _call(self, image_url: str, call: Callable[[], Awaitable]):
+        """Run call() under the adaptive deadline, hedging if configured"""
+        loop = asyncio.get_running_loop()
+        start = loop.time()
+        deadline = self.deadline.current()
+        self.calls += 1
+
+        primary = asyncio.ensure_future(call())
+        hedge = None
+        pending = {primary}
+        errors = []
+
+        try:
+            hedge_delay = self._hedge_delay()
+            if hedge_delay is not None and hedge_delay < deadline:
+                done, _ = await asyncio.wait(pending, timeout=hedge_delay)
+                if not done:
+                    hedge = asyncio.ensure_future(call())
+                    pending.add(hedge)
+                    self.hedges_launched += 1
+                    logger.info(f"Hedging {self.name} call after {hedge_delay:.2f}s: {image_url}")
+
+            while pending:
+                remaining = max(deadline - (loop.time() - start), 0)
+                done, pending = await asyncio.wait(pending, timeout=remaining, return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    break
+
+                for task in done:
+                    if task.exception() is None:
+                        if task is hedge:
+                            self.hedges_won += 1
+                        self.tracker.record(loop.time() - start)
+                        return task.result()
+                    errors.append(task.exception())
+
+            if pending:
+                self.timeouts += 1
+                # Record the deadline so timeouts still pull the distribution up
+                self.tracker.record(deadline)
+                logger.warning(f"{self.name} call timed out after {deadline:.1f}s: {image_url}")
+                raise InferenceError(f"Upstream timed out after {deadline:.1f}s")
+
+            raise errors[0]
+        finally:
+            # Cancel the loser (or everything, on timeout or caller cancellation)
+            for task in (primary, hedge):
+                if task is not None and not task.done():
+                    task.cancel()
+
+    def stats(self) -> dict:
+        hedge_win_rate = (self.hedges_won / self.hedges_launched * 100) if self.hedges_launched > 0 else 0
+        return {
+            **self.backend.stats(),
+            "latency": self.tracker.stats(),
+            "deadline": round(self.deadline.current(), 3),
+            "calls": self.calls,
+            "timeouts": self.timeouts,
+            "circuit": self.breaker.stats() if self.breaker else None,
+            "hedging": {
+                "enabled": self.hedging,
+                "launched": self.hedges_launched,
+                "won": self.hedges_won,
+                "win_rate": f"{hedge_win_rate:.2f}%"
+            }
+        }
+
+    def shutdown(self):
+        self.backend.shutdown()
+
+
+def guard(backend: InferenceBackend) -> GuardedBackend:
+    """Wrap a remote backend with the configured deadlines and hedging"""
+    tracker = LatencyTracker(window=settings.upstream_latency_window)
+    return GuardedBackend(
+        backend,
+        tracker=tracker,
+        deadline=AdaptiveDeadline(
+            tracker,
+            min_timeout=settings.upstream_timeout_min,
+            max_timeout=settings.upstream_timeout_max,
+            multiplier=settings.upstream_timeout_multiplier
+        ),
+        breaker=CircuitBreaker(
+            failure_threshold=settings.circuit_failure_threshold,
+            min_calls=settings.circuit_min_calls,
+            window=settings.circuit_window,
+            slow_call_seconds=settings.circuit_slow_call_seconds,
+            open_seconds=settings.circuit_open_seconds,
+            half_open_probes=settings.circuit_half_open_probes
+        ) if settings.circuit_breaker_enabled else None,
+        hedging=settings.hedging_enabled,
+        hedge_percentile=settings.hedge_percentile,
+        hedge_max_ratio=settings.hedge_max_ratio
+    )
+
+
+def create_backend(name: str) -> InferenceBackend:
+    """Create a backend from its configured name"""
+    if name == "replicate":
+        return guard(ReplicateBackend())
+    if name == "local":
+        return LocalBackend(
+            model_path=settings.local_model_path,
+            input_size=settings.local_model_input_size,
+            workers=settings.local_workers,
+            threads_per_worker=settings.local_threads_per_worker
+        )
+    if name == "simulated":
+        return guard(SimulatedBackend(
+            distribution=settings.simulated_latency_distribution,
+            latency_ms=settings.simulated_latency_ms,
+            sigma=settings.simulated_latency_sigma,
+            replay_file=settings.simulated_latency_replay_file,
+            error_rate=settings.simulated_error_rate,
+            output_size=settings.simulated_output_size,
+            max_concurrency=settings.upstream_max_concurrency
+        ))
+    raise ValueError(f"Unknown inference backend '{name}'")
+
+
+class BackendRouter:
+    """
+    Picks the backend for each request.
+
+    - Images up to small_image_max_bytes go to small_image_backend
+    - Everything else goes to the primary backend
+    - If the chosen backend raises InferenceError, the fallback is tried
+
+    An admission controller in front sheds requests once too many are
+    already queued or running, and a tier scheduler decides which queued
+    request gets the next upstream slot.
+    """
+
+    def __init__(
+        self,
+        primary: InferenceBackend,
+        fallback: Optional[InferenceBackend] = None,
+        small_image_backend: Optional[InferenceBackend] = None,
+        small_image_max_bytes: int = 0,
+        admission: Optional[AdmissionController] = None,
+        scheduler: Optional[TierScheduler] = None
+    ):
+        self.primary = primary
+        self.fallback = fallback
+        self.small_image_backend = small_image_backend
+        self.small_image_max_bytes = small_image_max_bytes
+        self.admission = admission or AdmissionController(max_depth=0)
+        self.scheduler = scheduler or TierScheduler(capacity=settings.upstream_max_concurrency, weights={"free": 1})
+        self.routed: Dict[str, int] = {}
+        self.fallbacks = 0
+
+    @property
+    def backends(self) -> Dict[str, InferenceBackend]:
+        """All distinct configured backends by name"""
+        candidates = [self.primary, self.fallback, self.small_image_backend]
+        return {backend.name: backend for backend in candidates if backend is not None}
+
+    def select(self, size_bytes: Optional[int] = None) -> InferenceBackend:
+        """Choose the backend for an image of the given size (if known)"""
+        if (
+            self.small_image_backend is not None
+            and size_bytes is not None
+            and size_bytes <= self.small_image_max_bytes
+        ):
+            return self.small_image_backend
+        return self.primary
+
+    async def remove_background(
+        self,
+        image_url: str,
+        options: dict,
+        size_bytes: Optional[int] = None,
+        tier: Optional[str] = None
+    ) -> InferenceResult:
+        """
+        Run background removal on the selected backend, falling back on
+        failure. tier is the caller's subscription, used for scheduling.
+        """
+        return await self._route(
+            image_url, size_bytes, tier,
+            lambda backend: backend.remove_background(image_url, options)
+        )
+
+    async def segment(
+        self,
+        image_url: str,
+        size_bytes: Optional[int] = None,
+        tier: Optional[str] = None,
+        max_side: int = 0,
+        image_bytes: Optional[bytes] = None,
+        inline: bool = False
+    ) -> MatteResult:
+        """
+        Get the image's alpha matte from the selected backend, falling back
+        on failure. max_side downscales large images before inference;
+        image_bytes passes the image itself instead of downloading image_url,
+        and inline sends those bytes to the model rather than image_url
+        (for images that have no URL of their own).
+        """
+        return await self._route(
+            image_url, size_bytes, tier,
+            lambda backend: backend.segment(image_url, max_side, image_bytes, inline)
+        )
+
+    async def _route(
+        self,
+        image_url: str,
+        size_bytes: Optional[int],
+        tier: Optional[str],
+        call: Callable[[InferenceBackend], Awaitable]
+    ):
+        """Run call(backend) under admission control and tier scheduling"""
+        if not self.admission.try_enter():
+            logger.warning(f"Shedding request, {self.admission.depth} already in flight: {image_url}")
+            raise ServiceUnavailableError(
+                "Server is at capacity, please retry shortly",
+                retry_after=self.admission.retry_after
+            )
+
+        try:
+            async with self.scheduler.slot(tier):
+                backend = self.select(size_bytes)
+                self.routed[backend.name] = self.routed.get(backend.name, 0) + 1
+                logger.info(f"Processing image with {backend.name} backend: {image_url}")
+
+                try:
+                    return await call(backend)
+                except InferenceError as e:
+                    if self.fallback is None or self.fallback is backend:
+                        raise
+                    logger.warning(f"{backend.name} backend failed ({str(e)}), falling back to {self.fallback.name}")
+                    self.fallbacks += 1
+                    return await call(self.fallback)
+        finally:
+            self.admission.leave()
+
+    def stats(self) -> dict:
+        """Get routing statistics and per-backend stats"""
+        return {
+            "primary": self.primary.name,
+            "fallback": self.fallback.name if self.fallback else None,
+            "small_image_backend": self.small_image_backend.name if self.small_image_backend else None,
+            "routed": self.routed,
+            "fallbacks": self.fallbacks,
+            "admission": self.admission.stats(),
+            "scheduler": self.scheduler.stats(),
+            "backends": {name: backend.stats() for name, backend in self.backends.items()}
+        }
+
+    def shutdown(self):
+        """Release resources of all backends"""
+        for backend in self.backends.values():
+            backend.shutdown()
+
+
+def create_router() -> BackendRouter:
+    """Build the backend router from settings, sharing one instance per backend name"""
+    instances: Dict[str, InferenceBackend] = {}
+
+    def get(name: Optional[str]) -> Optional[InferenceBackend]:
+        if not name:
+            return None
+        if name not in instances:
+            instances[name] = create_backend(name)
+        return instances[name]
+
+    return BackendRouter(
+        primary=get(settings.inference_backend),
+        fallback=get(settings.inference_fallback_backend),
+        small_image_backend=get("local") if settings.local_small_image_max_mb > 0 else None,
+        small_image_max_bytes=int(settings.local_small_image_max_mb * 1024 * 1024),
+        admission=AdmissionController(
+            max_depth=settings.max_queue_depth,
+            retry_after=settings.admission_retry_after
+        ),
+        scheduler=TierScheduler(
+            capacity=settings.upstream_max_concurrency,
+            weights=settings.tier_weights,
+            default_tier=settings.default_tier
+        )
+    )
+
+
+# Global inference router instance
+inference = create_router()
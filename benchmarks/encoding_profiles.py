@@ -0,0 +1,78 @@
+"""
+Output size and encode time per encoding profile
+
+Composites the synthetic product shot from matte_upsampling.py into a
+transparent cut-out (and a white-background variant for JPEG), encodes it
+with every output format and profile (plus lossless WebP and palette PNG),
+and reports bytes, encode time and PSNR against the unencoded image
+(premultiplied RGBA; inf = lossless).
+
+    python benchmarks/encoding_profiles.py --megapixels 2 --repeat 3
+"""
+import argparse
+import io
+import os
+import sys
+import time
+
+import numpy as np
+from PIL import Image
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from imaging import (  # noqa: E402
+    OUTPUT_FORMATS, OPAQUE_FORMATS, ENCODING_PROFILES, LOSSLESS_OPTIONS, PALETTE_FORMATS, apply_matte, encode_image
+)
+from matte_upsampling import synthetic_shot  # noqa: E402
+
+
+def psnr(encoded: bytes, reference: Image.Image) -> float:
+    """PSNR of decoded output vs the reference, on premultiplied RGBA"""
+    def premultiplied(image: Image.Image) -> np.ndarray:
+        rgba = np.asarray(image.convert("RGBA"), dtype=np.float64)
+        return np.concatenate([rgba[..., :3] * rgba[..., 3:] / 255.0, rgba[..., 3:]], axis=-1)
+
+    decoded = Image.open(io.BytesIO(encoded))
+    mse = np.mean((premultiplied(decoded) - premultiplied(reference)) ** 2)
+    return float("inf") if mse == 0 else 10 * np.log10(255.0 ** 2 / mse)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Encoding profile benchmark")
+    parser.add_argument("--megapixels", type=float, default=2)
+    parser.add_argument("--repeat", type=int, default=3, help="Encodes per measurement (best time is kept)")
+    parser.add_argument("--formats", nargs="+", default=[f for f in OUTPUT_FORMATS if f != "jpeg"])
+    args = parser.parse_args()
+
+    image, matte = synthetic_shot(args.megapixels)
+    cutout = apply_matte(image, matte)
+    on_white = apply_matte(image, matte, background_type="white")
+    print(f"Cut-out: {image.width}x{image.height}, {image.width * image.height * 4 / 1e6:.1f} MB raw RGBA\n")
+    print(f"{'format':>14} {'profile':>9} {'size':>10} {'vs balanced':>12} {'encode':>9} {'PSNR':>8}")
+
+    for output_format in args.formats:
+        source = on_white if output_format in OPAQUE_FORMATS else cutout
+        variants = [(output_format, {})]
+        if OUTPUT_FORMATS[output_format][0] in LOSSLESS_OPTIONS:
+            variants.append((f"{output_format} lossless", {"lossless": True}))
+        if output_format in PALETTE_FORMATS:
+            variants.append((f"{output_format} palette", {"palette": True}))
+
+        for label, flags in variants:
+            results = {}
+            for profile in ENCODING_PROFILES:
+                best = float("inf")
+                for _ in range(args.repeat):
+                    start = time.perf_counter()
+                    data, _ = encode_image(source, output_format, profile, **flags)
+                    best = min(best, time.perf_counter() - start)
+                results[profile] = (data, best)
+
+            balanced_size = len(results["balanced"][0])
+            for profile, (data, best) in results.items():
+                print(f"{label:>14} {profile:>9} {len(data) / 1e3:>8.0f}KB "
+                      f"{len(data) / balanced_size * 100:>11.0f}% {best * 1000:>7.0f}ms {psnr(data, source):>8.1f}")
+
+
+if __name__ == "__main__":
+    main()
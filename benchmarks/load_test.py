@@ -0,0 +1,88 @@
+"""
+Load generator for capacity testing
+
+Run the API with the simulated backend so no Replicate credits are spent:
+
+    INFERENCE_BACKEND=simulated SIMULATED_LATENCY_DISTRIBUTION=lognormal \
+    VALIDATE_IMAGE_URLS=false RATE_LIMIT_DEFAULT=100000/hour \
+    uvicorn main:app --workers 4
+
+then, from another shell:
+
+    python benchmarks/load_test.py --requests 500 --concurrency 100 --unique 50
+"""
+import argparse
+import asyncio
+import json
+import statistics
+import time
+
+import httpx
+
+
+def percentile(values: list, pct: float) -> float:
+    """Nearest-rank percentile of a list of numbers"""
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, int(round(pct / 100 * len(ordered))) - 1))
+    return ordered[index]
+
+
+async def run(args):
+    """Fire requests with bounded concurrency and collect latencies"""
+    semaphore = asyncio.Semaphore(args.concurrency)
+    latencies = []
+    statuses = {}
+    cached = 0
+
+    async def one(client: httpx.AsyncClient, index: int):
+        nonlocal cached
+        payload = {
+            "image_url": f"{args.image_url}?v={index % args.unique}",
+            "format": args.format
+        }
+        async with semaphore:
+            start = time.perf_counter()
+            try:
+                response = await client.post(f"{args.base_url}/api/v1/remove-background", json=payload)
+                code = response.status_code
+                if code == 200 and response.json().get("cached"):
+                    cached += 1
+            except httpx.HTTPError as e:
+                code = type(e).__name__
+            latencies.append(time.perf_counter() - start)
+            statuses[code] = statuses.get(code, 0) + 1
+
+    limits = httpx.Limits(max_connections=args.concurrency)
+    async with httpx.AsyncClient(timeout=args.timeout, limits=limits) as client:
+        start = time.perf_counter()
+        await asyncio.gather(*(one(client, i) for i in range(args.requests)))
+        elapsed = time.perf_counter() - start
+
+    async with httpx.AsyncClient() as client:
+        upstream_stats = (await client.get(f"{args.base_url}/upstream/stats")).json()
+
+    print(f"Requests:    {args.requests} ({args.unique} unique images, concurrency {args.concurrency})")
+    print(f"Wall time:   {elapsed:.2f}s  ({args.requests / elapsed:.1f} req/s)")
+    print(f"Statuses:    {statuses}")
+    print(f"Cached:      {cached}")
+    print(f"Latency p50: {percentile(latencies, 50):.3f}s")
+    print(f"Latency p95: {percentile(latencies, 95):.3f}s")
+    print(f"Latency p99: {percentile(latencies, 99):.3f}s")
+    print(f"Latency max: {max(latencies):.3f}s  mean: {statistics.mean(latencies):.3f}s")
+    print(f"Upstream (this worker): {json.dumps(upstream_stats.get('inference', {}).get('backends', {}))}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Background Removal API load generator")
+    parser.add_argument("--base-url", default="http://localhost:8000")
+    parser.add_argument("--image-url", default="https://example.com/product.jpg")
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--unique", type=int, default=50, help="Distinct image URLs (controls cache hit rate)")
+    parser.add_argument("--format", default="png")
+    parser.add_argument("--timeout", type=float, default=120)
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
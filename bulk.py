@@ -0,0 +1,383 @@
+"""
+Bulk jobs: large manifests of images processed in the background
+"""
+from typing import Awaitable, Callable, List, Optional, Tuple
+from contextlib import contextmanager
+from datetime import datetime
+import asyncio
+import json
+import sqlite3
+import time
+import uuid
+import logging
+
+from config import settings
+from backends import InferenceError
+
+logger = logging.getLogger(__name__)
+
+# Item and job states
+ITEM_PENDING = "pending"
+ITEM_RUNNING = "running"
+ITEM_SUCCEEDED = "succeeded"
+ITEM_FAILED = "failed"
+
+BULK_PROCESSING = "processing"
+BULK_COMPLETED = "completed"
+
+# process(options, tier) -> (output_url, cached)
+ProcessFn = Callable[[dict, Optional[str]], Awaitable[Tuple[str, bool]]]
+
+
+class BulkJobStore:
+    """
+    SQLite-backed store for bulk jobs and their items.
+
+    Workers claim items with a lease: a claimed item that isn't finished
+    before its lease expires (worker crash, restart) goes back to pending,
+    so jobs resume where they left off, until it has used its attempts.
+    Claims are a single UPDATE, which SQLite serializes, so several worker
+    processes can share one store. Completed jobs are kept for ttl seconds.
+    """
+
+    def __init__(self, db_path: str = "bulk.db", ttl: int = 604800):
+        self.db_path = db_path
+        self.ttl = ttl
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS bulk_jobs (
+                    id TEXT PRIMARY KEY,
+                    status TEXT NOT NULL,
+                    total INTEGER NOT NULL,
+                    succeeded INTEGER NOT NULL DEFAULT 0,
+                    failed INTEGER NOT NULL DEFAULT 0,
+                    tier TEXT,
+                    request_id TEXT,
+                    created_at REAL NOT NULL,
+                    updated_at REAL NOT NULL
+                )
+                """
+            )
+            conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS bulk_items (
+                    job_id TEXT NOT NULL,
+                    idx INTEGER NOT NULL,
+                    options TEXT NOT NULL,
+                    status TEXT NOT NULL,
+                    output_url TEXT,
+                    error TEXT,
+                    cached INTEGER NOT NULL DEFAULT 0,
+                    attempts INTEGER NOT NULL DEFAULT 0,
+                    claim TEXT,
+                    lease_until REAL,
+                    updated_at REAL NOT NULL,
+                    PRIMARY KEY (job_id, idx)
+                )
+                """
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS bulk_items_status ON bulk_items (status, lease_until)")
+            conn.execute("CREATE INDEX IF NOT EXISTS bulk_items_job_status ON bulk_items (job_id, status)")
+
+    @contextmanager
+    def _connect(self):
+        """Open a connection, commit on success and always close it"""
+        conn = sqlite3.connect(self.db_path, timeout=30)
+        conn.row_factory = sqlite3.Row
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def create(self, items: List[dict], tier: Optional[str] = None, request_id: Optional[str] = None) -> str:
+        """Create a job from a list of per-item request options"""
+        job_id = uuid.uuid4().hex
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT INTO bulk_jobs (id, status, total, tier, request_id, created_at, updated_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (job_id, BULK_PROCESSING, len(items), tier, request_id, now, now)
+            )
+            conn.executemany(
+                "INSERT INTO bulk_items (job_id, idx, options, status, updated_at) VALUES (?, ?, ?, ?, ?)",
+                ((job_id, idx, json.dumps(options), ITEM_PENDING, now) for idx, options in enumerate(items))
+            )
+            # Opportunistically drop expired jobs
+            expired = "SELECT id FROM bulk_jobs WHERE status = ? AND updated_at < ?"
+            conn.execute(f"DELETE FROM bulk_items WHERE job_id IN ({expired})", (BULK_COMPLETED, now - self.ttl))
+            conn.execute(f"DELETE FROM bulk_jobs WHERE id IN ({expired})", (BULK_COMPLETED, now - self.ttl))
+        logger.info(f"Bulk job created: {job_id} ({len(items)} items)")
+        return job_id
+
+    def claim(self, limit: int, lease_seconds: float, max_attempts: int = 3) -> List[dict]:
+        """
+        Claim up to limit pending (or lease-expired) items for processing.
+        Lease-expired items that have used max_attempts are failed instead.
+        """
+        claim = uuid.uuid4().hex
+        now = time.time()
+        with self._connect() as conn:
+            self._fail_exhausted(conn, now, max_attempts)
+            conn.execute(
+                """
+                UPDATE bulk_items
+                SET status = ?, claim = ?, lease_until = ?, attempts = attempts + 1, updated_at = ?
+                WHERE rowid IN (
+                    SELECT rowid FROM bulk_items
+                    WHERE (status = ? AND (lease_until IS NULL OR lease_until < ?))
+                       OR (status = ? AND lease_until < ? AND attempts < ?)
+                    ORDER BY rowid
+                    LIMIT ?
+                )
+                """,
+                (ITEM_RUNNING, claim, now + lease_seconds, now,
+                 ITEM_PENDING, now, ITEM_RUNNING, now, max_attempts, limit)
+            )
+            rows = conn.execute(
+                """
+                SELECT i.job_id, i.idx, i.options, i.attempts, j.tier
+                FROM bulk_items i JOIN bulk_jobs j ON j.id = i.job_id
+                WHERE i.claim = ?
+                """,
+                (claim,)
+            ).fetchall()
+
+        return [
+            {
+                "job_id": row["job_id"],
+                "index": row["idx"],
+                "options": json.loads(row["options"]),
+                "attempts": row["attempts"],
+                "tier": row["tier"]
+            }
+            for row in rows
+        ]
+
+    def _fail_exhausted(self, conn: sqlite3.Connection, now: float, max_attempts: int):
+        """
+        Fail lease-expired items that have no attempts left (e.g. an image
+        that kills its worker every time), counting them in their jobs
+        """
+        mark = uuid.uuid4().hex
+        conn.execute(
+            """
+            UPDATE bulk_items
+            SET status = ?, error = ?, claim = ?, lease_until = NULL, updated_at = ?
+            WHERE status = ? AND lease_until < ? AND attempts >= ?
+            """,
+            (ITEM_FAILED, f"Lease expired on attempt {max_attempts} of {max_attempts}", mark, now,
+             ITEM_RUNNING, now, max_attempts)
+        )
+        counts = conn.execute(
+            "SELECT job_id, COUNT(*) FROM bulk_items WHERE claim = ? GROUP BY job_id", (mark,)
+        ).fetchall()
+        if not counts:
+            return
+        conn.executemany(
+            """
+            UPDATE bulk_jobs
+            SET failed = failed + ?,
+                status = CASE WHEN succeeded + failed + ? >= total THEN ? ELSE ? END,
+                updated_at = ?
+            WHERE id = ?
+            """,
+            ((failed, failed, BULK_COMPLETED, BULK_PROCESSING, now, job_id) for job_id, failed in counts)
+        )
+        conn.execute("UPDATE bulk_items SET claim = NULL WHERE claim = ?", (mark,))
+        logger.warning(f"Bulk items failed after their last lease expired: {sum(failed for _, failed in counts)}")
+
+    def finish(self, job_id: str, index: int, status: str, output_url: str = None,
+               error: str = None, cached: bool = False, retry_at: float = None):
+        """
+        Record an item's outcome. Status pending puts the item back in the
+        queue, to be claimed again no earlier than retry_at.
+
+        The job keeps running succeeded/failed counts, updated in the same
+        transaction, so finishing an item doesn't rescan the job's items.
+        An item is only counted once: a late outcome for an item that has
+        already finished (after its lease expired) is ignored.
+        """
+        now = time.time()
+        with self._connect() as conn:
+            updated = conn.execute(
+                """
+                UPDATE bulk_items
+                SET status = ?, output_url = ?, error = ?, cached = ?, claim = NULL, lease_until = ?, updated_at = ?
+                WHERE job_id = ? AND idx = ? AND status NOT IN (?, ?)
+                """,
+                (status, output_url, error, int(cached), retry_at, now, job_id, index, ITEM_SUCCEEDED, ITEM_FAILED)
+            ).rowcount
+            if not updated:
+                return
+            succeeded = int(status == ITEM_SUCCEEDED)
+            failed = int(status == ITEM_FAILED)
+            conn.execute(
+                """
+                UPDATE bulk_jobs
+                SET succeeded = succeeded + ?, failed = failed + ?,
+                    status = CASE WHEN succeeded + failed + ? >= total THEN ? ELSE ? END,
+                    updated_at = ?
+                WHERE id = ?
+                """,
+                (succeeded, failed, succeeded + failed, BULK_COMPLETED, BULK_PROCESSING, now, job_id)
+            )
+
+    def get(self, job_id: str) -> Optional[dict]:
+        """Get a job with per-status item counts, or None if unknown or expired"""
+        with self._connect() as conn:
+            job = conn.execute("SELECT * FROM bulk_jobs WHERE id = ?", (job_id,)).fetchone()
+            if job is None or (job["status"] == BULK_COMPLETED and time.time() - job["updated_at"] > self.ttl):
+                return None
+            running = conn.execute(
+                "SELECT COUNT(*) FROM bulk_items WHERE job_id = ? AND status = ?",
+                (job_id, ITEM_RUNNING)
+            ).fetchone()[0]
+
+        done = job["succeeded"] + job["failed"]
+        return {
+            "job_id": job["id"],
+            "status": job["status"],
+            "total": job["total"],
+            "pending": job["total"] - done - running,
+            "running": running,
+            "succeeded": job["succeeded"],
+            "failed": job["failed"],
+            "progress": round(done / job["total"] * 100, 2) if job["total"] else 100.0,
+            "created_at": datetime.utcfromtimestamp(job["created_at"]).isoformat(),
+            "updated_at": datetime.utcfromtimestamp(job["updated_at"]).isoformat()
+        }
+
+    def results(self, job_id: str, after: int = -1, limit: int = 100, status: Optional[str] = None) -> List[dict]:
+        """Page through a job's items in manifest order, starting after an index"""
+        query = "SELECT * FROM bulk_items WHERE job_id = ? AND idx > ?"
+        params = [job_id, after]
+        if status:
+            query += " AND status = ?"
+            params.append(status)
+        query += " ORDER BY idx LIMIT ?"
+        params.append(limit)
+
+        with self._connect() as conn:
+            rows = conn.execute(query, params).fetchall()
+
+        return [
+            {
+                "index": row["idx"],
+                "image_url": json.loads(row["options"]).get("image_url"),
+                "status": row["status"],
+                "output_url": row["output_url"],
+                "error": row["error"],
+                "cached": bool(row["cached"]),
+                "attempts": row["attempts"]
+            }
+            for row in rows
+        ]
+
+
+class BulkWorker:
+    """
+    Background loop that claims bulk items and processes them with at most
+    `concurrency` in flight per worker process. Service errors are retried
+    up to max_attempts with exponential backoff; other errors fail the item
+    immediately.
+    """
+
+    def __init__(
+        self,
+        store: BulkJobStore,
+        concurrency: int = 4,
+        poll_interval: float = 1.0,
+        lease_seconds: float = 600,
+        max_attempts: int = 3,
+        retry_delay: float = 30
+    ):
+        self.store = store
+        self.concurrency = concurrency
+        self.poll_interval = poll_interval
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        self.retry_delay = retry_delay
+        self._task: Optional[asyncio.Task] = None
+        self._active = set()
+        self.processed = 0
+        self.retried = 0
+
+    def start(self, process: ProcessFn):
+        """Start the worker loop"""
+        if self._task is None:
+            self._task = asyncio.ensure_future(self._run(process))
+            logger.info(f"Bulk worker started (concurrency {self.concurrency})")
+
+    async def stop(self):
+        """Stop the loop; unfinished items are picked up again when their lease expires"""
+        tasks = [task for task in [self._task, *self._active] if task is not None]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._task = None
+
+    async def _run(self, process: ProcessFn):
+        while True:
+            try:
+                free = self.concurrency - len(self._active)
+                items = []
+                if free > 0:
+                    items = await asyncio.to_thread(self.store.claim, free, self.lease_seconds, self.max_attempts)
+                    for item in items:
+                        task = asyncio.ensure_future(self._process_item(process, item))
+                        self._active.add(task)
+                        task.add_done_callback(self._active.discard)
+
+                if len(self._active) >= self.concurrency:
+                    await asyncio.wait(self._active, return_when=asyncio.FIRST_COMPLETED)
+                elif not items:
+                    await asyncio.sleep(self.poll_interval)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Bulk worker error: {str(e)}", exc_info=True)
+                await asyncio.sleep(self.poll_interval)
+
+    async def _process_item(self, process: ProcessFn, item: dict):
+        job_id, index = item["job_id"], item["index"]
+        try:
+            output_url, cached = await process(item["options"], item["tier"])
+            outcome = {"status": ITEM_SUCCEEDED, "output_url": output_url, "cached": cached}
+        except InferenceError as e:
+            if item["attempts"] < self.max_attempts:
+                self.retried += 1
+                retry_at = time.time() + self.retry_delay * 2 ** (item["attempts"] - 1)
+                outcome = {"status": ITEM_PENDING, "error": str(e), "retry_at": retry_at}
+            else:
+                outcome = {"status": ITEM_FAILED, "error": str(e)}
+        except Exception as e:
+            outcome = {"status": ITEM_FAILED, "error": str(e)}
+
+        self.processed += 1
+        await asyncio.to_thread(self.store.finish, job_id, index, **outcome)
+
+    def stats(self) -> dict:
+        """Get worker statistics"""
+        return {
+            "running": self._task is not None,
+            "concurrency": self.concurrency,
+            "active": len(self._active),
+            "processed": self.processed,
+            "retried": self.retried
+        }
+
+
+# Global bulk job store and worker instances
+bulk_store = BulkJobStore(db_path=settings.bulk_db_path, ttl=settings.bulk_job_ttl)
+bulk_worker = BulkWorker(
+    bulk_store,
+    concurrency=settings.bulk_concurrency,
+    poll_interval=settings.bulk_poll_interval,
+    lease_seconds=settings.bulk_lease_seconds,
+    max_attempts=settings.bulk_max_attempts,
+    retry_delay=settings.bulk_retry_delay
+)
@@ -1,29 +1,52 @@
 """
 Simple caching mechanism for API responses
 """
-from typing import Optional, Any
+from typing import Optional, Any, Awaitable, Callable, Dict
+import asyncio
 import hashlib
 import json
 import time
 from collections import OrderedDict
 import logging
 
+from config import settings
+
 logger = logging.getLogger(__name__)
 
 
+def content_digest(data: bytes) -> str:
+    """Fast content digest (BLAKE2b, 128-bit) identifying an image by its bytes"""
+    return hashlib.blake2b(data, digest_size=16).hexdigest()
+
+
 class SimpleCache:
     """
     Simple in-memory cache with TTL support.
     In production, use Redis or Memcached for distributed caching.
     """
     
-    def __init__(self, max_size: int = 1000, default_ttl: int = 3600):
+    def __init__(
+        self,
+        max_size: int = 1000,
+        default_ttl: int = 3600,
+        max_bytes: int = 0,
+        weigh: Optional[Callable[[Any], int]] = None
+    ):
         self.cache = OrderedDict()
         self.max_size = max_size
         self.default_ttl = default_ttl
+        # Optional bound on total weight (e.g. bytes of decoded images), by weigh(value)
+        self.max_bytes = max_bytes
+        self.weigh = weigh
+        self._sizes: Dict[str, int] = {}
+        self.total_bytes = 0
         self.hits = 0
         self.misses = 0
     
+    def _remove(self, key: str):
+        del self.cache[key]
+        self.total_bytes -= self._sizes.pop(key, 0)
+    
     def _generate_key(self, *args, **kwargs) -> str:
         """Generate cache key from arguments"""
         key_data = json.dumps({"args": args, "kwargs": kwargs}, sort_keys=True)
@@ -40,7 +63,7 @@ class SimpleCache:
         
         # Check if expired
         if time.time() > expiry:
-            del self.cache[key]
+            self._remove(key)
             self.misses += 1
             logger.debug(f"Cache expired: {key}")
             return None
@@ -51,28 +74,47 @@ class SimpleCache:
         logger.debug(f"Cache hit: {key}")
         return value
     
+    def peek(self, key: str) -> Optional[Any]:
+        """Get an unexpired value without counting a hit or miss or refreshing its recency"""
+        entry = self.cache.get(key)
+        if entry is None or time.time() > entry[1]:
+            return None
+        return entry[0]
+    
     def set(self, key: str, value: Any, ttl: Optional[int] = None):
         """Set value in cache"""
-        # Enforce max size
-        if len(self.cache) >= self.max_size:
+        if key in self.cache:
+            self._remove(key)
+        size = self.weigh(value) if self.weigh else 0
+        
+        # Enforce max size (and max bytes, keeping at least the new entry)
+        while self.cache and (
+            len(self.cache) >= self.max_size
+            or (self.max_bytes and self.total_bytes + size > self.max_bytes)
+        ):
             # Remove oldest item
             oldest_key = next(iter(self.cache))
-            del self.cache[oldest_key]
+            self._remove(oldest_key)
             logger.debug(f"Cache full, removed oldest: {oldest_key}")
         
         expiry = time.time() + (ttl or self.default_ttl)
         self.cache[key] = (value, expiry)
+        if size:
+            self._sizes[key] = size
+            self.total_bytes += size
         logger.debug(f"Cache set: {key}, TTL: {ttl or self.default_ttl}s")
     
     def delete(self, key: str):
         """Delete value from cache"""
         if key in self.cache:
-            del self.cache[key]
+            self._remove(key)
             logger.debug(f"Cache deleted: {key}")
     
     def clear(self):
         """Clear all cache"""
         self.cache.clear()
+        self._sizes.clear()
+        self.total_bytes = 0
         logger.info("Cache cleared")
     
     def stats(self) -> dict:
@@ -80,7 +122,7 @@ class SimpleCache:
         total_requests = self.hits + self.misses
         hit_rate = (self.hits / total_requests * 100) if total_requests > 0 else 0
         
-        return {
+        stats = {
             "size": len(self.cache),
             "max_size": self.max_size,
             "hits": self.hits,
@@ -88,8 +130,96 @@ class SimpleCache:
             "hit_rate": f"{hit_rate:.2f}%",
             "total_requests": total_requests
         }
+        if self.max_bytes:
+            stats["size_mb"] = round(self.total_bytes / (1024 * 1024), 2)
+            stats["max_size_mb"] = round(self.max_bytes / (1024 * 1024), 2)
+        return stats
+
+
+class SingleFlight:
+    """
+    Coalesce concurrent calls for the same key into one execution.
+    The first caller starts the work; callers arriving while it is still
+    running await the same result instead of repeating the work.
+    """
+    
+    def __init__(self):
+        self.in_flight: Dict[str, asyncio.Task] = {}
+        self.executions = 0
+        self.coalesced = 0
+    
+    async def do(self, key: str, fn: Callable[[], Awaitable[Any]]) -> Any:
+        """Run fn() for key, or join the execution already in flight"""
+        task = self.in_flight.get(key)
+        
+        if task is not None:
+            self.coalesced += 1
+            logger.debug(f"Coalesced in-flight request: {key}")
+        else:
+            self.executions += 1
+            task = asyncio.ensure_future(fn())
+            self.in_flight[key] = task
+            task.add_done_callback(lambda t: self._done(key, t))
+        
+        # Shield so one caller disconnecting doesn't cancel the work for the others
+        return await asyncio.shield(task)
+    
+    def _done(self, key: str, task: asyncio.Task):
+        """Forget a finished execution"""
+        if self.in_flight.get(key) is task:
+            del self.in_flight[key]
+        # Mark the exception as retrieved when every waiter has gone away
+        if not task.cancelled():
+            task.exception()
+    
+    def stats(self) -> dict:
+        """Get coalescing statistics"""
+        total_requests = self.executions + self.coalesced
+        coalesce_rate = (self.coalesced / total_requests * 100) if total_requests > 0 else 0
+        
+        return {
+            "in_flight": len(self.in_flight),
+            "executions": self.executions,
+            "coalesced": self.coalesced,
+            "coalesce_rate": f"{coalesce_rate:.2f}%"
+        }
 
 
 # Global cache instance
 cache = SimpleCache(max_size=1000, default_ttl=3600)
 
+def decoded_bytes(value: Any) -> int:
+    """
+    Approximate memory held by a matte cache entry: the decoded images of a
+    matte (image + matte), or an animation's unique mattes plus its
+    encoded bytes (frames are decoded on demand)
+    """
+    images = [getattr(value, name, None) for name in ("image", "matte")]
+    images.extend((getattr(value, "mattes", None) or {}).values())
+    encoded = getattr(value, "data", None)
+    return (
+        sum(image.width * image.height * len(image.getbands()) for image in images if image is not None)
+        + (len(encoded) if isinstance(encoded, bytes) else 0)
+    )
+
+
+# Global cache of decoded source images and their mattes, keyed by source;
+# bounded by decoded bytes since one entry can be hundreds of MB
+matte_cache = SimpleCache(
+    max_size=settings.matte_cache_size,
+    default_ttl=settings.cache_ttl,
+    max_bytes=int(settings.matte_cache_max_mb * 1024 * 1024),
+    weigh=decoded_bytes
+)
+
+# Global in-flight request coalescer
+inflight = SingleFlight()
+
+
+# Global index of image URL -> content digest, so repeat URLs skip the fetch and hash
+digest_index = SimpleCache(max_size=settings.digest_index_size, default_ttl=settings.digest_index_ttl)
+
+
+# Global cache of image URL validation results (fresh for VALIDATION_CACHE_TTL,
+# kept for conditional revalidation up to VALIDATION_CACHE_MAX_AGE)
+validation_cache = SimpleCache(max_size=settings.validation_cache_size, default_ttl=settings.validation_cache_max_age)
@@ -18,6 +18,62 @@ class Settings(BaseSettings):
     replicate_api_token: str
     replicate_model: str = "851-labs/background-remover:a029dff38972b5fda4ec5d75d7d1cd25aeff621d2cf4946a41055d7db66b80bc"
     
+    # Upstream Concurrency
+    upstream_max_concurrency: int = 32  # Max in-flight predictions per worker
+    upstream_poll_interval: float = 0.5  # Seconds between prediction status polls
+    
+    # Upstream Deadlines and Hedging (replicate and simulated backends)
+    upstream_timeout_min: float = 5  # Lower bound for the adaptive deadline (seconds)
+    upstream_timeout_max: float = 60  # Upper bound, also used until enough latencies are seen
+    upstream_timeout_multiplier: float = 3.0  # Deadline = observed p99 x multiplier
+    upstream_latency_window: int = 500  # Recent latencies kept for percentiles
+    hedging_enabled: bool = False
+    hedge_percentile: float = 95  # Launch a second call once the first exceeds this percentile
+    hedge_max_ratio: float = 0.1  # Max fraction of calls that may be hedged
+    
+    # Circuit Breaker (replicate and simulated backends)
+    circuit_breaker_enabled: bool = True
+    circuit_failure_threshold: float = 0.5  # Failure ratio in the window that opens the circuit
+    circuit_min_calls: int = 10  # Calls needed before the ratio is evaluated
+    circuit_window: int = 50  # Recent calls considered
+    circuit_slow_call_seconds: float = 30  # Successful calls slower than this count as failures
+    circuit_open_seconds: float = 30  # How long to fail fast before probing again
+    circuit_half_open_probes: int = 3  # Successful probes needed to close the circuit
+    
+    # Admission Control (per worker)
+    max_queue_depth: int = 100  # Requests queued or running upstream before shedding (0 = unlimited)
+    admission_retry_after: int = 5  # Retry-After seconds sent with shed requests
+    
+    # Tier Scheduling (share of upstream slots under contention, by X-RapidAPI-Subscription)
+    tier_weights: dict = {"bulk": 0.5, "free": 1, "basic": 2, "pro": 4, "ultra": 8, "mega": 16, "enterprise": 16}
+    default_tier: str = "free"  # Used for unknown or missing subscriptions
+    
+    # Inference Backend
+    inference_backend: str = "replicate"  # replicate, local or simulated
+    inference_fallback_backend: Optional[str] = None  # Tried when the primary backend is unavailable
+    local_small_image_max_mb: float = 0  # Route images up to this size to the local backend (0 = off)
+    local_model_path: str = "models/u2netp.onnx"  # ONNX salient-object model (U2-Net family)
+    local_model_input_size: int = 320
+    local_workers: int = 2  # Processes in the local inference pool
+    local_threads_per_worker: int = 1
+    
+    # Simulated Backend (load and capacity testing without Replicate)
+    simulated_latency_distribution: str = "fixed"  # fixed, lognormal or replay
+    simulated_latency_ms: float = 3000  # Fixed latency, or lognormal median
+    simulated_latency_sigma: float = 0.5  # Lognormal shape
+    simulated_latency_replay_file: Optional[str] = None  # Recorded latencies in ms, one per line
+    simulated_error_rate: float = 0.0  # Fraction of requests that fail (0-1)
+    simulated_output_size: int = 512  # Side length of the synthetic result in pixels
+    
+    # Result Storage (results produced on this host)
+    results_dir: str = "results"
+    results_max_mb: float = 2048  # Least recently used results are evicted beyond this (0 = unbounded)
+    store_remote_results: bool = True  # Download backend-hosted outputs (e.g. Replicate URLs) into the store
+    public_base_url: Optional[str] = None  # e.g. https://api.example.com; relative URLs if unset
+    encoding_profile: str = "balanced"  # Default output encoding: fast, balanced or smallest
+    max_output_sizes: int = 8  # Most sizes one request may ask for
+    max_output_side: int = 8192  # Largest longest-side size a request may ask for
+    
     # Security
     api_key_header: str = "X-RapidAPI-Proxy-Secret"
     rapidapi_key_header: str = "X-RapidAPI-Key"
@@ -32,17 +88,78 @@ class Settings(BaseSettings):
     
     # Caching
     cache_enabled: bool = True
-    cache_ttl: int = 3600  # 1 hour in seconds
+    cache_ttl: int = 3600  # 1 hour in seconds (mattes, and upstream-hosted result URLs)
+    result_cache_ttl: int = 7 * 24 * 3600  # Cached URLs of results in the local store (checked against eviction on hit)
+    content_hash_keys: bool = False  # Key results on image content, not URL (fetches each new URL once)
+    digest_index_size: int = 10000  # URL -> content digest entries kept
+    digest_index_ttl: int = 3600  # How long a URL is assumed to keep serving the same bytes
+    matte_cache_enabled: bool = True  # Segment once per image, render variants locally
+    matte_cache_size: int = 100  # Decoded source images + mattes kept in memory
+    matte_cache_max_mb: float = 1024  # Memory bound for the matte cache (a 24 MP image + matte is ~96 MB)
+    inference_max_side: int = 0  # Downscale larger images to this longest side before inference (0 = off)
+    matte_refine: bool = True  # Edge-aware (guided filter) upsampling of low-resolution mattes
+    matte_refine_radius: int = 4  # Guided filter window radius, in matte pixels
+    matte_refine_eps: float = 1e-4  # Guided filter regularization (higher = smoother edges)
+    tiled_inference: bool = False  # Segment very large images at full resolution in overlapping tiles
+    tiled_min_megapixels: float = 40  # Images at least this large are tiled
+    tile_size: int = 2048  # Tile side in pixels (also the global pass's working resolution)
+    tile_overlap: int = 256  # Pixels shared by neighbouring tiles, feathered when blending
+    tile_concurrency: int = 4  # Tiles of one image segmented in parallel
+    near_duplicate_enabled: bool = False  # Reuse the matte of a perceptually identical cached image
+    near_duplicate_max_distance: int = 6  # Max pHash Hamming distance (of 63 bits) for a candidate
+    near_duplicate_verify_distance: int = 10  # Max dHash distance confirming a candidate
+    near_duplicate_index_size: int = 10000  # Perceptual hashes kept
+    
+    # Animated GIFs
+    animation_enabled: bool = True  # Segment animated GIFs frame by frame (gif/webp/png output)
+    animation_max_frames: int = 300  # Longer animations are rejected
+    animation_static_threshold: float = 1.0  # Mean pixel change (0-255) below which a frame reuses the last matte
+    animation_concurrency: int = 4  # Frames of one animation segmented in parallel
     
     # File Validation
     max_image_size_mb: int = 10
     allowed_image_formats: list = ["jpg", "jpeg", "png", "webp", "gif"]
     validate_image_urls: bool = True  # Set to False to skip URL validation (faster but less safe)
+    max_image_megapixels: float = 100  # Larger images are rejected from their header, before decoding
+    probe_bytes: int = 16384  # Leading bytes fetched (ranged GET) to read an image URL's real format and dimensions
+    validation_timeout: float = 10  # Seconds per URL validation request
+    validation_max_connections: int = 100  # Pooled connections kept by the URL validator
+    validation_per_host_connections: int = 10  # Concurrent validation requests to one host
+    validation_keepalive: float = 30  # Seconds an idle pooled connection is kept open
+    validation_http2: bool = True  # Use HTTP/2 where the host supports it (needs httpx[http2])
+    validation_cache_enabled: bool = True  # Remember URL validation results
+    validation_cache_size: int = 10000  # URLs kept in the validation cache
+    validation_cache_ttl: int = 60  # Seconds a validation result is reused without contacting the host
+    validation_cache_max_age: int = 3600  # After that, ETag/Last-Modified revalidation for this long
+    validation_negative_ttl: int = 30  # Seconds a 404/410 or timeout is remembered
+    skip_validation_on_cache_hit: bool = False  # Validate URLs only when the result isn't cached
+    upload_spool_mb: int = 2  # Uploads larger than this are spooled to a temp file instead of memory
+    
+    # Batch Processing
+    batch_concurrency: int = 5  # Images processed at once within one batch request
     
     # Webhook Configuration
     webhook_enabled: bool = True
     webhook_timeout: int = 30
     
+    # Async Jobs
+    jobs_db_path: str = "jobs.db"  # SQLite file shared by all workers on the host
+    job_ttl: int = 86400  # How long job results can be polled (seconds)
+    job_timeout: int = 900  # Queued/processing jobs not updated for this long are failed (worker died)
+    
+    # Bulk Jobs (JSON Lines manifests processed in the background)
+    bulk_db_path: str = "bulk.db"  # SQLite file shared by all workers on the host
+    bulk_worker_enabled: bool = True  # Process bulk items in this instance
+    bulk_concurrency: int = 4  # Items in flight per worker process
+    bulk_max_items: int = 100000  # Max lines per manifest
+    bulk_max_manifest_mb: int = 50
+    bulk_lease_seconds: int = 600  # Unfinished claimed items are retried after this (e.g. after a restart)
+    bulk_max_attempts: int = 3  # Attempts per item on service errors
+    bulk_retry_delay: float = 30  # Base delay before a retry, doubled per attempt (seconds)
+    bulk_poll_interval: float = 1.0  # Seconds between checks for new items when idle
+    bulk_tier: str = "bulk"  # Scheduling tier for bulk items, so they yield to interactive traffic
+    bulk_job_ttl: int = 604800  # How long completed jobs and their results are kept (seconds)
+    
     # Logging
     log_level: str = "INFO"
     log_requests: bool = True
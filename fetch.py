@@ -0,0 +1,101 @@
+"""
+Image download helpers for backends that need the source bytes
+"""
+from typing import Optional
+import logging
+
+import httpx
+from fastapi import HTTPException, status
+
+from config import settings
+from cache import content_digest, digest_index
+
+logger = logging.getLogger(__name__)
+
+
+def result_size_limit() -> int:
+    """Size cap for downloading processed outputs; a PNG cut-out can be several times its JPEG source"""
+    return 8 * settings.max_image_size_mb * 1024 * 1024
+
+
+async def download_image(url: str, max_bytes: int = None, timeout: float = 30) -> bytes:
+    """
+    Download an image, aborting as soon as it exceeds max_bytes.
+    Raises HTTPException with the same status codes the URL validator uses.
+    """
+    max_bytes = max_bytes or settings.max_image_size_mb * 1024 * 1024
+
+    try:
+        async with httpx.AsyncClient(follow_redirects=True, timeout=timeout) as client:
+            async with client.stream("GET", str(url)) as response:
+                if response.status_code != 200:
+                    raise HTTPException(
+                        status_code=status.HTTP_400_BAD_REQUEST,
+                        detail=f"Image URL not accessible (status: {response.status_code})"
+                    )
+
+                chunks = []
+                size = 0
+                async for chunk in response.aiter_bytes():
+                    size += len(chunk)
+                    if size > max_bytes:
+                        raise HTTPException(
+                            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+                            detail=f"Image too large. Maximum allowed: {max_bytes / (1024 * 1024)}MB"
+                        )
+                    chunks.append(chunk)
+
+    except httpx.TimeoutException:
+        raise HTTPException(
+            status_code=status.HTTP_408_REQUEST_TIMEOUT,
+            detail="Image URL request timed out"
+        )
+    except httpx.HTTPError as e:
+        logger.error(f"Error downloading image: {str(e)}")
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Could not download image: {str(e)}"
+        )
+
+    logger.debug(f"Downloaded {size} bytes from {url}")
+    return b"".join(chunks)
+
+
+class ImageSource:
+    """
+    An input image: the URL to fetch it from (None for uploads), the key
+    identifying it in the caches, and its bytes when already in hand
+    """
+
+    def __init__(self, url: Optional[str], key: str, data: Optional[bytes] = None):
+        self.url = url
+        self.key = key
+        self.data = data
+
+
+def content_key(digest: str) -> str:
+    """Cache key for an image identified by its content digest"""
+    return f"blake2:{digest}"
+
+
+async def resolve_source(url: str, fetch: bool = True) -> ImageSource:
+    """
+    Identify an image URL for caching. With CONTENT_HASH_KEYS on, the image
+    is keyed by its content digest, so the same bytes at different URLs
+    share results; the URL -> digest index lets repeat URLs skip the fetch.
+    With fetch=False, unknown URLs are keyed by URL instead of downloaded.
+    """
+    if not settings.content_hash_keys:
+        return ImageSource(url, url)
+
+    digest = digest_index.get(url)
+    if digest is not None:
+        return ImageSource(url, content_key(digest))
+    if not fetch:
+        return ImageSource(url, url)
+
+    data = await download_image(url)
+    digest = content_digest(data)
+    digest_index.set(url, digest, ttl=settings.digest_index_ttl)
+    logger.debug(f"Indexed {url} -> {digest}")
+    return ImageSource(url, content_key(digest), data)
@@ -0,0 +1,494 @@
+"""
+Local image operations: decoding, matte compositing and encoding
+"""
+from typing import List, Optional, Tuple
+import io
+import logging
+import zlib
+
+import numpy as np
+from PIL import Image, ImageColor
+
+from config import settings
+
+logger = logging.getLogger(__name__)
+
+# Output format -> (Pillow format name, Content-Type)
+OUTPUT_FORMATS = {
+    "png": ("PNG", "image/png"),
+    "jpg": ("JPEG", "image/jpeg"),
+    "jpeg": ("JPEG", "image/jpeg"),
+    "webp": ("WEBP", "image/webp"),
+    "gif": ("GIF", "image/gif"),
+}
+
+# Formats that cannot store an alpha channel
+OPAQUE_FORMATS = ("jpg", "jpeg")
+
+# AVIF is optional: built into Pillow 11.2+, or added by pillow-avif-plugin
+try:
+    import pillow_avif  # noqa: F401
+except ImportError:
+    pass
+Image.init()
+if "AVIF" in Image.SAVE:
+    OUTPUT_FORMATS["avif"] = ("AVIF", "image/avif")
+
+# Encoding profiles trade CPU time for output size:
+# - fast: minimal compression effort, for latency-sensitive requests
+# - balanced: the encoders' default effort
+# - smallest: maximum effort
+# Lossless WebP and palette PNG are separate, opt-in options (see encode_image)
+ENCODING_PROFILES = ("fast", "balanced", "smallest")
+
+# Pillow format -> profile -> save() arguments
+ENCODER_OPTIONS = {
+    "PNG": {
+        # Pillow picks each row's PNG filter adaptively and doesn't expose the
+        # choice; the zlib strategy is the other knob. The default strategy is
+        # smallest on cut-outs (Z_FILTERED is close; Z_RLE and Z_HUFFMAN_ONLY
+        # are about twice the size).
+        "fast": {"compress_level": 1, "compress_type": zlib.Z_DEFAULT_STRATEGY},
+        "balanced": {"compress_level": 6, "compress_type": zlib.Z_DEFAULT_STRATEGY},
+        "smallest": {"compress_level": 9, "compress_type": zlib.Z_DEFAULT_STRATEGY},
+    },
+    "JPEG": {
+        "fast": {"quality": 85},
+        "balanced": {"quality": 85, "optimize": True},
+        "smallest": {"quality": 80, "optimize": True, "progressive": True},
+    },
+    "WEBP": {
+        # Lossy color with a lossless alpha plane keeps matte edges exact
+        "fast": {"quality": 80, "method": 0},
+        "balanced": {"quality": 82, "method": 4},
+        "smallest": {"quality": 75, "method": 6},
+    },
+    "AVIF": {
+        "fast": {"quality": 60, "speed": 10},
+        "balanced": {"quality": 60, "speed": 6},
+        "smallest": {"quality": 50, "speed": 2},
+    },
+    "GIF": {
+        "fast": {},
+        "balanced": {"optimize": True},
+        "smallest": {"optimize": True},
+    },
+}
+
+# Save arguments for lossless output, for formats that have a lossless mode.
+# For lossless WebP, quality is compression effort: higher is smaller and
+# slower (above 75 at method 6 only costs time).
+LOSSLESS_OPTIONS = {
+    "WEBP": {
+        "fast": {"lossless": True, "quality": 0, "method": 0},
+        "balanced": {"lossless": True, "quality": 50, "method": 4},
+        "smallest": {"lossless": True, "quality": 75, "method": 6},
+    },
+}
+
+# Formats that are always lossless
+LOSSLESS_FORMATS = ("png", "gif")
+
+# Formats that can be reduced to a 256-color palette (with alpha) on request
+PALETTE_FORMATS = ("png",)
+
+
+def encoder_options(pil_format: str, profile: str, lossless: bool = False) -> dict:
+    """save() arguments for a Pillow format and encoding profile"""
+    table = LOSSLESS_OPTIONS if lossless and pil_format in LOSSLESS_OPTIONS else ENCODER_OPTIONS
+    return dict(table.get(pil_format, {}).get(profile, {}))
+
+
+def check_encoding(output_format: str, lossless: bool = False, palette: bool = False):
+    """Reject lossless or palette output for formats that can't provide it"""
+    pil_format = OUTPUT_FORMATS.get(output_format, (None,))[0]
+    if lossless and output_format not in LOSSLESS_FORMATS and pil_format not in LOSSLESS_OPTIONS:
+        raise ImageProcessingError(f"Format '{output_format}' has no lossless mode")
+    if palette and output_format not in PALETTE_FORMATS:
+        raise ImageProcessingError(
+            f"palette is only available for {', '.join(PALETTE_FORMATS)} output"
+        )
+    if lossless and palette:
+        raise ImageProcessingError("palette reduces colors and can't be combined with lossless")
+
+
+class ImageProcessingError(ValueError):
+    """Raised when an image or processing option cannot be handled locally"""
+
+
+def check_pixels(image: Image.Image):
+    """
+    Refuse an opened (not yet loaded) image over MAX_IMAGE_MEGAPIXELS, as a
+    backstop for inputs that skipped header probing
+    """
+    max_megapixels = settings.max_image_megapixels
+    if max_megapixels and image.width * image.height > max_megapixels * 1_000_000:
+        raise ImageProcessingError(
+            f"Image dimensions too large ({image.width}x{image.height}). Maximum allowed: {max_megapixels:g} MP"
+        )
+
+
+def decode_image(data: bytes) -> Image.Image:
+    """Decode image bytes into an RGB image"""
+    try:
+        image = Image.open(io.BytesIO(data))
+    except Exception as e:
+        raise ImageProcessingError(f"Could not decode image: {str(e)}")
+
+    # Opening only reads the header; check the size before decoding pixels
+    check_pixels(image)
+    try:
+        image.load()
+    except Exception as e:
+        raise ImageProcessingError(f"Could not decode image: {str(e)}")
+
+    return image.convert("RGB")
+
+
+def mime_type(data: bytes) -> str:
+    """Content-Type of encoded image bytes, from the image header"""
+    try:
+        image_format = Image.open(io.BytesIO(data)).format
+    except Exception as e:
+        raise ImageProcessingError(f"Could not decode image: {str(e)}")
+    return Image.MIME.get(image_format, "application/octet-stream")
+
+
+def decode_matte(data: bytes) -> Image.Image:
+    """
+    Decode a segmentation output into an 8-bit matte: the alpha channel of
+    a cut-out, or the image itself for a grayscale mask.
+    """
+    try:
+        image = Image.open(io.BytesIO(data))
+        image.load()
+    except Exception as e:
+        raise ImageProcessingError(f"Could not decode matte: {str(e)}")
+
+    if image.mode in ("RGBA", "LA") or (image.mode == "P" and "transparency" in image.info):
+        return image.convert("RGBA").getchannel("A")
+    return image.convert("L")
+
+
+def working_copy(image: Image.Image, max_side: int) -> Optional[Image.Image]:
+    """
+    Downscale an image so its longest side is max_side, for inference.
+    Returns None if the image is already small enough.
+    """
+    if not max_side or max(image.size) <= max_side:
+        return None
+
+    scale = max_side / max(image.size)
+    size = (max(1, round(image.width * scale)), max(1, round(image.height * scale)))
+    return image.resize(size, Image.LANCZOS)
+
+
+def box_filter(x: np.ndarray, radius: int) -> np.ndarray:
+    """Mean over a (2r+1)x(2r+1) window using cumulative sums; borders average what's inside"""
+    for axis in (0, 1):
+        n = x.shape[axis]
+
+        def span(start: int, stop: Optional[int]) -> tuple:
+            return (slice(None),) * axis + (slice(start, stop),)
+
+        # Cumulative sums padded so every window is a plain slice difference
+        shape = list(x.shape)
+        shape[axis] = n + 1 + 2 * radius
+        sums = np.empty(shape, dtype=np.float64)
+        sums[span(0, radius + 1)] = 0.0
+        np.cumsum(x, axis=axis, out=sums[span(radius + 1, n + radius + 1)])
+        sums[span(n + radius + 1, None)] = sums[span(n + radius, n + radius + 1)]
+
+        index = np.arange(n)
+        count = np.minimum(index + radius + 1, n) - np.maximum(index - radius, 0)
+        x = (sums[span(2 * radius + 1, None)] - sums[span(0, n)]) / (count[:, None] if axis == 0 else count)
+
+    return x.astype(np.float32)
+
+
+def rescale_matte(image: Image.Image, matte: Image.Image) -> Image.Image:
+    """Resize a matte to the image's resolution (plain resampling, no refinement)"""
+    if matte.size == image.size:
+        return matte
+    return matte.convert("L").resize(image.size, Image.LANCZOS)
+
+
+def upsample_matte(image: Image.Image, matte: Image.Image, radius: int = 4, eps: float = 1e-4) -> Image.Image:
+    """
+    Upsample a low-resolution matte to the image's resolution with a fast
+    color guided filter: the local linear model alpha = a . rgb + b is
+    fitted at the matte's resolution, and its coefficients are upsampled and
+    applied to the full-resolution pixels, so matte edges snap to color
+    edges in the image instead of being blurred by interpolation.
+    radius is in matte pixels; eps regularizes (higher = smoother).
+    """
+    if matte.size == image.size:
+        return matte
+
+    rgb = image.convert("RGB")
+    guide = np.asarray(rgb.resize(matte.size, Image.BILINEAR), dtype=np.float32) / 255.0
+    alpha = np.asarray(matte.convert("L"), dtype=np.float32) / 255.0
+
+    channels = [guide[..., c] for c in range(3)]
+    mean_i = [box_filter(channel, radius) for channel in channels]
+    mean_alpha = box_filter(alpha, radius)
+    cov_ip = [box_filter(channel * alpha, radius) - m * mean_alpha for channel, m in zip(channels, mean_i)]
+
+    # Regularized 3x3 color covariance per pixel, inverted in closed form
+    def var(i: int, j: int) -> np.ndarray:
+        v = box_filter(channels[i] * channels[j], radius) - mean_i[i] * mean_i[j]
+        return v + eps if i == j else v
+
+    rr, rg, rb, gg, gb, bb = var(0, 0), var(0, 1), var(0, 2), var(1, 1), var(1, 2), var(2, 2)
+    inv_rr = gg * bb - gb * gb
+    inv_rg = gb * rb - rg * bb
+    inv_rb = rg * gb - gg * rb
+    inv_gg = rr * bb - rb * rb
+    inv_gb = rb * rg - rr * gb
+    inv_bb = rr * gg - rg * rg
+    det = rr * inv_rr + rg * inv_rg + rb * inv_rb
+
+    a = [
+        (inv_rr * cov_ip[0] + inv_rg * cov_ip[1] + inv_rb * cov_ip[2]) / det,
+        (inv_rg * cov_ip[0] + inv_gg * cov_ip[1] + inv_gb * cov_ip[2]) / det,
+        (inv_rb * cov_ip[0] + inv_gb * cov_ip[1] + inv_bb * cov_ip[2]) / det,
+    ]
+    b = mean_alpha - a[0] * mean_i[0] - a[1] * mean_i[1] - a[2] * mean_i[2]
+
+    def upsampled(coefficient: np.ndarray) -> np.ndarray:
+        smoothed = Image.fromarray(box_filter(coefficient, radius), mode="F")
+        return np.asarray(smoothed.resize(image.size, Image.BILINEAR), dtype=np.float32)
+
+    full = np.asarray(rgb, dtype=np.float32)
+    refined = upsampled(b) * 255.0
+    for c in range(3):
+        refined += upsampled(a[c]) * full[..., c]
+    return Image.fromarray(np.clip(refined + 0.5, 0, 255).astype(np.uint8), mode="L")
+
+
+def parse_background(background_type: str) -> Optional[Tuple[int, int, int]]:
+    """
+    Parse a background type into an RGB fill color.
+    Returns None for transparent (rgba) output.
+    Accepts color names, hex codes and "r,g,b" / "[r, g, b]" lists.
+    """
+    value = (background_type or "rgba").strip().lower()
+
+    if value == "rgba":
+        return None
+
+    if value.startswith("[") or "," in value:
+        try:
+            rgb = tuple(int(part) for part in value.strip("[]").split(","))
+        except ValueError:
+            rgb = ()
+        if len(rgb) == 3 and all(0 <= c <= 255 for c in rgb):
+            return rgb
+        raise ImageProcessingError(f"Invalid background color '{background_type}'")
+
+    try:
+        return ImageColor.getrgb(value)[:3]
+    except ValueError:
+        raise ImageProcessingError(
+            f"Invalid background_type '{background_type}'. Use rgba, map, a color name, hex code or r,g,b"
+        )
+
+
+def alpha_bbox(alpha: np.ndarray, padding: int = 0, min_alpha: int = 1) -> Optional[Tuple[int, int, int, int]]:
+    """
+    Bounding box (left, top, right, bottom) of the pixels with alpha of at
+    least min_alpha, grown by padding and clipped to the image.
+    Returns None if no pixel qualifies.
+    """
+    visible = alpha >= min_alpha
+    rows = np.flatnonzero(visible.any(axis=1))
+    if rows.size == 0:
+        return None
+
+    # Columns only need scanning within the occupied rows
+    top, bottom = int(rows[0]), int(rows[-1]) + 1
+    cols = np.flatnonzero(visible[top:bottom].any(axis=0))
+    left, right = int(cols[0]), int(cols[-1]) + 1
+
+    height, width = alpha.shape
+    return (
+        max(left - padding, 0),
+        max(top - padding, 0),
+        min(right + padding, width),
+        min(bottom + padding, height)
+    )
+
+
+# Alpha below this is invisible model noise, ignored when auto-cropping
+CROP_MIN_ALPHA = 8
+
+
+def apply_matte(
+    image: Image.Image,
+    matte: Image.Image,
+    reverse: bool = False,
+    threshold: float = 0,
+    background_type: str = "rgba",
+    auto_crop: bool = False,
+    crop_padding: int = 0
+) -> Image.Image:
+    """
+    Apply an alpha matte to an image.
+
+    - **reverse**: invert the matte (keep the background instead)
+    - **threshold**: binarize the matte at this level (0 keeps soft edges)
+    - **background_type**: rgba for transparency, map for the matte itself,
+      otherwise a fill color composited behind the subject
+    - **auto_crop**: trim the output to the bounding box of the kept
+      pixels plus crop_padding pixels; only the box is composited
+    """
+    if matte.size != image.size:
+        matte = matte.resize(image.size, Image.BILINEAR)
+
+    alpha = np.asarray(matte.convert("L"), dtype=np.uint8)
+
+    if reverse:
+        alpha = 255 - alpha
+
+    if threshold and threshold > 0:
+        alpha = np.where(alpha >= threshold * 255, 255, 0).astype(np.uint8)
+
+    # Nothing visible: keep the full frame rather than an empty image
+    box = alpha_bbox(alpha, crop_padding, CROP_MIN_ALPHA) if auto_crop else None
+    if box is not None:
+        left, top, right, bottom = box
+        alpha = alpha[top:bottom, left:right]
+        image = image.crop(box)
+
+    if (background_type or "").strip().lower() == "map":
+        return Image.fromarray(np.ascontiguousarray(alpha), mode="L")
+
+    background = parse_background(background_type)
+    rgb = np.asarray(image.convert("RGB"), dtype=np.uint8)
+
+    if background is None:
+        return Image.fromarray(np.dstack([rgb, alpha]), mode="RGBA")
+
+    weight = alpha[..., None].astype(np.float32) / 255.0
+    fill = np.array(background, dtype=np.float32)
+    composite = rgb.astype(np.float32) * weight + fill * (1.0 - weight)
+    return Image.fromarray(np.clip(composite + 0.5, 0, 255).astype(np.uint8), mode="RGB")
+
+
+def encode_image(
+    image: Image.Image,
+    output_format: str,
+    profile: str = "balanced",
+    lossless: bool = False,
+    palette: bool = False
+) -> Tuple[bytes, str]:
+    """
+    Encode an image in the requested format with an encoding profile
+    (fast, balanced or smallest), returning (bytes, content type).
+    lossless selects lossless WebP; palette reduces PNG to 256 colors.
+    """
+    output_format = output_format.lower()
+    if output_format not in OUTPUT_FORMATS:
+        raise ImageProcessingError(f"Unsupported output format '{output_format}'")
+    if profile not in ENCODING_PROFILES:
+        raise ImageProcessingError(
+            f"Invalid encoding profile '{profile}'. Allowed: {', '.join(ENCODING_PROFILES)}"
+        )
+    check_encoding(output_format, lossless, palette)
+
+    pil_format, content_type = OUTPUT_FORMATS[output_format]
+
+    # Formats without alpha get the subject composited on white
+    if output_format in OPAQUE_FORMATS and image.mode == "RGBA":
+        flattened = Image.new("RGB", image.size, (255, 255, 255))
+        flattened.paste(image, mask=image.getchannel("A"))
+        image = flattened
+
+    if palette and image.mode in ("RGB", "RGBA"):
+        image = image.quantize(colors=256, method=Image.Quantize.FASTOCTREE)
+
+    # WebP has no grayscale mode: libwebp stores an L image (mask_only) as gray RGB
+    buffer = io.BytesIO()
+    image.save(buffer, format=pil_format, **encoder_options(pil_format, profile, lossless))
+    return buffer.getvalue(), content_type
+
+
+def decode_output(data: bytes) -> Image.Image:
+    """Decode a processed output, keeping its alpha channel if it has one"""
+    try:
+        image = Image.open(io.BytesIO(data))
+        image.load()
+    except Exception as e:
+        raise ImageProcessingError(f"Could not decode output: {str(e)}")
+
+    if image.mode in ("RGBA", "LA") or (image.mode == "P" and "transparency" in image.info):
+        return image.convert("RGBA")
+    return image.convert("RGB")
+
+
+def encode_sizes(
+    image: Image.Image,
+    output_format: str,
+    sizes: List[int],
+    profile: str = "balanced",
+    lossless: bool = False,
+    palette: bool = False
+) -> List[Tuple[bytes, str]]:
+    """
+    Encode an image at several sizes, each a longest side in pixels (0 keeps
+    the original size; images are never upscaled). Every size is resampled
+    directly from the full-resolution image, not from the previous size,
+    so small outputs don't accumulate resampling blur.
+    """
+    outputs = []
+    for max_side in sizes:
+        resized = image
+        if max_side and max(image.size) > max_side:
+            scale = max_side / max(image.size)
+            size = (max(1, round(image.width * scale)), max(1, round(image.height * scale)))
+            # reducing_gap shrinks by an integer factor first (cheap box
+            # reduction) before the Lanczos pass, much faster for thumbnails
+            resized = image.resize(size, Image.LANCZOS, reducing_gap=3.0)
+        outputs.append(encode_image(resized, output_format, profile, lossless, palette))
+    return outputs
+
+
+def compose(image: Image.Image, matte: Image.Image, options: dict) -> Image.Image:
+    """
+    Composite a variant from request options. mask_only returns the
+    single-channel 8-bit matte (as background_type map does).
+    """
+    return apply_matte(
+        image,
+        matte,
+        reverse=options.get("reverse", False),
+        threshold=options.get("threshold", 0),
+        background_type="map" if options.get("mask_only") else options.get("background_type", "rgba"),
+        auto_crop=options.get("auto_crop", False),
+        crop_padding=options.get("crop_padding", 0)
+    )
+
+
+def render_sizes(image: Image.Image, matte: Image.Image, options: dict, sizes: List[int]) -> List[Tuple[bytes, str]]:
+    """
+    Composite a variant once at full resolution and encode it at each size;
+    returns one (bytes, content type) per size
+    """
+    result = compose(image, matte, options)
+    return encode_sizes(
+        result, options.get("format", "png"), sizes, options.get("encoding", "balanced"),
+        options.get("lossless", False), options.get("palette", False)
+    )
+
+
+def render_variant(image: Image.Image, matte: Image.Image, options: dict) -> Tuple[bytes, str]:
+    """
+    Render one output variant (format, reverse, threshold, background_type,
+    auto_crop, mask_only, encoding, lossless, palette) from a source image
+    and its matte; returns (bytes, content type)
+    """
+    result = compose(image, matte, options)
+    return encode_image(
+        result, options.get("format", "png"), options.get("encoding", "balanced"),
+        options.get("lossless", False), options.get("palette", False)
+    )
@@ -0,0 +1,130 @@
+"""
+Job store for asynchronous background removal requests
+"""
+from typing import Optional
+from contextlib import contextmanager
+from datetime import datetime
+import sqlite3
+import time
+import uuid
+import logging
+
+from config import settings
+
+logger = logging.getLogger(__name__)
+
+# Job states
+JOB_QUEUED = "queued"
+JOB_PROCESSING = "processing"
+JOB_SUCCEEDED = "succeeded"
+JOB_FAILED = "failed"
+
+
+class JobStore:
+    """
+    SQLite-backed job store.
+    A file on local disk is shared by all uvicorn workers on the host, so a
+    job created by one worker can be polled through any other.
+
+    Jobs run as in-process background tasks, so a job whose worker dies
+    (crash, restart, OOM kill) would stay queued or processing forever.
+    Such jobs are failed once they haven't been updated for timeout seconds;
+    they can't be requeued, since the request itself isn't persisted.
+    """
+
+    def __init__(self, db_path: str = "jobs.db", ttl: int = 86400, timeout: int = 900):
+        self.db_path = db_path
+        self.ttl = ttl
+        self.timeout = timeout
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS jobs (
+                    id TEXT PRIMARY KEY,
+                    request_id TEXT,
+                    status TEXT NOT NULL,
+                    output_url TEXT,
+                    error TEXT,
+                    cached INTEGER NOT NULL DEFAULT 0,
+                    processing_time REAL,
+                    created_at REAL NOT NULL,
+                    updated_at REAL NOT NULL
+                )
+                """
+            )
+
+    @contextmanager
+    def _connect(self):
+        """Open a connection, commit on success and always close it"""
+        conn = sqlite3.connect(self.db_path, timeout=10)
+        conn.row_factory = sqlite3.Row
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def create(self, request_id: str) -> str:
+        """Create a queued job and return its ID"""
+        job_id = uuid.uuid4().hex
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT INTO jobs (id, request_id, status, created_at, updated_at) VALUES (?, ?, ?, ?, ?)",
+                (job_id, request_id, JOB_QUEUED, now, now)
+            )
+            # Opportunistically drop expired jobs and fail abandoned ones
+            conn.execute("DELETE FROM jobs WHERE updated_at < ?", (now - self.ttl,))
+            self._fail_stale(conn, now)
+        logger.debug(f"Job created: {job_id}")
+        return job_id
+
+    def _fail_stale(self, conn: sqlite3.Connection, now: float, job_id: Optional[str] = None):
+        """Fail queued or processing jobs (optionally just one) not updated within the timeout"""
+        query = "UPDATE jobs SET status = ?, error = ?, updated_at = ? WHERE status IN (?, ?) AND updated_at < ?"
+        params = [JOB_FAILED, "Job was interrupted before it finished; please resubmit", now,
+                  JOB_QUEUED, JOB_PROCESSING, now - self.timeout]
+        if job_id is not None:
+            query += " AND id = ?"
+            params.append(job_id)
+        failed = conn.execute(query, params).rowcount
+        if failed:
+            logger.warning(f"Failed {failed} job(s) not updated for {self.timeout}s")
+
+    def update(self, job_id: str, status: str, **fields):
+        """Update job status and result fields"""
+        fields["status"] = status
+        fields["updated_at"] = time.time()
+        columns = ", ".join(f"{name} = ?" for name in fields)
+        with self._connect() as conn:
+            conn.execute(f"UPDATE jobs SET {columns} WHERE id = ?", (*fields.values(), job_id))
+        logger.debug(f"Job {job_id} -> {status}")
+
+    def get(self, job_id: str) -> Optional[dict]:
+        """Get a job by ID, or None if unknown or expired"""
+        with self._connect() as conn:
+            row = conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+            if row is not None and row["status"] in (JOB_QUEUED, JOB_PROCESSING) \
+                    and time.time() - row["updated_at"] > self.timeout:
+                self._fail_stale(conn, time.time(), job_id)
+                row = conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+
+        if row is None or time.time() - row["updated_at"] > self.ttl:
+            return None
+
+        job = dict(row)
+        job["cached"] = bool(job["cached"])
+        job["created_at"] = datetime.utcfromtimestamp(job["created_at"]).isoformat()
+        job["updated_at"] = datetime.utcfromtimestamp(job["updated_at"]).isoformat()
+        return job
+
+    def stats(self) -> dict:
+        """Get job counts by status"""
+        with self._connect() as conn:
+            rows = conn.execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall()
+        return {status: count for status, count in rows}
+
+
+# Global job store instance
+job_store = JobStore(db_path=settings.jobs_db_path, ttl=settings.job_ttl, timeout=settings.job_timeout)
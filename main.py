@@ -2,15 +2,17 @@
 Background Removal API - Production Ready for RapidAPI
 Version: 1.0.0
 """
-from fastapi import FastAPI, HTTPException, status, Request, BackgroundTasks
+from fastapi import FastAPI, HTTPException, status, Request, BackgroundTasks, Query
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
-from pydantic import BaseModel, HttpUrl, Field
-from typing import Optional, List
-import replicate
+from fastapi.responses import JSONResponse, FileResponse, StreamingResponse, Response
+from pydantic import BaseModel, HttpUrl, Field, ValidationError, field_validator
+from fastapi.exceptions import RequestValidationError
+from typing import Optional, List, Tuple, Dict
 import logging
 from datetime import datetime
 import httpx
+import asyncio
+import json
 from slowapi import Limiter, _rate_limit_exceeded_handler
 from slowapi.util import get_remote_address
 from slowapi.errors import RateLimitExceeded
@@ -26,8 +28,25 @@ if os.getenv('PYTHONHTTPSVERIFY', '1') == '0':
 # Import custom modules
 from config import settings
 from middleware import RequestLoggingMiddleware, APIKeyValidationMiddleware
-from cache import cache
+from cache import cache, inflight, matte_cache, digest_index, validation_cache
 from validators import ImageValidator
+from probe import probe_header
+from upstream import upstream
+from backends import inference, InferenceError, MatteResult
+from storage import result_store, CONTENT_TYPES
+from imaging import (
+    ImageProcessingError, render_variant, upsample_matte, mime_type, decode_image, rescale_matte,
+    render_sizes, encode_sizes, decode_output, encode_image, OUTPUT_FORMATS, ENCODING_PROFILES,
+    check_encoding
+)
+from jobs import job_store, JOB_QUEUED, JOB_PROCESSING, JOB_SUCCEEDED, JOB_FAILED
+from bulk import bulk_store, bulk_worker
+from uploads import receive_upload
+from responses import RangeFileResponse, multipart_response
+from fetch import download_image, result_size_limit, ImageSource, resolve_source, content_key
+from similarity import near_duplicates
+from tiling import segment_tiled
+from animation import AnimatedMatte, ANIMATED_FORMATS, is_gif, open_animation, iter_frames, plan_frames, render_animation
 
 # Configure logging
 logging.basicConfig(
@@ -79,12 +98,29 @@ allowed_keys = []
 if settings.allowed_api_keys:
     allowed_keys = [key.strip() for key in settings.allowed_api_keys.split(",")]
 
-app.add_middleware(APIKeyValidationMiddleware, allowed_keys=allowed_keys)
+app.add_middleware(
+    APIKeyValidationMiddleware,
+    allowed_keys=allowed_keys,
+    # Result URLs are unguessable and handed out like upstream URLs
+    extra_public_paths=[f"{settings.api_prefix}/results/"]
+)
 
 # Initialize validator
 image_validator = ImageValidator(
     max_size_mb=settings.max_image_size_mb,
-    allowed_formats=settings.allowed_image_formats
+    allowed_formats=settings.allowed_image_formats,
+    # AVIF can be produced locally (when Pillow supports it) but isn't accepted as input
+    output_formats=settings.allowed_image_formats + (["avif"] if "avif" in OUTPUT_FORMATS else []),
+    max_megapixels=settings.max_image_megapixels,
+    probe_bytes=settings.probe_bytes,
+    timeout=settings.validation_timeout,
+    max_connections=settings.validation_max_connections,
+    per_host_connections=settings.validation_per_host_connections,
+    keepalive_expiry=settings.validation_keepalive,
+    http2=settings.validation_http2,
+    cache=validation_cache if settings.validation_cache_enabled else None,
+    cache_ttl=settings.validation_cache_ttl,
+    negative_ttl=settings.validation_negative_ttl
 )
 
 # Validate API token on startup
@@ -95,16 +131,11 @@ if not settings.replicate_api_token:
 
 # ==================== Models ====================
 
-class BackgroundRemovalRequest(BaseModel):
-    """Request model for background removal"""
-    image_url: HttpUrl = Field(
-        ..., 
-        description="URL of the image to process",
-        examples=["https://example.com/image.jpg"]
-    )
+class ProcessingOptions(BaseModel):
+    """Output options shared by URL and upload requests"""
     format: Optional[str] = Field(
         default="png",
-        description="Output format: png or jpg",
+        description="Output format: png, jpg, webp, gif (avif where supported)",
         examples=["png"]
     )
     reverse: Optional[bool] = Field(
@@ -124,16 +155,87 @@ class BackgroundRemovalRequest(BaseModel):
         description="Background type: rgba, white, black, or custom color",
         examples=["rgba"]
     )
+    response_type: Optional[str] = Field(
+        default="json",
+        description="json for a JSON body with output_url, binary for the image bytes themselves",
+        examples=["json"]
+    )
+    auto_crop: Optional[bool] = Field(
+        default=False,
+        description="Trim the output to the subject's bounding box",
+        examples=[False]
+    )
+    crop_padding: Optional[int] = Field(
+        default=0,
+        ge=0,
+        le=1000,
+        description="Pixels of margin kept around the subject with auto_crop",
+        examples=[0]
+    )
+    mask_only: Optional[bool] = Field(
+        default=False,
+        description="Return the single-channel 8-bit matte instead of the cut-out (gray RGB for webp, which has no grayscale mode)",
+        examples=[False]
+    )
+    encoding: Optional[str] = Field(
+        default=None,
+        description="Encoding profile: fast, balanced or smallest (default: ENCODING_PROFILE)",
+        examples=["balanced"]
+    )
+    lossless: Optional[bool] = Field(
+        default=False,
+        description="Lossless WebP output (PNG and GIF are always lossless)",
+        examples=[False]
+    )
+    palette: Optional[bool] = Field(
+        default=False,
+        description="Reduce PNG output to a 256-color palette with alpha (much smaller, lossy)",
+        examples=[False]
+    )
+    sizes: Optional[List[int]] = Field(
+        default=None,
+        description="Longest sides in pixels to render from one segmentation (0 = original size)",
+        examples=[[150, 600, 1600, 0]]
+    )
+    
+    @field_validator("sizes", mode="before")
+    @classmethod
+    def split_sizes(cls, value):
+        # Query strings and form fields carry sizes as "150,600,0"
+        if isinstance(value, str):
+            return [part.strip() for part in value.split(",") if part.strip()]
+        return value
+
+
+class BackgroundRemovalRequest(ProcessingOptions):
+    """Request model for background removal"""
+    image_url: HttpUrl = Field(
+        ..., 
+        description="URL of the image to process",
+        examples=["https://example.com/image.jpg"]
+    )
     webhook_url: Optional[HttpUrl] = Field(
         None,
         description="Optional webhook URL to receive results asynchronously"
     )
+    async_mode: Optional[bool] = Field(
+        default=False,
+        description="Return 202 with a job ID immediately and process in the background",
+        examples=[False]
+    )
+
+
+class SizedOutput(BaseModel):
+    """One size of a multi-size output"""
+    size: int = Field(..., description="Requested longest side in pixels (0 = original size)")
+    output_url: str = Field(..., description="URL of the processed image at this size")
 
 
 class BackgroundRemovalResponse(BaseModel):
     """Response model for background removal"""
     success: bool = Field(..., description="Whether the operation was successful")
     output_url: Optional[str] = Field(None, description="URL of the processed image")
+    outputs: Optional[List[SizedOutput]] = Field(None, description="One output per requested size")
     message: Optional[str] = Field(None, description="Success or error message")
     processing_time: Optional[float] = Field(None, description="Processing time in seconds")
     cached: Optional[bool] = Field(None, description="Whether result was from cache")
@@ -159,6 +261,71 @@ class HealthResponse(BaseModel):
     api_configured: bool
 
 
+class JobResponse(BaseModel):
+    """Response model for an accepted asynchronous job"""
+    success: bool = Field(..., description="Whether the job was accepted")
+    job_id: str = Field(..., description="Job identifier")
+    status: str = Field(..., description="Job status: queued, processing, succeeded or failed")
+    status_url: str = Field(..., description="URL to poll for the job result")
+    message: Optional[str] = Field(None, description="Success or error message")
+    request_id: Optional[str] = Field(None, description="Unique request identifier")
+
+
+class JobStatusResponse(BaseModel):
+    """Response model for job status polling"""
+    job_id: str
+    status: str
+    output_url: Optional[str] = None
+    error: Optional[str] = None
+    cached: bool = False
+    processing_time: Optional[float] = None
+    created_at: str
+    updated_at: str
+    request_id: Optional[str] = None
+
+
+class BulkJobResponse(BaseModel):
+    """Response model for an accepted bulk job"""
+    success: bool
+    job_id: str
+    total: int = Field(..., description="Number of items in the manifest")
+    status_url: str
+    results_url: str
+    request_id: Optional[str] = None
+
+
+class BulkJobStatusResponse(BaseModel):
+    """Progress of a bulk job"""
+    job_id: str
+    status: str = Field(..., description="processing or completed")
+    total: int
+    pending: int
+    running: int
+    succeeded: int
+    failed: int
+    progress: float = Field(..., description="Percentage of items finished")
+    created_at: str
+    updated_at: str
+
+
+class BulkItemResult(BaseModel):
+    """Result of one bulk job item"""
+    index: int
+    image_url: Optional[str] = None
+    status: str
+    output_url: Optional[str] = None
+    error: Optional[str] = None
+    cached: bool = False
+    attempts: int = 0
+
+
+class BulkJobResultsResponse(BaseModel):
+    """A page of bulk job results"""
+    job_id: str
+    items: List[BulkItemResult]
+    next_after: Optional[int] = Field(None, description="Pass as `after` to get the next page")
+
+
 class UsageStats(BaseModel):
     """Usage statistics"""
     total_requests: int
@@ -188,21 +355,676 @@ async def send_webhook(webhook_url: str, payload: WebhookPayload):
 
 def generate_cache_key(request: BackgroundRemovalRequest) -> str:
     """Generate cache key from request parameters"""
+    return options_cache_key(str(request.image_url), request)
+
+
+def options_cache_key(source: str, options: ProcessingOptions, size: Optional[int] = None) -> str:
+    """
+    Generate cache key for a source image (URL or upload ID) and output
+    options, optionally at one output size
+    """
     import hashlib
     import json
     
     cache_data = {
-        "image_url": str(request.image_url),
-        "format": request.format,
-        "reverse": request.reverse,
-        "threshold": request.threshold,
-        "background_type": request.background_type
+        "image_url": source,
+        "format": options.format,
+        "reverse": options.reverse,
+        "threshold": options.threshold,
+        "background_type": options.background_type,
+        "auto_crop": options.auto_crop,
+        "crop_padding": options.crop_padding if options.auto_crop else 0,
+        "mask_only": options.mask_only,
+        "encoding": options.encoding or settings.encoding_profile,
+        "lossless": bool(options.lossless),
+        "palette": bool(options.palette)
     }
+    if size is not None:
+        cache_data["size"] = size
     
     key_string = json.dumps(cache_data, sort_keys=True)
     return hashlib.md5(key_string.encode()).hexdigest()
 
 
+def defer_validation() -> bool:
+    """
+    Whether image URLs are validated only once the result cache has missed
+    (SKIP_VALIDATION_ON_CACHE_HIT), rather than before the lookup
+    """
+    return settings.validate_image_urls and settings.skip_validation_on_cache_hit and settings.cache_enabled
+
+
+def result_ttl(output_url: str) -> int:
+    """
+    How long to cache an output URL: results in the local store stay
+    valid until evicted, upstream URLs expire with the prediction
+    """
+    return settings.result_cache_ttl if result_store.is_local(output_url) else settings.cache_ttl
+
+
+def get_cached_result(cache_key: str) -> Optional[str]:
+    """Get a cached output URL, dropping entries whose stored result has been evicted"""
+    output_url = cache.get(cache_key)
+    if output_url and result_store.is_local(output_url) and result_store.id_from_url(output_url) is None:
+        cache.delete(cache_key)
+        return None
+    return output_url
+
+
+async def process_image(
+    request_data: BackgroundRemovalRequest,
+    output_format: str,
+    cache_key: Optional[str] = None,
+    size_bytes: Optional[int] = None,
+    tier: Optional[str] = None,
+    source: Optional[ImageSource] = None
+) -> str:
+    """
+    Run background removal on the inference backend, cache the result and
+    return its URL. Concurrent identical requests share a single prediction.
+    tier is the caller's subscription, used to schedule upstream slots.
+    source is the resolved input image (defaults to the request URL).
+    """
+    if source is None:
+        source = ImageSource(str(request_data.image_url), str(request_data.image_url))
+    flight_key = cache_key or options_cache_key(source.key, request_data)
+    return await inflight.do(
+        flight_key,
+        lambda: _run_inference(request_data, output_format, cache_key, size_bytes, tier, source)
+    )
+
+
+async def get_matte(
+    source: ImageSource,
+    size_bytes: Optional[int] = None,
+    tier: Optional[str] = None
+) -> MatteResult:
+    """
+    Get the decoded image and alpha matte for a source, segmenting it at
+    most once while it stays in the matte cache
+    """
+    matte = matte_cache.get(source.key)
+    if matte is not None:
+        return matte
+    
+    async def segment() -> MatteResult:
+        data = source.data
+        image, fingerprint = None, None
+        if settings.near_duplicate_enabled or settings.tiled_inference:
+            if data is None:
+                data = await download_image(source.url)
+            image = await asyncio.to_thread(decode_image, data)
+        
+        if settings.near_duplicate_enabled:
+            fingerprint = await asyncio.to_thread(near_duplicates.fingerprint, image)
+            reused = await reuse_near_duplicate(source.key, image, fingerprint)
+            if reused is not None:
+                matte_cache.set(source.key, reused, ttl=settings.cache_ttl)
+                return reused
+        
+        if image is not None and settings.tiled_inference and \
+                image.width * image.height >= settings.tiled_min_megapixels * 1_000_000:
+            result = await segment_tiled(image, source.key, size_bytes=size_bytes, tier=tier)
+        else:
+            result = await inference.segment(
+                source.url or source.key, size_bytes=size_bytes, tier=tier,
+                max_side=settings.inference_max_side, image_bytes=data,
+                # Uploads have no URL the model could fetch
+                inline=source.url is None
+            )
+        
+        # Mattes predicted at a working resolution are upsampled to the
+        # original once, with edge-aware refinement, outside the upstream slot
+        if settings.matte_refine and result.matte.size != result.image.size:
+            result.matte = await asyncio.to_thread(
+                upsample_matte, result.image, result.matte,
+                settings.matte_refine_radius, settings.matte_refine_eps
+            )
+        
+        matte_cache.set(source.key, result, ttl=settings.cache_ttl)
+        if fingerprint is not None:
+            near_duplicates.add(source.key, fingerprint)
+        return result
+    
+    return await inflight.do(f"matte:{source.key}", segment)
+
+
+async def reuse_near_duplicate(key: str, image, fingerprint) -> Optional[MatteResult]:
+    """
+    Build a matte for an image from a cached near-duplicate (same picture
+    re-encoded, resized or lightly recompressed), rescaled to the image.
+    Returns None if no confirmed near-duplicate still has its matte cached.
+    """
+    for candidate_key in near_duplicates.find(fingerprint, exclude=key):
+        candidate = matte_cache.get(candidate_key)
+        if candidate is None:
+            near_duplicates.forget(candidate_key)
+            continue
+        
+        matte = candidate.matte
+        if matte.size != image.size:
+            if settings.matte_refine and matte.width < image.width:
+                matte = await asyncio.to_thread(
+                    upsample_matte, image, matte,
+                    settings.matte_refine_radius, settings.matte_refine_eps
+                )
+            else:
+                matte = await asyncio.to_thread(rescale_matte, image, matte)
+        
+        near_duplicates.record_hit()
+        logger.info(f"Reusing matte of near-duplicate {candidate_key} for {key}")
+        return MatteResult(candidate.backend, image, matte)
+    
+    return None
+
+
+def maybe_animated(source: ImageSource, options: dict) -> bool:
+    """
+    Whether a request may need frame-aware processing: a GIF source and an
+    output format that can hold an animation. GIFs are recognized by
+    content when the bytes are at hand, else by the format the URL's
+    validation probe sniffed, and only failing both by URL extension.
+    """
+    if not settings.animation_enabled or options["format"] not in ANIMATED_FORMATS:
+        return False
+    if source.data is not None:
+        return is_gif(source.data)
+    if not source.url:
+        return False
+    probed = image_validator.probed(source.url)
+    if probed is not None:
+        return probed["format"] == "gif"
+    return source.url.split("?", 1)[0].lower().endswith(".gif")
+
+
+async def get_animation(
+    source: ImageSource,
+    size_bytes: Optional[int] = None,
+    tier: Optional[str] = None
+) -> Optional[AnimatedMatte]:
+    """
+    Get the per-frame mattes of an animated GIF, or None for a still
+    image. Repeated and near-static frames reuse an earlier frame's matte,
+    so only unique frames are segmented, several at a time. Frames are
+    decoded one at a time as segmentation slots free up and dropped once
+    planned (or segmented), so at most ANIMATION_CONCURRENCY decoded
+    frames are held.
+    """
+    key = f"animation:{source.key}"
+    animation = matte_cache.get(key)
+    if animation is not None:
+        return animation or None
+    
+    async def segment_frames():
+        if source.data is None:
+            source.data = await download_image(source.url)
+        
+        image = await asyncio.to_thread(open_animation, source.data)
+        if image is None:
+            # A still GIF: remember that, and take the regular matte path
+            matte_cache.set(key, False, ttl=settings.cache_ttl)
+            return False
+        
+        planned = plan_frames(
+            iter_frames(image, settings.animation_max_frames), settings.animation_static_threshold
+        )
+        slots = asyncio.Semaphore(settings.animation_concurrency)
+        errors = []
+        
+        async def segment_frame(index: int, frame):
+            try:
+                data, _ = await asyncio.to_thread(encode_image, frame, "png", "fast")
+                result = await inference.segment(
+                    f"{source.key}#frame{index}", size_bytes=len(data), tier=tier,
+                    max_side=settings.inference_max_side, image_bytes=data, inline=True
+                )
+                matte = result.matte
+                if settings.matte_refine and matte.size != frame.size:
+                    matte = await asyncio.to_thread(
+                        upsample_matte, frame, matte,
+                        settings.matte_refine_radius, settings.matte_refine_eps
+                    )
+                return matte
+            except Exception as e:
+                errors.append(e)
+                raise
+            finally:
+                slots.release()
+        
+        plan, durations, tasks = [], [], {}
+        try:
+            while True:
+                # Decode the next frame only once a segmentation slot is free
+                await slots.acquire()
+                if errors:
+                    raise errors[0]
+                step = await asyncio.to_thread(next, planned, None)
+                if step is None:
+                    slots.release()
+                    break
+                target, frame, duration = step
+                index = len(plan)
+                plan.append(target)
+                durations.append(duration)
+                if target == index:
+                    tasks[index] = asyncio.ensure_future(segment_frame(index, frame))
+                else:
+                    slots.release()
+            mattes = dict(zip(tasks, await asyncio.gather(*tasks.values())))
+        finally:
+            # On failure, don't keep segmenting frames nobody will use
+            for task in tasks.values():
+                task.cancel()
+            await asyncio.gather(*tasks.values(), return_exceptions=True)
+        
+        animation = AnimatedMatte(source.data, plan, mattes, durations, image.info.get("loop", 0))
+        logger.info(f"Animation {source.key}: {len(plan)} frames, {animation.unique} segmented")
+        
+        matte_cache.set(key, animation, ttl=settings.cache_ttl)
+        return animation
+    
+    return await inflight.do(key, segment_frames) or None
+
+
+async def render_from_matte(
+    source: ImageSource,
+    options: dict,
+    size_bytes: Optional[int] = None,
+    tier: Optional[str] = None
+) -> str:
+    """Render one output variant from the source's matte, store it and return its URL"""
+    animation = await get_animation(source, size_bytes, tier) if maybe_animated(source, options) else None
+    if animation is not None:
+        [(data, _)] = await asyncio.to_thread(render_animation, animation, options, [0])
+    else:
+        matte = await get_matte(source, size_bytes, tier)
+        data, _ = await asyncio.to_thread(render_variant, matte.image, matte.matte, options)
+    return result_store.url(await asyncio.to_thread(result_store.save, data, options["format"]))
+
+
+def output_options(options: ProcessingOptions, output_format: str) -> dict:
+    """Rendering options for a validated request"""
+    return {
+        "format": output_format,
+        "reverse": options.reverse,
+        "threshold": options.threshold,
+        "background_type": options.background_type,
+        "auto_crop": bool(options.auto_crop),
+        "crop_padding": options.crop_padding or 0,
+        "mask_only": bool(options.mask_only),
+        "encoding": options.encoding or settings.encoding_profile,
+        "lossless": bool(options.lossless),
+        "palette": bool(options.palette)
+    }
+
+
+def needs_local_render(source: ImageSource, options: dict) -> bool:
+    """Whether a request goes beyond what the model itself can produce"""
+    return (
+        options["format"] == "avif" or options["auto_crop"] or options["mask_only"]
+        or options["lossless"] or options["palette"]
+        or maybe_animated(source, options)
+        # Very large images are tiled locally; small ones keep the model's rendering
+        or (settings.tiled_inference and may_need_tiling(source))
+    )
+
+
+def may_need_tiling(source: ImageSource) -> bool:
+    """
+    Whether a source may reach TILED_MIN_MEGAPIXELS, from the dimensions in
+    its header bytes or its URL's validation probe; unknown sizes may
+    """
+    dimensions = None
+    if source.data is not None:
+        dimensions = probe_header(source.data)[1]
+    elif source.url:
+        probed = image_validator.probed(source.url)
+        if probed is not None:
+            dimensions = (probed["width"], probed["height"])
+    if dimensions is None:
+        return True
+    return dimensions[0] * dimensions[1] >= settings.tiled_min_megapixels * 1_000_000
+
+
+def validate_encoding(encoding: Optional[str]) -> str:
+    """Validate an encoding profile, defaulting to ENCODING_PROFILE"""
+    profile = (encoding or settings.encoding_profile).lower()
+    if profile not in ENCODING_PROFILES:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Invalid encoding '{encoding}'. Allowed: {', '.join(ENCODING_PROFILES)}"
+        )
+    return profile
+
+
+def validate_output_encoding(options: ProcessingOptions, output_format: str):
+    """Validate the lossless and palette options against the output format"""
+    try:
+        check_encoding(output_format, bool(options.lossless), bool(options.palette))
+    except ImageProcessingError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+
+
+def validate_sizes(sizes: Optional[List[int]]) -> List[int]:
+    """Validate requested output sizes; returns them deduplicated, largest first (original size first)"""
+    if not sizes:
+        return []
+    
+    if len(sizes) > settings.max_output_sizes:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Maximum {settings.max_output_sizes} sizes per request"
+        )
+    for size in sizes:
+        if size < 0 or size > settings.max_output_side:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=f"Invalid size {size}. Sizes are longest sides from 1 to {settings.max_output_side}, or 0 for the original size"
+            )
+    
+    return sorted(set(sizes), key=lambda size: -size if size else float("-inf"))
+
+
+async def process_sizes(
+    source: ImageSource,
+    options: ProcessingOptions,
+    output_format: str,
+    sizes: List[int],
+    size_bytes: Optional[int] = None,
+    tier: Optional[str] = None
+) -> Tuple[List[dict], bool]:
+    """
+    Produce an output at each requested size from a single segmentation.
+    Each size is cached on its own, so only missing sizes are rendered; the
+    variant is composited once at full resolution and every size is
+    resampled from it. Returns ([{size, output_url}], all sizes cached).
+    """
+    keys = {size: options_cache_key(source.key, options, size) for size in sizes}
+    urls = {}
+    if settings.cache_enabled:
+        for size, key in keys.items():
+            cached_url = get_cached_result(key)
+            if cached_url:
+                urls[size] = cached_url
+    
+    missing = [size for size in sizes if size not in urls]
+    if missing:
+        render_options = output_options(options, output_format)
+        
+        async def render() -> Dict[int, str]:
+            if settings.matte_cache_enabled or source.url is None or needs_local_render(source, render_options):
+                animation = None
+                if maybe_animated(source, render_options):
+                    animation = await get_animation(source, size_bytes, tier)
+                if animation is not None:
+                    rendered = await asyncio.to_thread(render_animation, animation, render_options, missing)
+                else:
+                    matte = await get_matte(source, size_bytes, tier)
+                    rendered = await asyncio.to_thread(render_sizes, matte.image, matte.matte, render_options, missing)
+            else:
+                # One full-size (lossless) prediction; every size is resampled
+                # from its output and encoded here
+                result = await inference.remove_background(
+                    source.url, {**render_options, "format": "png"}, size_bytes=size_bytes, tier=tier
+                )
+                data = result.data or await download_image(result.url, max_bytes=result_size_limit())
+                rendered = await asyncio.to_thread(
+                    lambda: encode_sizes(
+                        decode_output(data), output_format, missing, render_options["encoding"],
+                        render_options["lossless"], render_options["palette"]
+                    )
+                )
+            
+            rendered_urls = {}
+            for size, (data, _) in zip(missing, rendered):
+                rendered_urls[size] = result_store.url(await asyncio.to_thread(result_store.save, data, output_format))
+                if settings.cache_enabled:
+                    cache.set(keys[size], rendered_urls[size], ttl=result_ttl(rendered_urls[size]))
+            return rendered_urls
+        
+        flight_key = f"{options_cache_key(source.key, options)}:sizes:{','.join(map(str, missing))}"
+        urls.update(await inflight.do(flight_key, render))
+    
+    return [{"size": size, "output_url": urls[size]} for size in sizes], not missing
+
+
+async def sizes_response(outputs: List[dict], cached: bool, processing_time: float) -> Response:
+    """Return every size of an output in one multipart/mixed body, largest first"""
+    parts = []
+    for output in outputs:
+        result_id = result_store.id_from_url(output["output_url"])
+        if result_id is not None:
+            data = await asyncio.to_thread(_read_file, result_store.path(result_id))
+        else:
+            data = await download_image(output["output_url"], max_bytes=result_size_limit())
+        parts.append((data, {
+            "Content-Type": mime_type(data),
+            "Content-Location": output["output_url"],
+            "X-Size": str(output["size"])
+        }))
+    
+    return multipart_response(parts, headers={
+        "X-Cached": "true" if cached else "false",
+        "X-Processing-Time": f"{processing_time:.3f}"
+    })
+
+
+def _read_file(path: str) -> bytes:
+    with open(path, "rb") as f:
+        return f.read()
+
+
+def validate_response_type(response_type: Optional[str]) -> bool:
+    """Validate response_type; returns True if the image bytes should be returned"""
+    value = (response_type or "json").lower()
+    if value not in ("json", "binary"):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Invalid response_type '{response_type}'. Allowed: json, binary"
+        )
+    return value == "binary"
+
+
+async def binary_response(
+    request: Request,
+    output_url: str,
+    cached: bool,
+    processing_time: float
+) -> Response:
+    """
+    Return the processed image itself. Results in the local store are sent
+    from disk (with Range support); remote results are fetched and relayed.
+    """
+    headers = {
+        "X-Output-URL": output_url,
+        "X-Cached": "true" if cached else "false",
+        "X-Processing-Time": f"{processing_time:.3f}"
+    }
+    
+    result_id = result_store.id_from_url(output_url)
+    if result_id is not None:
+        extension = result_id.rsplit(".", 1)[-1]
+        return RangeFileResponse(
+            result_store.path(result_id), request,
+            media_type=CONTENT_TYPES[extension], headers=headers
+        )
+    
+    data = await download_image(output_url, max_bytes=result_size_limit())
+    return Response(content=data, media_type=mime_type(data), headers=headers)
+
+
+async def _run_inference(
+    request_data: BackgroundRemovalRequest,
+    output_format: str,
+    cache_key: Optional[str],
+    size_bytes: Optional[int],
+    tier: Optional[str],
+    source: ImageSource
+) -> str:
+    """Call the inference backend once and cache the output URL"""
+    options = output_options(request_data, output_format)
+    
+    # Options the model doesn't support are always rendered from a matte
+    if settings.matte_cache_enabled or needs_local_render(source, options):
+        # One segmentation per image; every variant is rendered from its matte
+        output_url = await render_from_matte(source, options, size_bytes, tier)
+    else:
+        result = await inference.remove_background(
+            str(request_data.image_url), options, size_bytes=size_bytes, tier=tier
+        )
+        
+        # Local backends return bytes; remote outputs are downloaded once,
+        # since their URLs expire. Either way we store and serve them ourselves.
+        data = result.data
+        if data is None and settings.store_remote_results:
+            data = await download_image(result.url, max_bytes=result_size_limit())
+        
+        if data is not None:
+            output_url = result_store.url(await asyncio.to_thread(result_store.save, data, output_format))
+        else:
+            output_url = result.url
+    
+    # Cache result
+    if settings.cache_enabled and cache_key:
+        cache.set(cache_key, output_url, ttl=result_ttl(output_url))
+    
+    return output_url
+
+
+async def run_background_job(
+    job_id: str,
+    request_data: BackgroundRemovalRequest,
+    output_format: str,
+    cache_key: Optional[str],
+    request_id: str,
+    size_bytes: Optional[int] = None,
+    tier: Optional[str] = None,
+    source: Optional[ImageSource] = None
+):
+    """Process an async-mode request, record the outcome and fire the webhook"""
+    import time
+    start_time = time.time()
+    
+    await asyncio.to_thread(job_store.update, job_id, JOB_PROCESSING)
+    
+    try:
+        # Content-hash keying: identify the image now that we're off the request path
+        if source is None or (settings.content_hash_keys and source.key == source.url):
+            source = await resolve_source(str(request_data.image_url))
+            if cache_key:
+                cache_key = options_cache_key(source.key, request_data)
+        
+        output_url = get_cached_result(cache_key) if cache_key else None
+        if output_url is None:
+            output_url = await process_image(request_data, output_format, cache_key, size_bytes, tier, source)
+        processing_time = time.time() - start_time
+        logger.info(f"Job {job_id} completed in {processing_time:.2f}s. Output: {output_url}")
+        
+        await asyncio.to_thread(
+            job_store.update, job_id, JOB_SUCCEEDED, output_url=output_url, processing_time=processing_time
+        )
+        webhook_payload = WebhookPayload(
+            request_id=request_id,
+            success=True,
+            output_url=output_url,
+            timestamp=datetime.utcnow().isoformat(),
+            processing_time=processing_time
+        )
+    except Exception as e:
+        processing_time = time.time() - start_time
+        logger.error(f"Job {job_id} failed: {str(e)}")
+        
+        await asyncio.to_thread(
+            job_store.update, job_id, JOB_FAILED, error=str(e), processing_time=processing_time
+        )
+        webhook_payload = WebhookPayload(
+            request_id=request_id,
+            success=False,
+            error=str(e),
+            timestamp=datetime.utcnow().isoformat(),
+            processing_time=processing_time
+        )
+    
+    if request_data.webhook_url and settings.webhook_enabled:
+        await send_webhook(request_data.webhook_url, webhook_payload)
+
+
+async def process_bulk_item(options: dict, tier: Optional[str]) -> Tuple[str, bool]:
+    """Process one bulk manifest item; returns (output_url, cached)"""
+    request_data = BackgroundRemovalRequest(**options)
+    
+    if settings.validate_image_urls and not defer_validation():
+        await image_validator.validate_image_url(str(request_data.image_url))
+    
+    output_format = image_validator.validate_format(request_data.format)
+    request_data.encoding = validate_encoding(request_data.encoding)
+    validate_output_encoding(request_data, output_format)
+    source = await resolve_source(str(request_data.image_url))
+    
+    cache_key = None
+    if settings.cache_enabled:
+        cache_key = options_cache_key(source.key, request_data)
+        cached_result = get_cached_result(cache_key)
+        if cached_result:
+            return cached_result, True
+    
+    if defer_validation():
+        await image_validator.validate_image_url(str(request_data.image_url))
+    
+    output_url = await process_image(request_data, output_format, cache_key, tier=tier, source=source)
+    return output_url, False
+
+
+def parse_manifest(body: bytes) -> List[dict]:
+    """
+    Parse a JSON Lines manifest into per-item request options.
+    Each line is a JSON object with the single-image request fields, or a
+    bare JSON string with just the image URL.
+    """
+    items = []
+    
+    for line_number, line in enumerate(body.decode("utf-8", errors="replace").splitlines(), start=1):
+        line = line.strip()
+        if not line:
+            continue
+        
+        try:
+            entry = json.loads(line)
+            if isinstance(entry, str):
+                entry = {"image_url": entry}
+            if not isinstance(entry, dict):
+                raise ValueError("expected a JSON object or URL string")
+            
+            item = BackgroundRemovalRequest(**entry)
+            validate_encoding(item.encoding)
+            validate_output_encoding(item, image_validator.validate_format(item.format))
+        except HTTPException as e:
+            raise HTTPException(status_code=e.status_code, detail=f"Line {line_number}: {e.detail}")
+        except (ValueError, ValidationError) as e:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=f"Line {line_number}: {str(e)}"
+            )
+        
+        options = item.dict(exclude={"webhook_url", "async_mode", "response_type", "sizes"})
+        options["image_url"] = str(item.image_url)
+        items.append(options)
+        
+        if len(items) > settings.bulk_max_items:
+            raise HTTPException(
+                status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+                detail=f"Maximum {settings.bulk_max_items} items per bulk job"
+            )
+    
+    if not items:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Manifest is empty"
+        )
+    
+    return items
+
+
 # ==================== Endpoints ====================
 
 @app.get("/", tags=["Health"])
@@ -217,7 +1039,10 @@ async def root():
         "endpoints": {
             "health": "/health",
             "remove_background": f"{settings.api_prefix}/remove-background",
+            "upload": f"{settings.api_prefix}/remove-background/upload",
             "batch_processing": f"{settings.api_prefix}/remove-background/batch",
+            "job_status": f"{settings.api_prefix}/jobs/{{job_id}}",
+            "bulk_jobs": f"{settings.api_prefix}/bulk-jobs",
             "cache_stats": "/cache/stats",
             "terms": "/terms",
             "privacy": "/privacy"
@@ -249,23 +1074,74 @@ async def get_cache_stats():
     """Get cache statistics"""
     return {
         "cache": cache.stats(),
+        "inflight": inflight.stats(),
+        "mattes": matte_cache.stats(),
+        "digest_index": digest_index.stats(),
+        "near_duplicates": near_duplicates.stats(),
+        "validation": image_validator.stats(),
+        "results": result_store.stats(),
         "enabled": settings.cache_enabled
     }
 
 
+@app.get("/upstream/stats", tags=["Admin"])
+async def get_upstream_stats():
+    """Get upstream concurrency statistics"""
+    return {
+        "upstream": upstream.stats(),
+        "inference": inference.stats(),
+        "bulk_worker": bulk_worker.stats()
+    }
+
+
+@app.api_route(
+    f"{settings.api_prefix}/results/{{result_id}}",
+    methods=["GET", "HEAD"],
+    response_class=FileResponse,
+    tags=["Background Removal"],
+    summary="Download a processed image",
+    description="Serve a result stored on this host. Supports Range requests."
+)
+async def get_result(result_id: str, request: Request):
+    """Download a processed image stored on this host"""
+    path = result_store.path(result_id)
+    
+    if path is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Result not found"
+        )
+    
+    extension = result_id.rsplit(".", 1)[-1]
+    return RangeFileResponse(
+        path, request,
+        media_type=CONTENT_TYPES[extension],
+        # Result IDs are never reused, so a result never changes
+        headers={"Cache-Control": "public, max-age=31536000, immutable"}
+    )
+
+
 @app.delete("/cache", tags=["Admin"])
 async def clear_cache():
     """Clear the cache (admin endpoint)"""
     cache.clear()
+    matte_cache.clear()
+    digest_index.clear()
+    near_duplicates.clear()
+    validation_cache.clear()
     return {"message": "Cache cleared successfully"}
 
 
 @app.post(
     f"{settings.api_prefix}/remove-background",
     response_model=BackgroundRemovalResponse,
+    responses={
+        200: {"content": {"image/png": {}, "image/jpeg": {}, "image/webp": {}}},
+        202: {"model": JobResponse, "description": "Job accepted (async_mode)"}
+    },
     tags=["Background Removal"],
     summary="Remove background from image",
-    description="Remove background from an image using AI. Supports caching and webhooks."
+    description="Remove background from an image using AI. Supports caching, webhooks and async jobs."
 )
 @limiter.limit(settings.rate_limit_default)
 async def remove_background(
@@ -290,36 +1166,101 @@ async def remove_background(
     - **threshold**: Threshold for background removal 0-1 (default: 0)
     - **background_type**: Background type - rgba, white, black, or custom (default: rgba)
     - **webhook_url**: Optional webhook URL for async notification
+    - **async_mode**: Return 202 with a job ID and poll `/jobs/{job_id}` (default: false)
+    - **response_type**: json for output_url, binary for the image bytes (default: json)
+    - **auto_crop**: trim the output to the subject's bounding box, plus `crop_padding` pixels (default: false)
+    - **mask_only**: return the 8-bit grayscale matte instead of the cut-out; webp has no grayscale mode, so it decodes as gray RGB (default: false)
+    - **encoding**: encoding profile - fast, balanced or smallest (default: ENCODING_PROFILE)
+    - **lossless**: lossless WebP output (default: false)
+    - **palette**: 256-color palette PNG, much smaller but lossy (default: false)
+    - **sizes**: longest sides in pixels (0 = original) to render from one segmentation;
+      returns `outputs` (or a multipart/mixed body with `response_type=binary`)
     """
     import time
     start_time = time.time()
     
-    # Get request ID from middleware
+    # Get request ID and subscription tier from middleware
     request_id = getattr(request.state, "request_id", "unknown")
+    tier = getattr(request.state, "subscription", None)
     
     try:
         # Validate image URL (if enabled)
-        if settings.validate_image_urls:
+        validation = {}
+        if settings.validate_image_urls and not defer_validation():
             logger.info(f"Validating image: {request_data.image_url}")
-            image_validator.validate_image_url(str(request_data.image_url))
-        else:
+            validation = await image_validator.validate_image_url(str(request_data.image_url))
+        elif not settings.validate_image_urls:
             logger.debug(f"Skipping URL validation for: {request_data.image_url}")
         
         # Validate format
         output_format = image_validator.validate_format(request_data.format)
+        request_data.encoding = validate_encoding(request_data.encoding)
+        validate_output_encoding(request_data, output_format)
+        return_binary = validate_response_type(request_data.response_type)
+        if return_binary and request_data.async_mode:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="response_type 'binary' cannot be combined with async_mode"
+            )
+        sizes = validate_sizes(request_data.sizes)
+        if sizes and request_data.async_mode:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="sizes cannot be combined with async_mode"
+            )
+        
+        # Identify the image (by content if CONTENT_HASH_KEYS is on); async
+        # jobs only use an already-known digest and resolve the rest later
+        source = await resolve_source(str(request_data.image_url), fetch=not request_data.async_mode)
+        
+        # Several sizes from one segmentation, each cached separately
+        if sizes:
+            if defer_validation():
+                validation = await image_validator.validate_image_url(str(request_data.image_url))
+            outputs, cached = await process_sizes(
+                source, request_data, output_format, sizes, validation.get("size_bytes"), tier
+            )
+            processing_time = time.time() - start_time
+            logger.info(f"Processed {len(outputs)} sizes in {processing_time:.2f}s (cached: {cached})")
+            
+            if request_data.webhook_url and settings.webhook_enabled:
+                webhook_payload = WebhookPayload(
+                    request_id=request_id,
+                    success=True,
+                    output_url=outputs[0]["output_url"],
+                    timestamp=datetime.utcnow().isoformat(),
+                    processing_time=processing_time
+                )
+                background_tasks.add_task(send_webhook, request_data.webhook_url, webhook_payload)
+            
+            if return_binary:
+                return await sizes_response(outputs, cached, processing_time)
+            
+            return BackgroundRemovalResponse(
+                success=True,
+                output_url=outputs[0]["output_url"],
+                outputs=[SizedOutput(**output) for output in outputs],
+                message="Background removed successfully" + (" (cached)" if cached else ""),
+                processing_time=processing_time,
+                cached=cached,
+                request_id=request_id
+            )
         
         # Check cache
         cached_result = None
         cache_key = None
         
         if settings.cache_enabled:
-            cache_key = generate_cache_key(request_data)
-            cached_result = cache.get(cache_key)
+            cache_key = options_cache_key(source.key, request_data)
+            cached_result = get_cached_result(cache_key)
             
-            if cached_result:
+            if cached_result and not request_data.async_mode:
                 logger.info(f"Cache hit for request {request_id}")
                 processing_time = time.time() - start_time
                 
+                if return_binary:
+                    return await binary_response(request, cached_result, True, processing_time)
+                
                 return BackgroundRemovalResponse(
                     success=True,
                     output_url=cached_result,
@@ -329,30 +1270,59 @@ async def remove_background(
                     request_id=request_id
                 )
         
+        # Deferred validation: only images that will actually be processed
+        if defer_validation() and not cached_result:
+            logger.info(f"Validating image: {request_data.image_url}")
+            validation = await image_validator.validate_image_url(str(request_data.image_url))
+        
+        # Async mode: hand off to a background job and return immediately
+        if request_data.async_mode:
+            job_id = await asyncio.to_thread(job_store.create, request_id)
+            
+            if cached_result:
+                await asyncio.to_thread(
+                    job_store.update, job_id, JOB_SUCCEEDED,
+                    output_url=cached_result, cached=True,
+                    processing_time=time.time() - start_time
+                )
+                if request_data.webhook_url and settings.webhook_enabled:
+                    webhook_payload = WebhookPayload(
+                        request_id=request_id,
+                        success=True,
+                        output_url=cached_result,
+                        timestamp=datetime.utcnow().isoformat(),
+                        processing_time=time.time() - start_time
+                    )
+                    background_tasks.add_task(send_webhook, request_data.webhook_url, webhook_payload)
+            else:
+                background_tasks.add_task(
+                    run_background_job, job_id, request_data, output_format, cache_key, request_id,
+                    validation.get("size_bytes"), tier, source
+                )
+            
+            job_status = JOB_SUCCEEDED if cached_result else JOB_QUEUED
+            logger.info(f"Accepted job {job_id} for request {request_id} ({job_status})")
+            
+            return JSONResponse(
+                status_code=status.HTTP_202_ACCEPTED,
+                content=JobResponse(
+                    success=True,
+                    job_id=job_id,
+                    status=job_status,
+                    status_url=f"{settings.api_prefix}/jobs/{job_id}",
+                    message="Job accepted",
+                    request_id=request_id
+                ).dict()
+            )
+        
         # Process image
-        logger.info(f"Processing image with Replicate: {request_data.image_url}")
-        
-        output = replicate.run(
-            settings.replicate_model,
-            input={
-                "image": str(request_data.image_url),
-                "format": output_format,
-                "reverse": request_data.reverse,
-                "threshold": request_data.threshold,
-                "background_type": request_data.background_type
-            }
+        output_url = await process_image(
+            request_data, output_format, cache_key, validation.get("size_bytes"), tier, source
         )
         
-        # Get output URL
-        output_url = output.url() if hasattr(output, 'url') else str(output)
-        
         processing_time = time.time() - start_time
         logger.info(f"Successfully processed image in {processing_time:.2f}s. Output: {output_url}")
         
-        # Cache result
-        if settings.cache_enabled and cache_key:
-            cache.set(cache_key, output_url, ttl=settings.cache_ttl)
-        
         # Send webhook if provided
         if request_data.webhook_url and settings.webhook_enabled:
             webhook_payload = WebhookPayload(
@@ -364,6 +1334,9 @@ async def remove_background(
             )
             background_tasks.add_task(send_webhook, request_data.webhook_url, webhook_payload)
         
+        if return_binary:
+            return await binary_response(request, output_url, False, processing_time)
+        
         return BackgroundRemovalResponse(
             success=True,
             output_url=output_url,
@@ -375,8 +1348,16 @@ async def remove_background(
         
     except HTTPException:
         raise
-    except replicate.exceptions.ReplicateError as e:
-        logger.error(f"Replicate API error: {str(e)}")
+    except ImageProcessingError as e:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=str(e)
+        )
+    except InferenceError as e:
+        logger.error(f"Inference backend error: {str(e)}")
+        
+        # Shed or circuit-open requests tell the client when to come back
+        retry_after = getattr(e, "retry_after", None)
         
         # Send error webhook if provided
         if request_data.webhook_url and settings.webhook_enabled:
@@ -391,7 +1372,8 @@ async def remove_background(
         
         raise HTTPException(
             status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
-            detail=f"Background removal service error: {str(e)}"
+            detail=f"Background removal service error: {str(e)}",
+            headers={"Retry-After": str(retry_after)} if retry_after else None
         )
     except Exception as e:
         logger.error(f"Unexpected error: {str(e)}")
@@ -413,28 +1395,201 @@ async def remove_background(
         )
 
 
+@app.post(
+    f"{settings.api_prefix}/remove-background/upload",
+    response_model=BackgroundRemovalResponse,
+    tags=["Background Removal"],
+    summary="Remove background from an uploaded image",
+    description="Upload the image itself (multipart/form-data or raw bytes) instead of a URL."
+)
+@limiter.limit(settings.rate_limit_default)
+async def remove_background_upload(request: Request):
+    """
+    Remove background from an uploaded image.
+    
+    Send either:
+    - **multipart/form-data** with the image in an `image` (or `file`) field
+    - the raw image bytes as the request body (e.g. `Content-Type: image/jpeg`)
+    
+    Output options (`format`, `reverse`, `threshold`, `background_type`,
+    `auto_crop`, `crop_padding`, `mask_only`, `encoding`, `lossless`,
+    `palette`, `response_type`, `sizes`) go in the query string, or as form fields in a
+    multipart upload. The image
+    type is detected from its content; the size limit is `MAX_IMAGE_SIZE_MB`.
+    """
+    import time
+    start_time = time.time()
+    
+    request_id = getattr(request.state, "request_id", "unknown")
+    tier = getattr(request.state, "subscription", None)
+    
+    upload = await receive_upload(request)
+    try:
+        try:
+            options = ProcessingOptions(**{**request.query_params, **upload.fields})
+        except ValidationError as e:
+            raise RequestValidationError(e.errors())
+        
+        output_format = image_validator.validate_format(options.format)
+        options.encoding = validate_encoding(options.encoding)
+        validate_output_encoding(options, output_format)
+        return_binary = validate_response_type(options.response_type)
+        sizes = validate_sizes(options.sizes)
+        
+        # Uploads are identified by their content, so re-uploads (and, with
+        # CONTENT_HASH_KEYS, the same image fetched by URL) hit the caches
+        source_key = content_key(upload.digest)
+        
+        if sizes:
+            source = ImageSource(None, source_key, await asyncio.to_thread(upload.read))
+            outputs, cached = await process_sizes(source, options, output_format, sizes, upload.size, tier)
+            processing_time = time.time() - start_time
+            logger.info(f"Processed upload in {len(outputs)} sizes in {processing_time:.2f}s (cached: {cached})")
+            
+            if return_binary:
+                return await sizes_response(outputs, cached, processing_time)
+            
+            return BackgroundRemovalResponse(
+                success=True,
+                output_url=outputs[0]["output_url"],
+                outputs=[SizedOutput(**output) for output in outputs],
+                message="Background removed successfully" + (" (cached)" if cached else ""),
+                processing_time=processing_time,
+                cached=cached,
+                request_id=request_id
+            )
+        
+        cache_key = options_cache_key(source_key, options)
+        cached_result = get_cached_result(cache_key) if settings.cache_enabled else None
+        
+        if cached_result:
+            logger.info(f"Cache hit for upload {upload.digest} (request {request_id})")
+            if return_binary:
+                return await binary_response(request, cached_result, True, time.time() - start_time)
+            return BackgroundRemovalResponse(
+                success=True,
+                output_url=cached_result,
+                message="Background removed successfully (cached)",
+                processing_time=time.time() - start_time,
+                cached=True,
+                request_id=request_id
+            )
+        
+        source = ImageSource(None, source_key, await asyncio.to_thread(upload.read))
+        render_options = output_options(options, output_format)
+        
+        async def render() -> str:
+            output_url = await render_from_matte(source, render_options, upload.size, tier)
+            if settings.cache_enabled:
+                cache.set(cache_key, output_url, ttl=result_ttl(output_url))
+            return output_url
+        
+        output_url = await inflight.do(cache_key, render)
+        
+        processing_time = time.time() - start_time
+        logger.info(f"Successfully processed upload in {processing_time:.2f}s. Output: {output_url}")
+        
+        if return_binary:
+            return await binary_response(request, output_url, False, processing_time)
+        
+        return BackgroundRemovalResponse(
+            success=True,
+            output_url=output_url,
+            message="Background removed successfully",
+            processing_time=processing_time,
+            cached=False,
+            request_id=request_id
+        )
+    
+    except (HTTPException, RequestValidationError):
+        raise
+    except ImageProcessingError as e:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=str(e)
+        )
+    except InferenceError as e:
+        logger.error(f"Inference backend error: {str(e)}")
+        retry_after = getattr(e, "retry_after", None)
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail=f"Background removal service error: {str(e)}",
+            headers={"Retry-After": str(retry_after)} if retry_after else None
+        )
+    except Exception as e:
+        logger.error(f"Unexpected error: {str(e)}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"An unexpected error occurred: {str(e)}"
+        )
+    finally:
+        upload.close()
+
+
+@app.get(
+    f"{settings.api_prefix}/jobs/{{job_id}}",
+    response_model=JobStatusResponse,
+    tags=["Background Removal"],
+    summary="Get async job status",
+    description="Poll the status and result of a job created with async_mode"
+)
+async def get_job_status(job_id: str):
+    """
+    Get the status of an asynchronous background removal job.
+    
+    Jobs can be polled for `JOB_TTL` seconds after their last update. A job
+    still queued or processing after `JOB_TIMEOUT` seconds without progress
+    (its worker died) is reported as failed.
+    """
+    job = await asyncio.to_thread(job_store.get, job_id)
+    
+    if job is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"Job '{job_id}' not found or expired"
+        )
+    
+    return JobStatusResponse(
+        job_id=job["id"],
+        status=job["status"],
+        output_url=job["output_url"],
+        error=job["error"],
+        cached=job["cached"],
+        processing_time=job["processing_time"],
+        created_at=job["created_at"],
+        updated_at=job["updated_at"],
+        request_id=job["request_id"]
+    )
+
+
 @app.post(
     f"{settings.api_prefix}/remove-background/batch",
     tags=["Background Removal"],
     summary="Batch process multiple images",
-    description="Process multiple images for background removal"
+    description="Process multiple images concurrently, optionally streaming results as NDJSON"
 )
 @limiter.limit("10/minute")
 async def remove_background_batch(
     image_urls: List[HttpUrl],
     request: Request,
     format: str = "png",
-    background_type: str = "rgba"
+    background_type: str = "rgba",
+    stream: bool = False
 ):
     """
     Batch process multiple images for background removal.
     
+    Images are processed concurrently (up to `BATCH_CONCURRENCY` at a time),
+    so a batch takes about as long as its slowest image.
+    
     Rate limited to 10 requests per minute.
     
     Parameters:
     - **image_urls**: List of image URLs to process (max 10)
     - **format**: Output format for all images (default: png)
     - **background_type**: Background type for all images (default: rgba)
+    - **stream**: Stream results as NDJSON, one line per image as it completes,
+      followed by a summary line (default: false)
     """
     import time
     
@@ -445,78 +1600,195 @@ async def remove_background_batch(
             detail="Maximum 10 images per batch request"
         )
     
-    results = []
+    # Validate the shared options once, before any item is fanned out
+    output_format = image_validator.validate_format(format)
+    options = ProcessingOptions(format=output_format, background_type=background_type)
+    options.encoding = validate_encoding(options.encoding)
+    validate_output_encoding(options, output_format)
+    
     start_time = time.time()
+    tier = getattr(request.state, "subscription", None)
+    semaphore = asyncio.Semaphore(settings.batch_concurrency)
     
-    for image_url in image_urls:
+    async def process_item(index: int, image_url: HttpUrl) -> dict:
+        """Process one batch item, capturing errors in the result"""
         try:
+            item_request = BackgroundRemovalRequest(image_url=image_url, **options.dict())
+            
             # Check cache first
+            source = await resolve_source(str(image_url))
             cache_key = None
             cached_result = None
             
             if settings.cache_enabled:
-                import hashlib
-                import json
-                cache_data = {
-                    "image_url": str(image_url),
-                    "format": format,
-                    "background_type": background_type
-                }
-                cache_key = hashlib.md5(json.dumps(cache_data, sort_keys=True).encode()).hexdigest()
-                cached_result = cache.get(cache_key)
+                cache_key = options_cache_key(source.key, item_request)
+                cached_result = get_cached_result(cache_key)
             
             if cached_result:
-                results.append({
+                return {
+                    "index": index,
                     "input_url": str(image_url),
                     "success": True,
                     "output_url": cached_result,
                     "cached": True
-                })
-                continue
-            
-            # Process image
-            output = replicate.run(
-                settings.replicate_model,
-                input={
-                    "image": str(image_url),
-                    "format": format,
-                    "reverse": False,
-                    "threshold": 0,
-                    "background_type": background_type
                 }
-            )
             
-            output_url = output.url() if hasattr(output, 'url') else str(output)
+            # Process image (shares in-flight predictions with identical requests)
+            async with semaphore:
+                output_url = await process_image(item_request, output_format, cache_key, tier=tier, source=source)
             
-            # Cache result
-            if settings.cache_enabled and cache_key:
-                cache.set(cache_key, output_url)
-            
-            results.append({
+            return {
+                "index": index,
                 "input_url": str(image_url),
                 "success": True,
                 "output_url": output_url,
                 "cached": False
-            })
+            }
             
         except Exception as e:
-            results.append({
+            return {
+                "index": index,
                 "input_url": str(image_url),
                 "success": False,
                 "error": str(e)
-            })
+            }
     
-    processing_time = time.time() - start_time
+    def summary(results: list) -> dict:
+        return {
+            "total": len(image_urls),
+            "successful": sum(1 for r in results if r["success"]),
+            "failed": sum(1 for r in results if not r["success"]),
+            "processing_time": time.time() - start_time
+        }
+    
+    if stream:
+        async def stream_results():
+            tasks = [asyncio.ensure_future(process_item(i, url)) for i, url in enumerate(image_urls)]
+            results = []
+            try:
+                for next_done in asyncio.as_completed(tasks):
+                    result = await next_done
+                    results.append(result)
+                    yield json.dumps(result) + "\n"
+                yield json.dumps({**summary(results), "done": True}) + "\n"
+            finally:
+                # Client went away - stop waiting on the remaining items
+                for task in tasks:
+                    task.cancel()
+        
+        return StreamingResponse(stream_results(), media_type="application/x-ndjson")
+    
+    results = await asyncio.gather(*(process_item(i, url) for i, url in enumerate(image_urls)))
     
     return {
-        "total": len(image_urls),
-        "successful": sum(1 for r in results if r["success"]),
-        "failed": sum(1 for r in results if not r["success"]),
-        "processing_time": processing_time,
+        **summary(results),
         "results": results
     }
 
 
+@app.post(
+    f"{settings.api_prefix}/bulk-jobs",
+    response_model=BulkJobResponse,
+    status_code=status.HTTP_202_ACCEPTED,
+    tags=["Bulk Jobs"],
+    summary="Submit a bulk job",
+    description="Submit a JSON Lines manifest of images to process in the background"
+)
+@limiter.limit("10/minute")
+async def create_bulk_job(request: Request):
+    """
+    Submit a bulk job.
+    
+    The request body is a JSON Lines manifest: one JSON object per line with
+    the same fields as the single-image endpoint (`image_url`, `format`,
+    `reverse`, `threshold`, `background_type`), or a bare JSON string URL.
+    Items are persisted and processed by background workers; jobs survive
+    restarts and resume where they left off.
+    """
+    max_bytes = settings.bulk_max_manifest_mb * 1024 * 1024
+    content_length = request.headers.get("Content-Length")
+    if content_length and content_length.isdigit() and int(content_length) > max_bytes:
+        raise HTTPException(
+            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            detail=f"Manifest too large. Maximum allowed: {settings.bulk_max_manifest_mb}MB"
+        )
+    
+    body = await request.body()
+    if len(body) > max_bytes:
+        raise HTTPException(
+            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            detail=f"Manifest too large. Maximum allowed: {settings.bulk_max_manifest_mb}MB"
+        )
+    
+    items = parse_manifest(body)
+    request_id = getattr(request.state, "request_id", "unknown")
+    job_id = await asyncio.to_thread(bulk_store.create, items, settings.bulk_tier, request_id)
+    
+    return BulkJobResponse(
+        success=True,
+        job_id=job_id,
+        total=len(items),
+        status_url=f"{settings.api_prefix}/bulk-jobs/{job_id}",
+        results_url=f"{settings.api_prefix}/bulk-jobs/{job_id}/results",
+        request_id=request_id
+    )
+
+
+@app.get(
+    f"{settings.api_prefix}/bulk-jobs/{{job_id}}",
+    response_model=BulkJobStatusResponse,
+    tags=["Bulk Jobs"],
+    summary="Get bulk job progress"
+)
+async def get_bulk_job(job_id: str):
+    """Get progress counts for a bulk job"""
+    job = await asyncio.to_thread(bulk_store.get, job_id)
+    
+    if job is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"Bulk job '{job_id}' not found"
+        )
+    
+    return BulkJobStatusResponse(**job)
+
+
+@app.get(
+    f"{settings.api_prefix}/bulk-jobs/{{job_id}}/results",
+    response_model=BulkJobResultsResponse,
+    tags=["Bulk Jobs"],
+    summary="Page through bulk job results"
+)
+async def get_bulk_job_results(
+    job_id: str,
+    after: int = -1,
+    limit: int = 100,
+    status_filter: Optional[str] = Query(None, alias="status")
+):
+    """
+    Get bulk job item results in manifest order.
+    
+    Parameters:
+    - **after**: Return items after this index (use `next_after` from the previous page)
+    - **limit**: Page size (max 1000)
+    - **status**: Only items with this status (pending, running, succeeded, failed)
+    """
+    if await asyncio.to_thread(bulk_store.get, job_id) is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"Bulk job '{job_id}' not found"
+        )
+    
+    limit = max(1, min(limit, 1000))
+    items = await asyncio.to_thread(bulk_store.results, job_id, after, limit, status_filter)
+    
+    return BulkJobResultsResponse(
+        job_id=job_id,
+        items=items,
+        next_after=items[-1]["index"] if len(items) == limit else None
+    )
+
+
 @app.get("/terms", tags=["Legal"])
 async def terms_of_service():
     """Terms of Service"""
@@ -746,6 +2018,27 @@ async def service_level_agreement():
     }
 
 
+@app.on_event("startup")
+async def start_bulk_worker():
+    """Start processing bulk job items in this worker process"""
+    if settings.bulk_worker_enabled:
+        bulk_worker.start(process_bulk_item)
+
+
+@app.on_event("startup")
+async def start_validator():
+    """Open the URL validator's pooled HTTP client"""
+    await image_validator.start()
+
+
+@app.on_event("shutdown")
+async def shutdown_backends():
+    """Stop the bulk worker and release inference backend resources"""
+    await bulk_worker.stop()
+    inference.shutdown()
+    await image_validator.close()
+
+
 # Global exception handler
 @app.exception_handler(Exception)
 async def global_exception_handler(request: Request, exc: Exception):
@@ -92,11 +92,12 @@ class RequestLoggingMiddleware(BaseHTTPMiddleware):
 class APIKeyValidationMiddleware(BaseHTTPMiddleware):
     """Middleware to validate API keys"""
     
-    def __init__(self, app, allowed_keys: list = None):
+    def __init__(self, app, allowed_keys: list = None, extra_public_paths: list = None):
         super().__init__(app)
         self.allowed_keys = allowed_keys or []
         # Public endpoints that don't require API key
         self.public_paths = ["/", "/health", "/docs", "/redoc", "/openapi.json", "/terms", "/privacy"]
+        self.public_paths.extend(extra_public_paths or [])
     
     async def dispatch(self, request: Request, call_next: Callable):
         # Skip validation for public endpoints
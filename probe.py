@@ -0,0 +1,133 @@
+"""
+Header-only image probing: true format and pixel dimensions from the first
+few KB of a file, without decoding it
+"""
+from typing import Optional, Tuple
+import struct
+
+from fastapi import HTTPException, status
+
+# Leading bytes -> image format
+MAGIC_NUMBERS = (
+    (b"\x89PNG\r\n\x1a\n", "png"),
+    (b"\xff\xd8\xff", "jpeg"),
+    (b"GIF87a", "gif"),
+    (b"GIF89a", "gif"),
+)
+
+# JPEG start-of-frame markers (SOF0-SOF15 except DHT, JPG and DAC), which carry the dimensions
+_JPEG_SOF_MARKERS = frozenset(range(0xC0, 0xD0)) - {0xC4, 0xC8, 0xCC}
+
+# JPEG markers without a length field
+_JPEG_STANDALONE_MARKERS = frozenset(range(0xD0, 0xDA)) | {0x01}
+
+
+def sniff_format(header: bytes) -> Optional[str]:
+    """Detect the image format from its first bytes, ignoring any declared type"""
+    for magic, image_format in MAGIC_NUMBERS:
+        if header.startswith(magic):
+            return image_format
+    if header[:4] == b"RIFF" and header[8:12] == b"WEBP":
+        return "webp"
+    return None
+
+
+def _png_dimensions(header: bytes) -> Optional[Tuple[int, int]]:
+    # The IHDR chunk always comes first
+    if len(header) < 24 or header[12:16] != b"IHDR":
+        return None
+    return struct.unpack(">II", header[16:24])
+
+
+def _gif_dimensions(header: bytes) -> Optional[Tuple[int, int]]:
+    # Logical screen size, right after the signature
+    if len(header) < 10:
+        return None
+    return struct.unpack("<HH", header[6:10])
+
+
+def _webp_dimensions(header: bytes) -> Optional[Tuple[int, int]]:
+    chunk = header[12:16]
+    if chunk == b"VP8X" and len(header) >= 30:
+        # Extended format: 24-bit canvas size minus one
+        width = int.from_bytes(header[24:27], "little") + 1
+        height = int.from_bytes(header[27:30], "little") + 1
+        return width, height
+    if chunk == b"VP8 " and len(header) >= 30 and header[23:26] == b"\x9d\x01\x2a":
+        # Lossy: 14-bit sizes after the key frame start code
+        width, height = struct.unpack("<HH", header[26:30])
+        return width & 0x3FFF, height & 0x3FFF
+    if chunk == b"VP8L" and len(header) >= 25 and header[20] == 0x2F:
+        # Lossless: two 14-bit sizes minus one, packed after the signature byte
+        bits = int.from_bytes(header[21:25], "little")
+        return (bits & 0x3FFF) + 1, ((bits >> 14) & 0x3FFF) + 1
+    return None
+
+
+def jpeg_scan(data: bytes, base: int = 0, offset: int = 2) -> Tuple[Optional[Tuple[int, int]], Optional[int]]:
+    """
+    Walk JPEG marker segments up to the first start-of-frame, from file
+    offset `offset` in data that starts at file offset `base`. EXIF and
+    ICC segments are skipped by length, so only their size matters.
+
+    Returns ((width, height), None) when the frame header is found,
+    (None, offset) with the file offset of the first segment past the end
+    of data (read from there to continue), or (None, None) if malformed.
+    """
+    while offset - base + 4 <= len(data):
+        index = offset - base
+        if data[index] != 0xFF:
+            return None, None
+        marker = data[index + 1]
+        if marker == 0xFF:
+            # Fill byte
+            offset += 1
+            continue
+        if marker in _JPEG_STANDALONE_MARKERS:
+            offset += 2
+            continue
+        if marker in _JPEG_SOF_MARKERS:
+            if index + 9 > len(data):
+                return None, offset
+            height, width = struct.unpack(">HH", data[index + 5:index + 9])
+            return (width, height), None
+        if marker == 0xDA:
+            # Start of scan without a frame header: not a valid JPEG
+            return None, None
+        offset += 2 + struct.unpack(">H", data[index + 2:index + 4])[0]
+    return None, offset
+
+
+def _jpeg_dimensions(header: bytes) -> Optional[Tuple[int, int]]:
+    return jpeg_scan(header)[0]
+
+
+_DIMENSION_READERS = {
+    "png": _png_dimensions,
+    "gif": _gif_dimensions,
+    "webp": _webp_dimensions,
+    "jpeg": _jpeg_dimensions,
+}
+
+
+def probe_header(header: bytes) -> Tuple[Optional[str], Optional[Tuple[int, int]]]:
+    """
+    Read the format and (width, height) from the first bytes of an image.
+    The format is None if the bytes aren't a known image type; dimensions
+    are None if they lie beyond the bytes given (e.g. after a large EXIF
+    block) or the header is malformed.
+    """
+    image_format = sniff_format(header)
+    if image_format is None:
+        return None, None
+    return image_format, _DIMENSION_READERS[image_format](header)
+
+
+def check_dimensions(width: int, height: int, max_megapixels: float):
+    """Reject images over the pixel-count limit before anything decodes them"""
+    megapixels = width * height / 1_000_000
+    if max_megapixels and megapixels > max_megapixels:
+        raise HTTPException(
+            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            detail=f"Image dimensions too large ({width}x{height}, {megapixels:.1f} MP). Maximum allowed: {max_megapixels:g} MP"
+        )
@@ -0,0 +1,224 @@
+"""
+Latency tracking, circuit breaking and admission control for upstream calls
+"""
+from typing import Optional
+from collections import deque
+import time
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class LatencyTracker:
+    """
+    Rolling window of recent upstream latencies.
+    Percentiles are only reported once enough samples have been seen, so
+    cold-start decisions fall back to static limits.
+    """
+
+    def __init__(self, window: int = 500, min_samples: int = 20):
+        self.samples = deque(maxlen=window)
+        self.min_samples = min_samples
+        self._sorted: Optional[list] = None
+
+    def record(self, seconds: float):
+        """Record one observed latency"""
+        self.samples.append(seconds)
+        self._sorted = None
+
+    def percentile(self, pct: float) -> Optional[float]:
+        """Nearest-rank percentile in seconds, or None while warming up"""
+        if len(self.samples) < self.min_samples:
+            return None
+
+        if self._sorted is None:
+            self._sorted = sorted(self.samples)
+
+        index = min(len(self._sorted) - 1, max(0, int(round(pct / 100 * len(self._sorted))) - 1))
+        return self._sorted[index]
+
+    def stats(self) -> dict:
+        """Get current latency percentiles"""
+        def fmt(value: Optional[float]) -> Optional[float]:
+            return round(value, 3) if value is not None else None
+
+        return {
+            "samples": len(self.samples),
+            "p50": fmt(self.percentile(50)),
+            "p95": fmt(self.percentile(95)),
+            "p99": fmt(self.percentile(99))
+        }
+
+
+class AdaptiveDeadline:
+    """
+    Per-request deadline derived from observed latency:
+    p99 x multiplier, clamped to [min_timeout, max_timeout].
+    Uses max_timeout until the tracker has enough samples.
+    """
+
+    def __init__(
+        self,
+        tracker: LatencyTracker,
+        min_timeout: float = 5,
+        max_timeout: float = 60,
+        multiplier: float = 3.0
+    ):
+        self.tracker = tracker
+        self.min_timeout = min_timeout
+        self.max_timeout = max_timeout
+        self.multiplier = multiplier
+
+    def current(self) -> float:
+        """Deadline in seconds for a request starting now"""
+        p99 = self.tracker.percentile(99)
+        if p99 is None:
+            return self.max_timeout
+        return min(self.max_timeout, max(self.min_timeout, p99 * self.multiplier))
+
+
+# Circuit breaker states
+CIRCUIT_CLOSED = "closed"
+CIRCUIT_OPEN = "open"
+CIRCUIT_HALF_OPEN = "half_open"
+
+
+class CircuitBreaker:
+    """
+    Circuit breaker for an upstream dependency.
+
+    - closed: calls flow; outcomes of the last `window` calls are kept and
+      the circuit opens once the failure ratio reaches failure_threshold
+      (slow calls count as failures)
+    - open: calls are rejected immediately for open_seconds
+    - half_open: up to half_open_probes calls are let through; one failure
+      reopens the circuit, all of them succeeding closes it
+    """
+
+    def __init__(
+        self,
+        failure_threshold: float = 0.5,
+        min_calls: int = 10,
+        window: int = 50,
+        slow_call_seconds: float = 30,
+        open_seconds: float = 30,
+        half_open_probes: int = 3
+    ):
+        self.failure_threshold = failure_threshold
+        self.min_calls = min_calls
+        self.slow_call_seconds = slow_call_seconds
+        self.open_seconds = open_seconds
+        self.half_open_probes = half_open_probes
+        self.outcomes = deque(maxlen=window)
+        self.state = CIRCUIT_CLOSED
+        self.opened_at = 0.0
+        self.probes_started = 0
+        self.probes_succeeded = 0
+        self.times_opened = 0
+        self.rejected = 0
+
+    def _transition(self, state: str):
+        logger.warning(f"Circuit breaker {self.state} -> {state}")
+        self.state = state
+        if state == CIRCUIT_OPEN:
+            self.opened_at = time.monotonic()
+            self.times_opened += 1
+        if state in (CIRCUIT_HALF_OPEN, CIRCUIT_CLOSED):
+            self.probes_started = 0
+            self.probes_succeeded = 0
+        if state == CIRCUIT_CLOSED:
+            self.outcomes.clear()
+
+    def allow(self) -> bool:
+        """Whether a call may go upstream now"""
+        if self.state == CIRCUIT_OPEN:
+            if time.monotonic() - self.opened_at < self.open_seconds:
+                self.rejected += 1
+                return False
+            self._transition(CIRCUIT_HALF_OPEN)
+            self.opened_at = time.monotonic()
+
+        if self.state == CIRCUIT_HALF_OPEN:
+            # Probes that never report back (e.g. canceled) must not wedge the circuit
+            if time.monotonic() - self.opened_at > self.open_seconds:
+                self.probes_started = self.probes_succeeded
+                self.opened_at = time.monotonic()
+            if self.probes_started >= self.half_open_probes:
+                self.rejected += 1
+                return False
+            self.probes_started += 1
+
+        return True
+
+    def record(self, success: bool, latency: Optional[float] = None):
+        """Record the outcome of a call that allow() let through"""
+        if success and latency is not None and latency > self.slow_call_seconds:
+            success = False
+
+        if self.state == CIRCUIT_HALF_OPEN:
+            if not success:
+                self._transition(CIRCUIT_OPEN)
+            else:
+                self.probes_succeeded += 1
+                if self.probes_succeeded >= self.half_open_probes:
+                    self._transition(CIRCUIT_CLOSED)
+            return
+
+        self.outcomes.append(success)
+        if self.state == CIRCUIT_CLOSED and len(self.outcomes) >= self.min_calls:
+            failure_ratio = self.outcomes.count(False) / len(self.outcomes)
+            if failure_ratio >= self.failure_threshold:
+                self._transition(CIRCUIT_OPEN)
+
+    def retry_after(self) -> int:
+        """Seconds until the circuit will let probes through"""
+        remaining = self.open_seconds - (time.monotonic() - self.opened_at)
+        return max(1, int(remaining + 0.999))
+
+    def stats(self) -> dict:
+        """Get circuit breaker state"""
+        failures = self.outcomes.count(False)
+        return {
+            "state": self.state,
+            "recent_calls": len(self.outcomes),
+            "recent_failures": failures,
+            "times_opened": self.times_opened,
+            "rejected": self.rejected
+        }
+
+
+class AdmissionController:
+    """
+    Bounds the number of requests queued for or running on the upstream.
+    Requests beyond max_depth are shed immediately instead of piling up
+    behind a degraded upstream.
+    """
+
+    def __init__(self, max_depth: int = 100, retry_after: int = 5):
+        self.max_depth = max_depth
+        self.retry_after = retry_after
+        self.depth = 0
+        self.admitted = 0
+        self.shed = 0
+
+    def try_enter(self) -> bool:
+        """Admit a request if there is room; callers must leave() afterwards"""
+        if self.max_depth and self.depth >= self.max_depth:
+            self.shed += 1
+            return False
+        self.depth += 1
+        self.admitted += 1
+        return True
+
+    def leave(self):
+        """Mark an admitted request as finished"""
+        self.depth -= 1
+
+    def stats(self) -> dict:
+        """Get admission statistics"""
+        return {
+            "depth": self.depth,
+            "max_depth": self.max_depth,
+            "admitted": self.admitted,
+            "shed": self.shed
+        }
@@ -0,0 +1,136 @@
+"""
+File responses with byte-range support, and multipart bodies carrying
+several images
+"""
+from typing import Dict, List, Optional, Tuple
+import os
+import stat
+import uuid
+
+import anyio
+from starlette.requests import Request
+from starlette.responses import FileResponse, Response
+from starlette.types import Receive, Scope, Send
+
+
+def parse_range(header: Optional[str], size: int) -> Optional[Tuple[int, int]]:
+    """
+    Parse a single-range Range header into an inclusive (start, end) pair.
+    Returns None if there is no usable range (serve the whole file) and
+    raises ValueError if the range can't be satisfied.
+    Multi-range requests are answered with the whole file.
+    """
+    if not header or not header.startswith("bytes=") or "," in header:
+        return None
+
+    start_text, _, end_text = header[len("bytes="):].strip().partition("-")
+    try:
+        if start_text == "":
+            # Suffix range: the last N bytes
+            length = int(end_text)
+            if length <= 0:
+                raise ValueError("Empty suffix range")
+            return max(size - length, 0), size - 1
+
+        start = int(start_text)
+        end = int(end_text) if end_text else size - 1
+    except ValueError:
+        return None
+
+    if start >= size or end < start:
+        raise ValueError("Range not satisfiable")
+    return start, min(end, size - 1)
+
+
+class RangeFileResponse(FileResponse):
+    """
+    FileResponse that answers Range requests with 206 Partial Content (or
+    416 when unsatisfiable), streaming the requested bytes in chunks.
+
+    The body is always sent as http.response.body messages: uvicorn offers
+    no zero-copy extension, and the app's BaseHTTPMiddleware layers only
+    pass http.response.body through, so a pathsend or zerocopysend message
+    would break every download behind them.
+    """
+
+    chunk_size = 256 * 1024
+
+    def __init__(self, path: str, request: Request, media_type: Optional[str] = None, **kwargs):
+        super().__init__(path, media_type=media_type, method=request.method, **kwargs)
+        self.headers["accept-ranges"] = "bytes"
+        self.range_header = request.headers.get("range")
+        self.if_range = request.headers.get("if-range")
+        self.range: Optional[Tuple[int, int]] = None
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if self.stat_result is None:
+            try:
+                self.stat_result = await anyio.to_thread.run_sync(os.stat, self.path)
+            except FileNotFoundError:
+                raise RuntimeError(f"File at path {self.path} does not exist.")
+            if not stat.S_ISREG(self.stat_result.st_mode):
+                raise RuntimeError(f"File at path {self.path} is not a file.")
+            self.set_stat_headers(self.stat_result)
+
+        size = self.stat_result.st_size
+        # If-Range: only honor the range if the client's copy is still current
+        if self.range_header and (self.if_range is None or self.if_range == self.headers.get("etag")):
+            try:
+                self.range = parse_range(self.range_header, size)
+            except ValueError:
+                self.status_code = 416
+                self.headers["content-range"] = f"bytes */{size}"
+                self.headers["content-length"] = "0"
+                self.send_header_only = True
+
+        if self.range is not None:
+            start, end = self.range
+            self.status_code = 206
+            self.headers["content-range"] = f"bytes {start}-{end}/{size}"
+            self.headers["content-length"] = str(end - start + 1)
+
+        await send({"type": "http.response.start", "status": self.status_code, "headers": self.raw_headers})
+
+        if self.send_header_only:
+            await send({"type": "http.response.body", "body": b"", "more_body": False})
+        else:
+            start, end = self.range or (0, size - 1)
+            await self._send_file(send, start, end - start + 1)
+
+        if self.background is not None:
+            await self.background()
+
+    async def _send_file(self, send: Send, offset: int, count: int):
+        async with await anyio.open_file(self.path, mode="rb") as file:
+            await file.seek(offset)
+            remaining = count
+            while True:
+                chunk = await file.read(min(self.chunk_size, remaining))
+                remaining -= len(chunk)
+                more_body = remaining > 0 and len(chunk) > 0
+                await send({"type": "http.response.body", "body": chunk, "more_body": more_body})
+                if not more_body:
+                    break
+
+
+def multipart_response(parts: List[Tuple[bytes, Dict[str, str]]], headers: Optional[dict] = None) -> Response:
+    """
+    Build a multipart/mixed response with one part per (body, part headers)
+    pair, e.g. several sizes of the same output
+    """
+    boundary = uuid.uuid4().hex
+    chunks = []
+    for body, part_headers in parts:
+        chunks.append(f"--{boundary}\r\n".encode())
+        for name, value in part_headers.items():
+            chunks.append(f"{name}: {value}\r\n".encode("latin-1"))
+        chunks.append(b"\r\n")
+        chunks.append(body)
+        chunks.append(b"\r\n")
+    chunks.append(f"--{boundary}--\r\n".encode())
+
+    return Response(
+        content=b"".join(chunks),
+        media_type=f"multipart/mixed; boundary={boundary}",
+        headers=headers
+    )
@@ -0,0 +1,132 @@
+"""
+Tier-aware weighted-fair scheduling of upstream slots
+"""
+from typing import Dict
+from collections import deque
+from contextlib import asynccontextmanager
+import asyncio
+import logging
+
+from resilience import LatencyTracker
+
+logger = logging.getLogger(__name__)
+
+
+class TierScheduler:
+    """
+    Hands out a fixed number of upstream slots across subscription tiers.
+
+    While slots are free, requests start immediately. Once they are all
+    taken, requests queue per tier and freed slots go to the backlogged tier
+    with the lowest virtual time (stride scheduling): each dispatch advances
+    a tier's virtual time by 1/weight, so under contention tiers get slots
+    in proportion to their weights and higher tiers wait less.
+    """
+
+    def __init__(self, capacity: int, weights: Dict[str, float], default_tier: str = "free"):
+        self.capacity = capacity
+        self.weights = {tier.lower(): weight for tier, weight in weights.items()}
+        self.default_tier = default_tier.lower()
+        self.active = 0
+        self.virtual_time = 0.0
+        self.queues: Dict[str, deque] = {}
+        self.passes: Dict[str, float] = {}
+        self.dispatched: Dict[str, int] = {}
+        self.wait_times: Dict[str, LatencyTracker] = {}
+
+    def normalize(self, tier: str) -> str:
+        """Map a subscription name to a configured tier"""
+        tier = (tier or "").strip().lower()
+        return tier if tier in self.weights else self.default_tier
+
+    def _record_dispatch(self, tier: str, waited: float):
+        self.dispatched[tier] = self.dispatched.get(tier, 0) + 1
+        if tier not in self.wait_times:
+            self.wait_times[tier] = LatencyTracker(window=500, min_samples=1)
+        self.wait_times[tier].record(waited)
+
+    async def acquire(self, tier: str):
+        """Wait for an upstream slot on behalf of a tier"""
+        tier = self.normalize(tier)
+        loop = asyncio.get_running_loop()
+
+        if self.active < self.capacity and not any(self.queues.values()):
+            self.active += 1
+            self._record_dispatch(tier, 0.0)
+            return
+
+        queue = self.queues.setdefault(tier, deque())
+        if not queue:
+            # A tier returning from idle starts at the current virtual time,
+            # so it can't claim a burst of slots for the time it was away
+            self.passes[tier] = max(self.passes.get(tier, 0.0), self.virtual_time)
+
+        waiter = loop.create_future()
+        queue.append((waiter, loop.time()))
+
+        try:
+            await waiter
+        except asyncio.CancelledError:
+            if waiter.done() and not waiter.cancelled():
+                # The slot was granted just as we were canceled; hand it on
+                self.release()
+            else:
+                self._discard(tier, waiter)
+            raise
+
+    def _discard(self, tier: str, waiter: asyncio.Future):
+        """Remove a canceled waiter from its queue"""
+        queue = self.queues.get(tier)
+        if queue:
+            self.queues[tier] = deque(entry for entry in queue if entry[0] is not waiter)
+
+    def release(self):
+        """Return a slot and dispatch the next waiter"""
+        self.active -= 1
+        self._dispatch()
+
+    def _dispatch(self):
+        loop = asyncio.get_running_loop()
+
+        while self.active < self.capacity:
+            backlogged = [tier for tier, queue in self.queues.items() if queue]
+            if not backlogged:
+                return
+
+            tier = min(backlogged, key=lambda t: self.passes.get(t, 0.0))
+            waiter, enqueued_at = self.queues[tier].popleft()
+            if waiter.done():
+                continue
+
+            self.virtual_time = self.passes.get(tier, 0.0)
+            self.passes[tier] = self.virtual_time + 1.0 / self.weights.get(tier, 1.0)
+            self.active += 1
+            self._record_dispatch(tier, loop.time() - enqueued_at)
+            waiter.set_result(None)
+
+    @asynccontextmanager
+    async def slot(self, tier: str):
+        """Hold an upstream slot for the duration of the block"""
+        await self.acquire(tier)
+        try:
+            yield
+        finally:
+            self.release()
+
+    def stats(self) -> dict:
+        """Get per-tier queue depth, dispatch counts and wait times"""
+        tiers = {}
+        for tier in sorted(set(self.weights) | set(self.dispatched)):
+            waits = self.wait_times.get(tier)
+            tiers[tier] = {
+                "weight": self.weights.get(tier),
+                "queued": len(self.queues.get(tier, ())),
+                "dispatched": self.dispatched.get(tier, 0),
+                "wait": waits.stats() if waits else None
+            }
+
+        return {
+            "capacity": self.capacity,
+            "active": self.active,
+            "tiers": tiers
+        }
@@ -0,0 +1,96 @@
+"""
+Local CPU salient-object segmentation with ONNX Runtime
+
+Functions in this module run inside the local backend's process pool, so
+it only imports what the worker processes need.
+"""
+from typing import Dict, Tuple
+import logging
+
+import numpy as np
+from PIL import Image
+
+from imaging import decode_image, render_variant
+
+logger = logging.getLogger(__name__)
+
+# ImageNet normalization used by the U2-Net family of models
+MEAN = np.array([0.485, 0.456, 0.406], dtype=np.float32)
+STD = np.array([0.229, 0.224, 0.225], dtype=np.float32)
+
+# One ONNX session per worker process, keyed by model path
+_sessions: Dict[str, object] = {}
+
+
+def _get_session(model_path: str, threads: int = 1):
+    """Load (once per process) the ONNX Runtime session for a model"""
+    session = _sessions.get(model_path)
+    if session is None:
+        import onnxruntime as ort
+
+        options = ort.SessionOptions()
+        options.intra_op_num_threads = threads
+        options.inter_op_num_threads = 1
+        session = ort.InferenceSession(model_path, sess_options=options, providers=["CPUExecutionProvider"])
+        _sessions[model_path] = session
+        logger.info(f"Loaded local segmentation model: {model_path}")
+    return session
+
+
+def predict_matte(
+    image: Image.Image,
+    model_path: str,
+    input_size: int = 320,
+    threads: int = 1,
+    full_size: bool = True
+) -> Image.Image:
+    """
+    Predict an 8-bit alpha matte for an RGB image, at the image's own
+    resolution, or at the model's input resolution if full_size is False
+    """
+    session = _get_session(model_path, threads)
+
+    resized = image.convert("RGB").resize((input_size, input_size), Image.BILINEAR)
+    x = np.asarray(resized, dtype=np.float32)
+    x = x / max(float(x.max()), 1e-6)
+    x = (x - MEAN) / STD
+    x = x.transpose(2, 0, 1)[np.newaxis, ...]
+
+    outputs = session.run(None, {session.get_inputs()[0].name: x})
+    prediction = np.squeeze(outputs[0]).astype(np.float32)
+
+    low, high = float(prediction.min()), float(prediction.max())
+    prediction = (prediction - low) / max(high - low, 1e-6)
+
+    matte = Image.fromarray((prediction * 255).astype(np.uint8), mode="L")
+    if not full_size:
+        return matte
+    return matte.resize(image.size, Image.BILINEAR)
+
+
+def remove_background(
+    image_bytes: bytes,
+    options: dict,
+    model_path: str,
+    input_size: int = 320,
+    threads: int = 1
+) -> Tuple[bytes, str]:
+    """Segment, composite and encode an image; returns (bytes, content type)"""
+    image = decode_image(image_bytes)
+    matte = predict_matte(image, model_path, input_size, threads)
+    return render_variant(image, matte, options)
+
+
+def segment(
+    image_bytes: bytes,
+    model_path: str,
+    input_size: int = 320,
+    threads: int = 1
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Decode and segment an image; returns (RGB array, matte array).
+    The matte is left at the model's resolution for the caller to upsample.
+    """
+    image = decode_image(image_bytes)
+    matte = predict_matte(image, model_path, input_size, threads, full_size=False)
+    return np.asarray(image), np.asarray(matte)
@@ -0,0 +1,202 @@
+"""
+Near-duplicate image detection with perceptual hashes
+"""
+from typing import List, Optional, Tuple
+from collections import OrderedDict
+import logging
+
+import numpy as np
+from PIL import Image
+
+from config import settings
+
+logger = logging.getLogger(__name__)
+
+
+def _dct_matrix(n: int) -> np.ndarray:
+    """Orthonormal DCT-II basis"""
+    k = np.arange(n)[:, None]
+    x = np.arange(n)[None, :]
+    matrix = np.cos(np.pi * (2 * x + 1) * k / (2 * n)) * np.sqrt(2.0 / n)
+    matrix[0] /= np.sqrt(2.0)
+    return matrix.astype(np.float32)
+
+
+_DCT_32 = _dct_matrix(32)
+
+
+def phash(image: Image.Image) -> int:
+    """
+    63-bit perceptual hash: signs of the lowest 8x8 DCT frequencies of a
+    32x32 grayscale thumbnail relative to their median, leaving out the DC
+    term. Robust to re-encoding, resizing and small color shifts.
+    """
+    pixels = np.asarray(image.convert("L").resize((32, 32), Image.BILINEAR), dtype=np.float32)
+    frequencies = (_DCT_32 @ pixels @ _DCT_32.T)[:8, :8].flatten()
+    # The DC term only encodes overall brightness
+    bits = frequencies[1:] > np.median(frequencies[1:])
+    return int("".join("1" if bit else "0" for bit in bits), 2)
+
+
+def dhash(image: Image.Image) -> int:
+    """64-bit difference hash: brightness gradients of a 9x8 grayscale thumbnail"""
+    pixels = np.asarray(image.convert("L").resize((9, 8), Image.BILINEAR), dtype=np.int16)
+    bits = (pixels[:, 1:] > pixels[:, :-1]).flatten()
+    return int("".join("1" if bit else "0" for bit in bits), 2)
+
+
+def hamming(a: int, b: int) -> int:
+    """Number of differing bits"""
+    return bin(a ^ b).count("1")
+
+
+class BKTree:
+    """
+    Burkhard-Keller tree over Hamming distance. A radius search only visits
+    children whose edge distance is within the radius of the query's
+    distance to the node (triangle inequality), instead of every entry.
+    """
+
+    def __init__(self):
+        self.root: Optional[list] = None  # [hash, key, {distance: child}]
+        self.size = 0
+
+    def add(self, value: int, key: str):
+        node = [value, key, {}]
+        self.size += 1
+        if self.root is None:
+            self.root = node
+            return
+
+        current = self.root
+        while True:
+            distance = hamming(value, current[0])
+            child = current[2].get(distance)
+            if child is None:
+                current[2][distance] = node
+                return
+            current = child
+
+    def search(self, value: int, radius: int) -> List[Tuple[int, str]]:
+        """All (distance, key) entries within radius of value, nearest first"""
+        matches = []
+        stack = [self.root] if self.root is not None else []
+        while stack:
+            node = stack.pop()
+            distance = hamming(value, node[0])
+            if distance <= radius:
+                matches.append((distance, node[1]))
+            for edge, child in node[2].items():
+                if distance - radius <= edge <= distance + radius:
+                    stack.append(child)
+        return sorted(matches)
+
+
+class NearDuplicateIndex:
+    """
+    Index of segmented source images by perceptual hash.
+
+    Candidates within max_distance bits of the query's pHash are confirmed
+    with a second, independent hash (dHash within verify_distance) and a
+    matching aspect ratio before being reported; candidates that fail
+    confirmation are counted as false matches. The BK-tree is rebuilt from
+    the most recent entries once it holds max_entries.
+    """
+
+    def __init__(
+        self,
+        max_distance: int = 6,
+        verify_distance: int = 10,
+        max_entries: int = 10000,
+        aspect_tolerance: float = 0.01
+    ):
+        self.max_distance = max_distance
+        self.verify_distance = verify_distance
+        self.max_entries = max_entries
+        self.aspect_tolerance = aspect_tolerance
+        self.tree = BKTree()
+        # key -> (phash, dhash, aspect ratio), oldest first
+        self.entries: "OrderedDict[str, Tuple[int, int, float]]" = OrderedDict()
+        self.lookups = 0
+        self.hits = 0
+        self.false_matches = 0
+
+    @staticmethod
+    def fingerprint(image: Image.Image) -> Tuple[int, int, float]:
+        """Hashes and aspect ratio identifying an image"""
+        return phash(image), dhash(image), image.width / max(image.height, 1)
+
+    def add(self, key: str, fingerprint: Tuple[int, int, float]):
+        """Index a segmented source under its cache key"""
+        if key in self.entries:
+            return
+        if len(self.entries) >= self.max_entries:
+            self._rebuild(keep=self.max_entries // 2)
+        self.entries[key] = fingerprint
+        self.tree.add(fingerprint[0], key)
+
+    def _rebuild(self, keep: int):
+        """Drop all but the `keep` most recent entries (BK-trees can't delete)"""
+        recent = list(self.entries.items())[-keep:] if keep else []
+        self.entries = OrderedDict(recent)
+        self.tree = BKTree()
+        for key, fingerprint in recent:
+            self.tree.add(fingerprint[0], key)
+        logger.info(f"Near-duplicate index rebuilt with {len(recent)} entries")
+
+    def find(self, fingerprint: Tuple[int, int, float], exclude: Optional[str] = None) -> List[str]:
+        """Keys of confirmed near-duplicates, nearest first"""
+        self.lookups += 1
+        query_phash, query_dhash, query_aspect = fingerprint
+
+        confirmed = []
+        for distance, key in self.tree.search(query_phash, self.max_distance):
+            entry = self.entries.get(key)
+            if entry is None or key == exclude:
+                continue
+            _, candidate_dhash, candidate_aspect = entry
+            if (
+                hamming(query_dhash, candidate_dhash) > self.verify_distance
+                or abs(candidate_aspect - query_aspect) > self.aspect_tolerance * query_aspect
+            ):
+                self.false_matches += 1
+                logger.debug(f"Rejected near-duplicate candidate {key} (pHash distance {distance})")
+                continue
+            confirmed.append(key)
+        return confirmed
+
+    def record_hit(self):
+        """Count a lookup whose candidate was actually reused"""
+        self.hits += 1
+
+    def forget(self, key: str):
+        """Stop reporting a key (e.g. its matte is gone); the tree entry is skipped"""
+        self.entries.pop(key, None)
+
+    def clear(self):
+        """Drop all entries"""
+        self.entries.clear()
+        self.tree = BKTree()
+
+    def stats(self) -> dict:
+        """Get index statistics"""
+        hit_rate = (self.hits / self.lookups * 100) if self.lookups > 0 else 0
+        candidates = self.hits + self.false_matches
+        false_match_rate = (self.false_matches / candidates * 100) if candidates > 0 else 0
+        return {
+            "entries": len(self.entries),
+            "lookups": self.lookups,
+            "hits": self.hits,
+            "hit_rate": f"{hit_rate:.2f}%",
+            "false_matches": self.false_matches,
+            "false_match_rate": f"{false_match_rate:.2f}%",
+            "max_distance": self.max_distance
+        }
+
+
+# Global near-duplicate index instance
+near_duplicates = NearDuplicateIndex(
+    max_distance=settings.near_duplicate_max_distance,
+    verify_distance=settings.near_duplicate_verify_distance,
+    max_entries=settings.near_duplicate_index_size
+)
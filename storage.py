@@ -0,0 +1,213 @@
+"""
+Content-addressed local storage for processed images
+"""
+from typing import Optional
+import hashlib
+import os
+import tempfile
+import threading
+import time
+import logging
+
+from config import settings
+
+# Lock file for eviction sweeps (POSIX only; elsewhere concurrent sweeps
+# can overlap, which at worst repeats work)
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+# File extension -> Content-Type for stored results
+CONTENT_TYPES = {
+    "png": "image/png",
+    "jpg": "image/jpeg",
+    "jpeg": "image/jpeg",
+    "webp": "image/webp",
+    "gif": "image/gif",
+    "avif": "image/avif",
+}
+
+
+class ResultStore:
+    """
+    Stores processed images on local disk so the API can serve them itself.
+
+    Results are content-addressed: the ID is the BLAKE2 digest of the bytes
+    plus the extension, so storing the same output twice keeps one file.
+    Files live in two levels of sharded directories (ab/cd/abcd....png),
+    are written atomically (temp file + rename) and are evicted least
+    recently used first once the store grows past max_bytes.
+
+    The filesystem is the source of truth, so the bound holds across worker
+    processes: file mtimes are the LRU clock, and eviction scans the store
+    under an exclusive lock file. Each process sweeps once the bytes it has
+    written since its last sweep could have taken the store past
+    max_bytes, or after writing a slack of 1/16th of max_bytes, so with N
+    workers the store overshoots by at most N slacks between sweeps.
+    """
+
+    def __init__(self, directory: str = "results", max_bytes: int = 0):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        # As of the last sweep, plus this process's writes since
+        self.total_bytes = 0
+        self.results = 0
+        self._written_since_sweep = 0
+        self.stored = 0
+        self.deduplicated = 0
+        self.evicted = 0
+        os.makedirs(self.directory, exist_ok=True)
+        self._sweep()
+        if self.results:
+            logger.info(f"Result store: {self.results} results, {self.total_bytes / (1024 * 1024):.1f}MB")
+
+    @staticmethod
+    def _valid_id(result_id: str) -> bool:
+        # Result IDs are generated by save(); reject anything else
+        name, _, extension = result_id.partition(".")
+        return len(name) == 32 and all(c in "0123456789abcdef" for c in name) and extension in CONTENT_TYPES
+
+    def _file(self, result_id: str) -> str:
+        return os.path.join(self.directory, result_id[:2], result_id[2:4], result_id)
+
+    def save(self, data: bytes, extension: str) -> str:
+        """
+        Store result bytes and return the result ID. Hashes and writes the
+        file, and may sweep the store, so call it from a worker thread.
+        """
+        result_id = f"{hashlib.blake2b(data, digest_size=16).hexdigest()}.{extension.lower()}"
+        path = self._file(result_id)
+
+        if os.path.isfile(path):
+            self._touch(path)
+            self.deduplicated += 1
+            return result_id
+
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            os.replace(temp_path, path)
+        except BaseException:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            raise
+
+        with self._lock:
+            self.total_bytes += len(data)
+            self.results += 1
+            self._written_since_sweep += len(data)
+            self.stored += 1
+            due = self.max_bytes and (
+                self.total_bytes > self.max_bytes or self._written_since_sweep > self.max_bytes / 16
+            )
+
+        logger.debug(f"Result stored: {result_id} ({len(data)} bytes)")
+        if due:
+            self._sweep()
+        return result_id
+
+    @staticmethod
+    def _touch(path: str):
+        """Mark a result as recently used"""
+        try:
+            os.utime(path, (time.time(), time.time()))
+        except FileNotFoundError:
+            pass
+
+    def _sweep(self):
+        """
+        Measure the store from disk and remove least recently used results
+        until it fits max_bytes, holding the store's lock file so worker
+        processes don't sweep at the same time
+        """
+        with open(os.path.join(self.directory, ".lock"), "w") as lock_file:
+            if fcntl is not None:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+
+            found = []
+            for root, _, files in os.walk(self.directory):
+                for name in files:
+                    if self._valid_id(name):
+                        path = os.path.join(root, name)
+                        try:
+                            info = os.stat(path)
+                        except FileNotFoundError:
+                            continue
+                        found.append((info.st_mtime, path, info.st_size))
+
+            total = sum(size for _, _, size in found)
+            count = len(found)
+            evicted = 0
+            if self.max_bytes:
+                # Oldest first; always keep the newest result
+                for _, path, size in sorted(found)[:-1]:
+                    if total <= self.max_bytes:
+                        break
+                    try:
+                        os.remove(path)
+                    except FileNotFoundError:
+                        pass
+                    total -= size
+                    count -= 1
+                    evicted += 1
+                    logger.debug(f"Result evicted: {os.path.basename(path)}")
+
+        with self._lock:
+            self.total_bytes = total
+            self.results = count
+            self._written_since_sweep = 0
+            self.evicted += evicted
+
+    def path(self, result_id: str) -> Optional[str]:
+        """Get the file path for a result ID (marking it used), or None if unknown"""
+        if not self._valid_id(result_id):
+            return None
+
+        path = self._file(result_id)
+        if not os.path.isfile(path):
+            return None
+
+        self._touch(path)
+        return path
+
+    def id_from_url(self, url: str) -> Optional[str]:
+        """Get the result ID behind a URL built by url(), or None for other URLs"""
+        prefix = f"{settings.api_prefix}/results/"
+        path = url.split("?", 1)[0]
+        if prefix not in path:
+            return None
+        result_id = path.rsplit(prefix, 1)[-1]
+        return result_id if self.path(result_id) else None
+
+    def is_local(self, url: str) -> bool:
+        """Whether a URL points into this store (whether or not the result still exists)"""
+        return f"{settings.api_prefix}/results/" in url.split("?", 1)[0]
+
+    def url(self, result_id: str) -> str:
+        """Build the public URL for a result"""
+        base_url = (settings.public_base_url or "").rstrip("/")
+        return f"{base_url}{settings.api_prefix}/results/{result_id}"
+
+    def stats(self) -> dict:
+        """Get storage statistics"""
+        return {
+            "results": self.results,
+            "size_mb": round(self.total_bytes / (1024 * 1024), 2),
+            "max_size_mb": round(self.max_bytes / (1024 * 1024), 2) if self.max_bytes else None,
+            "stored": self.stored,
+            "deduplicated": self.deduplicated,
+            "evicted": self.evicted
+        }
+
+
+# Global result store instance
+result_store = ResultStore(
+    directory=settings.results_dir,
+    max_bytes=int(settings.results_max_mb * 1024 * 1024)
+)
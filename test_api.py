@@ -239,12 +239,289 @@ def test_batch_processing() -> bool:
         return False
 
 
+def test_batch_invalid_format() -> bool:
+    """Test that a batch with an invalid format is rejected before processing"""
+    print_test_header("Test Batch Invalid Format")
+    
+    try:
+        for stream in (False, True):
+            response = requests.post(
+                f"{BASE_URL}{API_PREFIX}/remove-background/batch",
+                json=[TEST_IMAGE_URL, TEST_IMAGE_URL],
+                params={"format": "tiff", "stream": stream},
+                timeout=30
+            )
+            if response.status_code != 400:
+                print_error(f"stream={stream}: expected 400, got {response.status_code}")
+                print(f"   Response: {response.text}")
+                return False
+        
+        print_success("Invalid batch format rejected with 400")
+        return True
+        
+    except Exception as e:
+        print_error(f"Error: {str(e)}")
+        return False
+
+
+def test_async_job() -> bool:
+    """Test async mode: 202 Accepted and job status polling"""
+    print_test_header("Test Async Job Mode")
+    
+    try:
+        payload = {
+            "image_url": TEST_IMAGE_URL,
+            "format": "png",
+            "async_mode": True
+        }
+        
+        response = requests.post(
+            f"{BASE_URL}{API_PREFIX}/remove-background",
+            json=payload,
+            timeout=30
+        )
+        
+        if response.status_code != 202:
+            print_error(f"Expected 202, got {response.status_code}")
+            print(f"   Response: {response.text}")
+            return False
+        
+        job = response.json()
+        print_success(f"Job accepted: {job.get('job_id')} ({job.get('status')})")
+        
+        # Poll until the job finishes
+        for _ in range(60):
+            status_response = requests.get(f"{BASE_URL}{job['status_url']}", timeout=10)
+            if status_response.status_code != 200:
+                print_error(f"Status poll failed with {status_response.status_code}")
+                return False
+            
+            job_status = status_response.json()
+            if job_status.get("status") in ("succeeded", "failed"):
+                break
+            time.sleep(1)
+        
+        print(f"   Status: {job_status.get('status')}")
+        print(f"   Output URL: {job_status.get('output_url')}")
+        
+        if job_status.get("status") == "succeeded":
+            print_success("Async job completed")
+            return True
+        
+        print_error(f"Job did not succeed: {job_status.get('error')}")
+        return False
+        
+    except Exception as e:
+        print_error(f"Error: {str(e)}")
+        return False
+
+
+def test_upload() -> bool:
+    """Test direct image upload (multipart and raw body)"""
+    print_test_header("Test Image Upload")
+    
+    try:
+        image_bytes = requests.get(TEST_IMAGE_URL, timeout=30).content
+        print_info(f"Uploading {len(image_bytes)} bytes")
+        
+        response = requests.post(
+            f"{BASE_URL}{API_PREFIX}/remove-background/upload",
+            params={"format": "png"},
+            files={"image": ("test.png", image_bytes, "image/png")},
+            timeout=120
+        )
+        
+        if response.status_code != 200:
+            print_error(f"Multipart upload failed: {response.status_code}")
+            print(f"   Response: {response.text}")
+            return False
+        print_success(f"Multipart upload: {response.json().get('output_url')}")
+        
+        # Same bytes again, as a raw body: served from cache
+        response = requests.post(
+            f"{BASE_URL}{API_PREFIX}/remove-background/upload",
+            params={"format": "png"},
+            data=image_bytes,
+            headers={"Content-Type": "application/octet-stream"},
+            timeout=120
+        )
+        
+        if response.status_code == 200 and response.json().get("cached"):
+            print_success("Raw upload of the same image was a cache hit")
+        else:
+            print_error(f"Raw upload: {response.status_code} {response.text}")
+            return False
+        
+        # Not an image
+        response = requests.post(
+            f"{BASE_URL}{API_PREFIX}/remove-background/upload",
+            data=b"definitely not an image",
+            timeout=30
+        )
+        
+        if response.status_code == 415:
+            print_success("Non-image upload correctly rejected")
+            return True
+        
+        print_error(f"Expected 415 for non-image upload, got {response.status_code}")
+        return False
+        
+    except Exception as e:
+        print_error(f"Error: {str(e)}")
+        return False
+
+
+def test_multi_size() -> bool:
+    """Test several output sizes from one request"""
+    print_test_header("Test Multi-Size Output")
+    
+    try:
+        payload = {"image_url": TEST_IMAGE_URL, "format": "png", "sizes": [150, 600, 0]}
+        response = requests.post(
+            f"{BASE_URL}{API_PREFIX}/remove-background",
+            json=payload,
+            timeout=120
+        )
+        
+        if response.status_code != 200:
+            print_error(f"Multi-size request failed: {response.status_code}")
+            print(f"   Response: {response.text}")
+            return False
+        
+        outputs = response.json().get("outputs") or []
+        for output in outputs:
+            print(f"   Size {output['size']}: {output['output_url']}")
+        
+        if [output["size"] for output in outputs] != [0, 600, 150]:
+            print_error("Expected one output per size, original first")
+            return False
+        print_success(f"{len(outputs)} sizes returned")
+        
+        # The same sizes as one multipart body
+        payload["response_type"] = "binary"
+        response = requests.post(
+            f"{BASE_URL}{API_PREFIX}/remove-background",
+            json=payload,
+            timeout=120
+        )
+        
+        if response.status_code == 200 and response.headers.get("Content-Type", "").startswith("multipart/mixed"):
+            print_success(f"Multipart body with all sizes (cached: {response.headers.get('X-Cached')})")
+            return True
+        
+        print_error(f"Multipart request: {response.status_code} {response.headers.get('Content-Type')}")
+        return False
+        
+    except Exception as e:
+        print_error(f"Error: {str(e)}")
+        return False
+
+
+def test_result_ranges() -> bool:
+    """Test Range, suffix-range, unsatisfiable-range and HEAD requests for stored results"""
+    print_test_header("Test Result Range Requests")
+    
+    try:
+        response = requests.post(
+            f"{BASE_URL}{API_PREFIX}/remove-background",
+            json={"image_url": TEST_IMAGE_URL, "format": "png"},
+            timeout=120
+        )
+        output_url = response.json().get("output_url") or ""
+        if response.status_code != 200 or f"{API_PREFIX}/results/" not in output_url:
+            print_info(f"Result isn't stored on this host ({output_url}), skipping")
+            return True
+        if output_url.startswith("/"):
+            output_url = f"{BASE_URL}{output_url}"
+        
+        full = requests.get(output_url, timeout=30)
+        size = len(full.content)
+        if full.status_code != 200 or full.headers.get("Accept-Ranges") != "bytes":
+            print_error(f"Full download: {full.status_code}, Accept-Ranges {full.headers.get('Accept-Ranges')}")
+            return False
+        
+        checks = [
+            ("bytes=0-99", 206, full.content[:100], f"bytes 0-99/{size}"),
+            ("bytes=-50", 206, full.content[-50:], f"bytes {size - 50}-{size - 1}/{size}"),
+            (f"bytes={size}-", 416, b"", f"bytes */{size}"),
+        ]
+        for header, expected_status, expected_body, expected_range in checks:
+            response = requests.get(output_url, headers={"Range": header}, timeout=30)
+            if (response.status_code, response.content, response.headers.get("Content-Range")) != \
+                    (expected_status, expected_body, expected_range):
+                print_error(f"Range {header}: {response.status_code} {response.headers.get('Content-Range')}, {len(response.content)} bytes")
+                return False
+            print_success(f"Range {header}: {response.status_code} {expected_range}")
+        
+        response = requests.head(output_url, timeout=30)
+        if response.status_code != 200 or response.content or response.headers.get("Content-Length") != str(size):
+            print_error(f"HEAD: {response.status_code}, Content-Length {response.headers.get('Content-Length')}")
+            return False
+        print_success(f"HEAD: Content-Length {size}, no body")
+        return True
+        
+    except Exception as e:
+        print_error(f"Error: {str(e)}")
+        return False
+
+
+def test_bulk_job() -> bool:
+    """Test bulk job submission, progress and paginated results"""
+    print_test_header("Test Bulk Job")
+    
+    try:
+        manifest = "\n".join([
+            json.dumps({"image_url": TEST_IMAGE_URL, "format": "png"}),
+            json.dumps(TEST_IMAGE_URL)
+        ])
+        
+        response = requests.post(
+            f"{BASE_URL}{API_PREFIX}/bulk-jobs",
+            data=manifest,
+            headers={"Content-Type": "application/x-ndjson"},
+            timeout=30
+        )
+        
+        if response.status_code != 202:
+            print_error(f"Expected 202, got {response.status_code}")
+            print(f"   Response: {response.text}")
+            return False
+        
+        job = response.json()
+        print_success(f"Bulk job accepted: {job.get('job_id')} ({job.get('total')} items)")
+        
+        # Poll until every item is finished
+        for _ in range(90):
+            progress = requests.get(f"{BASE_URL}{job['status_url']}", timeout=10).json()
+            if progress.get("status") == "completed":
+                break
+            time.sleep(1)
+        
+        print(f"   Status: {progress.get('status')} ({progress.get('progress')}%)")
+        print(f"   Succeeded: {progress.get('succeeded')}, Failed: {progress.get('failed')}")
+        
+        page = requests.get(f"{BASE_URL}{job['results_url']}", params={"limit": 1}, timeout=10).json()
+        print(f"   First Result: {page['items'][0] if page.get('items') else None}")
+        print(f"   Next Page After: {page.get('next_after')}")
+        
+        if progress.get("status") == "completed" and progress.get("succeeded", 0) > 0:
+            print_success("Bulk job completed")
+            return True
+        
+        print_error("Bulk job did not complete")
+        return False
+        
+    except Exception as e:
+        print_error(f"Error: {str(e)}")
+        return False
+
+
 def test_validation_errors() -> bool:
     """Test input validation"""
     print_test_header("Test Input Validation")
     
     tests_passed = 0
-    total_tests = 3
+    total_tests = 4
     
     # Test 1: Invalid URL
     print_info("Test 1: Invalid URL")
@@ -306,10 +583,265 @@ def test_validation_errors() -> bool:
     except Exception as e:
         print_error(f"Error: {str(e)}")
     
+    # Test 4: URL that isn't an image (checked from the file header)
+    print_info("\nTest 4: Non-image URL")
+    try:
+        payload = {
+            "image_url": "https://example.com/",
+            "format": "png"
+        }
+        response = requests.post(
+            f"{BASE_URL}{API_PREFIX}/remove-background",
+            json=payload,
+            timeout=30
+        )
+        if response.status_code == 415:
+            print_success("Non-image URL rejected correctly")
+            tests_passed += 1
+        else:
+            print_error(f"Expected 415, got {response.status_code}")
+    except Exception as e:
+        print_error(f"Error: {str(e)}")
+    
     print(f"\n   Validation tests: {tests_passed}/{total_tests} passed")
     return tests_passed == total_tests
 
 
+def _recording_router(received: list, alpha: int = 128):
+    """
+    In-process backend router whose model records the image it is sent
+    (URL or data URI) and answers with a uniform matte of the given alpha
+    """
+    import io
+    from PIL import Image
+    from backends import BackendRouter, InferenceBackend, InferenceResult
+    
+    class RecordingBackend(InferenceBackend):
+        name = "recording"
+        
+        async def remove_background(self, image_url: str, options: dict) -> InferenceResult:
+            received.append(image_url)
+            buffer = io.BytesIO()
+            Image.new("RGBA", (64, 64), (0, 0, 0, alpha)).save(buffer, "PNG")
+            return InferenceResult(backend=self.name, data=buffer.getvalue(), content_type="image/png")
+    
+    return BackendRouter(primary=RecordingBackend())
+
+
+def _data_uri_size(uri: str):
+    """Pixel size of the image in a data URI"""
+    import base64
+    import io
+    from PIL import Image
+    return Image.open(io.BytesIO(base64.b64decode(uri.split(",", 1)[1]))).size
+
+
+def test_tiled_model_inputs() -> bool:
+    """Test that tiled inference sends the model each tile, not the source URL (in-process)"""
+    print_test_header("Test Tiled Inference Model Inputs")
+    
+    try:
+        import asyncio
+        from PIL import Image
+        import tiling
+        from config import settings
+        
+        received = []
+        saved = (tiling.inference, settings.tile_size, settings.tile_overlap)
+        tiling.inference = _recording_router(received)
+        settings.tile_size, settings.tile_overlap = 512, 64
+        try:
+            image = Image.new("RGB", (1600, 1200), (200, 120, 40))
+            result = asyncio.run(tiling.segment_tiled(image, "http://example.com/large.jpg"))
+        finally:
+            tiling.inference, settings.tile_size, settings.tile_overlap = saved
+        
+        boxes = tiling.tile_grid(1600, 1200, 512, 64)
+        sizes = [_data_uri_size(uri) for uri in received if uri.startswith("data:")]
+        if len(sizes) != len(received):
+            print_error(f"Model was sent a URL instead of the image: {[u for u in received if not u.startswith('data:')][:2]}")
+            return False
+        expected = [(512, 384)] + [(right - left, bottom - top) for left, top, right, bottom in boxes]
+        if sorted(sizes[1:]) != sorted(expected[1:]) or sizes[0] != expected[0]:
+            print_error(f"Model inputs {sizes} don't match the global pass and tiles {expected}")
+            return False
+        if result.matte.size != image.size:
+            print_error(f"Matte is {result.matte.size}, expected {image.size}")
+            return False
+        
+        print_success(f"Global pass and {len(boxes)} tiles each sent as their own image")
+        return True
+        
+    except Exception as e:
+        print_error(f"Error: {str(e)}")
+        return False
+
+
+def test_animation_model_inputs() -> bool:
+    """Test that each unique GIF frame is sent to the model as that frame (in-process)"""
+    print_test_header("Test Animation Model Inputs")
+    
+    try:
+        import asyncio
+        import base64
+        import io
+        from PIL import Image
+        import main
+        from fetch import ImageSource
+        
+        colors = [(220, 40, 40), (40, 220, 40), (40, 40, 220)]
+        frames = [Image.new("RGB", (80, 60), color) for color in colors]
+        buffer = io.BytesIO()
+        frames[0].save(buffer, "GIF", save_all=True, append_images=frames[1:] + [frames[0]], duration=100, loop=0)
+        
+        received = []
+        saved = main.inference
+        main.inference = _recording_router(received)
+        try:
+            source = ImageSource("http://example.com/anim.gif", "test:anim", buffer.getvalue())
+            animation = asyncio.run(main.get_animation(source))
+        finally:
+            main.inference = saved
+        
+        if any(not uri.startswith("data:") for uri in received):
+            print_error(f"Model was sent a URL instead of the frame: {received}")
+            return False
+        sent = [
+            Image.open(io.BytesIO(base64.b64decode(uri.split(",", 1)[1]))).convert("RGB").getpixel((40, 30))
+            for uri in received
+        ]
+        if sorted(sent) != sorted(colors) or animation.plan != [0, 1, 2, 0]:
+            print_error(f"Model received frames {sent} with plan {animation.plan}, expected {colors} with plan [0, 1, 2, 0]")
+            return False
+        
+        print_success(f"{len(received)} unique frames of 4 each sent as their own image")
+        return True
+        
+    except Exception as e:
+        print_error(f"Error: {str(e)}")
+        return False
+
+
+def test_source_failures_skip_breaker() -> bool:
+    """Test that failing image hosts don't open the upstream circuit breaker (in-process)"""
+    print_test_header("Test Source Failures vs Circuit Breaker")
+    
+    try:
+        import asyncio
+        from fastapi import HTTPException
+        import backends
+        
+        received = []
+        guarded = backends.guard(_recording_router(received).primary)
+        
+        async def unreachable(url: str, max_bytes=None, timeout=None) -> bytes:
+            raise HTTPException(status_code=408, detail="Image URL request timed out")
+        
+        async def run():
+            statuses = []
+            for _ in range(20):
+                try:
+                    await guarded.segment("http://slow.example.com/image.jpg")
+                except HTTPException as e:
+                    statuses.append(e.status_code)
+            return statuses
+        
+        saved = backends.download_image
+        backends.download_image = unreachable
+        try:
+            statuses = asyncio.run(run())
+        finally:
+            backends.download_image = saved
+        
+        state = guarded.breaker.stats()["state"] if guarded.breaker else "closed"
+        if statuses != [408] * 20 or state != "closed" or received:
+            print_error(f"Statuses {set(statuses)}, circuit {state}, model calls {len(received)}")
+            return False
+        
+        print_success("20 source timeouts returned 408 and left the circuit closed")
+        return True
+        
+    except Exception as e:
+        print_error(f"Error: {str(e)}")
+        return False
+
+
+def test_bulk_lease_exhaustion() -> bool:
+    """Test that items whose leases keep expiring fail after max attempts, and retention (in-process)"""
+    print_test_header("Test Bulk Lease Exhaustion")
+    
+    try:
+        import os
+        import sqlite3
+        import tempfile
+        from bulk import BulkJobStore
+        
+        with tempfile.TemporaryDirectory() as directory:
+            db_path = os.path.join(directory, "bulk.db")
+            store = BulkJobStore(db_path=db_path, ttl=60)
+            job_id = store.create([{"image_url": TEST_IMAGE_URL}] * 2)
+            
+            # A worker that dies on every attempt: leases expire as soon as they're taken
+            claims = [len(store.claim(10, -1, max_attempts=3)) for _ in range(4)]
+            job = store.get(job_id)
+            if claims != [2, 2, 2, 0] or job["status"] != "completed" or job["failed"] != 2:
+                print_error(f"Claims {claims}, job {job}")
+                return False
+            print_success("Items failed after 3 expired leases and the job completed")
+            
+            with sqlite3.connect(db_path) as conn:
+                conn.execute("UPDATE bulk_jobs SET updated_at = updated_at - 120")
+            store.create([{"image_url": TEST_IMAGE_URL}])
+            with sqlite3.connect(db_path) as conn:
+                left = conn.execute("SELECT COUNT(*) FROM bulk_items WHERE job_id = ?", (job_id,)).fetchone()[0]
+            if store.get(job_id) is not None or left:
+                print_error(f"Expired job still present ({left} items)")
+                return False
+            print_success("Expired job and its items were purged")
+        
+        return True
+    
+    except Exception as e:
+        print_error(f"Error: {str(e)}")
+        return False
+
+
+def test_stale_jobs_fail() -> bool:
+    """Test that async jobs abandoned by a dead worker are reported as failed (in-process)"""
+    print_test_header("Test Stale Async Jobs")
+    
+    try:
+        import os
+        import sqlite3
+        import tempfile
+        from jobs import JobStore
+        
+        with tempfile.TemporaryDirectory() as directory:
+            db_path = os.path.join(directory, "jobs.db")
+            store = JobStore(db_path=db_path, ttl=3600, timeout=60)
+            stale = store.create("stale")
+            store.update(stale, "processing")
+            fresh = store.create("fresh")
+            store.update(fresh, "processing")
+            
+            # The first job's worker died two minutes ago
+            with sqlite3.connect(db_path) as conn:
+                conn.execute("UPDATE jobs SET updated_at = updated_at - 120 WHERE id = ?", (stale,))
+            
+            statuses = (store.get(stale)["status"], store.get(fresh)["status"])
+            if statuses != ("failed", "processing"):
+                print_error(f"Expected ('failed', 'processing'), got {statuses}")
+                return False
+            
+            print_success(f"Abandoned job failed: {store.get(stale)['error']}")
+        
+        return True
+    
+    except Exception as e:
+        print_error(f"Error: {str(e)}")
+        return False
+
+
 def test_legal_endpoints() -> bool:
     """Test legal endpoints (Terms, Privacy)"""
     print_test_header("Test Legal Endpoints")
@@ -448,10 +980,25 @@ def run_all_tests():
     
     # Batch processing
     results['Batch Processing'] = test_batch_processing()
+    results['Batch Invalid Format'] = test_batch_invalid_format()
+    
+    # Async jobs
+    results['Async Job Mode'] = test_async_job()
+    results['Bulk Job'] = test_bulk_job()
+    results['Image Upload'] = test_upload()
+    results['Multi-Size Output'] = test_multi_size()
+    results['Result Range Requests'] = test_result_ranges()
     
     # Validation tests
     results['Input Validation'] = test_validation_errors()
     
+    # In-process tests (no server or upstream needed)
+    results['Tiled Model Inputs'] = test_tiled_model_inputs()
+    results['Animation Model Inputs'] = test_animation_model_inputs()
+    results['Source Failures vs Breaker'] = test_source_failures_skip_breaker()
+    results['Bulk Lease Exhaustion'] = test_bulk_lease_exhaustion()
+    results['Stale Async Jobs'] = test_stale_jobs_fail()
+    
     # Legal/Info endpoints
     results['Legal Endpoints'] = test_legal_endpoints()
     results['Info Endpoints'] = test_info_endpoints()
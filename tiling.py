@@ -0,0 +1,207 @@
+"""
+Tiled inference for very large images: full-resolution mattes from
+overlapping tiles, blended with feathered seams in a disk-backed buffer
+"""
+from typing import List, Optional, Tuple
+import asyncio
+import tempfile
+import threading
+import logging
+
+import numpy as np
+from PIL import Image
+
+from config import settings
+from backends import inference, MatteResult
+from imaging import encode_image, rescale_matte, upsample_matte, working_copy
+
+logger = logging.getLogger(__name__)
+
+# A tile whose region of the global matte lies entirely outside this alpha
+# range is plain background or solid subject: it takes the global matte
+# instead of its own inference call
+EDGE_ALPHA_RANGE = (8, 247)
+
+# Rows normalized per step when reading the blended matte out of the buffer
+_STRIP_ROWS = 1024
+
+Box = Tuple[int, int, int, int]
+
+
+def tile_grid(width: int, height: int, tile_size: int, overlap: int) -> List[Box]:
+    """
+    Cover an image with tile_size squares overlapping by at least overlap
+    pixels; the last row and column are aligned to the image edges
+    """
+    def starts(length: int) -> List[int]:
+        if length <= tile_size:
+            return [0]
+        step = tile_size - overlap
+        positions = list(range(0, length - tile_size, step))
+        return positions + [length - tile_size]
+
+    return [
+        (left, top, min(left + tile_size, width), min(top + tile_size, height))
+        for top in starts(height)
+        for left in starts(width)
+    ]
+
+
+def feather(box: Box, width: int, height: int, overlap: int) -> np.ndarray:
+    """
+    Blending weights for a tile: linear ramps across the overlap on sides
+    shared with neighbouring tiles, 1 on image borders and in the interior
+    """
+    left, top, right, bottom = box
+
+    def ramp(length: int, at_start: bool, at_end: bool) -> np.ndarray:
+        weights = np.ones(length, dtype=np.float32)
+        n = min(overlap, length // 2)
+        if n:
+            rising = np.linspace(0, 1, n + 2, dtype=np.float32)[1:-1]
+            if not at_start:
+                weights[:n] = rising
+            if not at_end:
+                weights[-n:] = rising[::-1]
+        return weights
+
+    x = ramp(right - left, left == 0, right == width)
+    y = ramp(bottom - top, top == 0, bottom == height)
+    return np.outer(y, x)
+
+
+class MatteCanvas:
+    """
+    Accumulates weighted tile mattes in a memory-mapped temporary file, so
+    the float accumulators (8 bytes per pixel, 800 MB for a 100 MP image)
+    live on disk and in the page cache rather than in the process heap.
+    The 8-bit result matte is still built in memory.
+    """
+
+    def __init__(self, width: int, height: int):
+        self.width = width
+        self.height = height
+        self._file = tempfile.TemporaryFile(prefix="matte-", suffix=".buf")
+        self._lock = threading.Lock()
+        # [0] = sum of weight * alpha, [1] = sum of weights
+        self.buffer = np.memmap(self._file, dtype=np.float32, mode="w+", shape=(2, height, width))
+
+    def add(self, box: Box, matte: np.ndarray, weights: np.ndarray):
+        """Blend a tile's matte (0-255) into the canvas"""
+        left, top, right, bottom = box
+        weighted = matte.astype(np.float32) * weights
+        # Tiles overlap, and are added from worker threads
+        with self._lock:
+            if self.buffer is None:
+                # Closed after the segmentation failed
+                return
+            self.buffer[0, top:bottom, left:right] += weighted
+            self.buffer[1, top:bottom, left:right] += weights
+
+    def result(self) -> Image.Image:
+        """The blended 8-bit matte"""
+        matte = np.empty((self.height, self.width), dtype=np.uint8)
+        for top in range(0, self.height, _STRIP_ROWS):
+            bottom = min(top + _STRIP_ROWS, self.height)
+            total = self.buffer[0, top:bottom]
+            weight = np.maximum(self.buffer[1, top:bottom], 1e-6)
+            matte[top:bottom] = np.clip(total / weight + 0.5, 0, 255).astype(np.uint8)
+        return Image.fromarray(matte, mode="L")
+
+    def close(self):
+        with self._lock:
+            self.buffer = None
+            self._file.close()
+
+
+def _global_region(global_matte: Image.Image, box: Box, image_size: Tuple[int, int]) -> Image.Image:
+    """A tile's region of the low-resolution global matte, at tile resolution"""
+    scale_x = global_matte.width / image_size[0]
+    scale_y = global_matte.height / image_size[1]
+    left, top, right, bottom = box
+    return global_matte.resize(
+        (right - left, bottom - top), Image.BILINEAR,
+        box=(left * scale_x, top * scale_y, right * scale_x, bottom * scale_y)
+    )
+
+
+def _is_settled(region: Image.Image) -> bool:
+    """Whether a global matte region has no edge pixels (all background or all subject)"""
+    low, high = region.getextrema()
+    return high < EDGE_ALPHA_RANGE[0] or low > EDGE_ALPHA_RANGE[1]
+
+
+async def segment_tiled(
+    image: Image.Image,
+    label: str,
+    size_bytes: Optional[int] = None,
+    tier: Optional[str] = None
+) -> MatteResult:
+    """
+    Segment a large image at full resolution in overlapping tiles.
+
+    A global pass at tile resolution gives the model the whole scene, so
+    tiles that are all background or all subject (most of a product shot)
+    take the global matte; only tiles crossing the subject's outline are
+    segmented, TILE_CONCURRENCY at a time. Tile mattes are blended with
+    feathered seams into a memory-mapped buffer. The full-resolution
+    image and the resulting matte are held in memory like any other
+    matte; only the blending accumulators are disk-backed.
+    """
+    tile_size, overlap = settings.tile_size, settings.tile_overlap
+
+    small = await asyncio.to_thread(working_copy, image, tile_size) or image
+    data, _ = await asyncio.to_thread(encode_image, small, "jpg")
+    overview = await inference.segment(
+        f"{label}#global", size_bytes=len(data), tier=tier, image_bytes=data, inline=True
+    )
+    global_matte = overview.matte
+
+    boxes = tile_grid(image.width, image.height, tile_size, overlap)
+    canvas = await asyncio.to_thread(MatteCanvas, image.width, image.height)
+    semaphore = asyncio.Semaphore(settings.tile_concurrency)
+    segmented = 0
+
+    async def process_tile(index: int, box: Box):
+        nonlocal segmented
+        region = await asyncio.to_thread(_global_region, global_matte, box, image.size)
+
+        if not _is_settled(region):
+            async with semaphore:
+                tile = await asyncio.to_thread(image.crop, box)
+                tile_data, _ = await asyncio.to_thread(encode_image, tile, "jpg")
+                result = await inference.segment(
+                    f"{label}#tile{index}", size_bytes=len(tile_data), tier=tier,
+                    image_bytes=tile_data, inline=True
+                )
+            segmented += 1
+            region = result.matte
+            if region.size != tile.size:
+                if settings.matte_refine:
+                    region = await asyncio.to_thread(
+                        upsample_matte, tile, region,
+                        settings.matte_refine_radius, settings.matte_refine_eps
+                    )
+                else:
+                    region = await asyncio.to_thread(rescale_matte, tile, region)
+
+        weights = feather(box, image.width, image.height, overlap)
+        await asyncio.to_thread(canvas.add, box, np.asarray(region), weights)
+
+    tasks = [asyncio.ensure_future(process_tile(index, box)) for index, box in enumerate(boxes)]
+    try:
+        await asyncio.gather(*tasks)
+        matte = await asyncio.to_thread(canvas.result)
+    finally:
+        # One failed tile fails the image: stop the other tiles' upstream
+        # calls, and let them unwind before the buffer goes away
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        canvas.close()
+
+    logger.info(
+        f"Tiled segmentation of {label}: {image.width}x{image.height}, "
+        f"{len(boxes)} tiles, {segmented} segmented"
+    )
+    return MatteResult(backend=overview.backend, image=image, matte=matte)
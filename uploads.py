@@ -0,0 +1,218 @@
+"""
+Direct image uploads: streaming receive, size enforcement and format sniffing
+"""
+from typing import Dict, Optional, Tuple
+from tempfile import SpooledTemporaryFile
+import hashlib
+import logging
+
+from fastapi import HTTPException, Request, status
+from multipart.multipart import MultipartParser, parse_options_header
+from PIL import Image
+
+from config import settings
+from probe import probe_header, check_dimensions
+
+logger = logging.getLogger(__name__)
+
+# Multipart form field names accepted for the image
+FILE_FIELDS = ("image", "file")
+
+# Upper bound for non-file multipart fields (format, background_type, ...)
+MAX_FIELD_BYTES = 1024
+
+
+def _read_dimensions(upload: "Upload") -> Tuple[int, int]:
+    """
+    Dimensions of an upload whose header probe came up short (a JPEG with
+    large EXIF/ICC segments): open the spooled file, which reads only
+    the header, not the pixels
+    """
+    try:
+        upload.file.seek(0)
+        return Image.open(upload.file).size
+    except Exception:
+        raise HTTPException(
+            status_code=status.HTTP_415_UNSUPPORTED_MEDIA_TYPE,
+            detail="Could not read the image dimensions"
+        )
+
+
+class Upload:
+    """
+    An uploaded image spooled to memory or disk, with its content digest
+    (same as cache.content_digest), sniffed format and any extra multipart
+    form fields
+    """
+
+    def __init__(self, spool_bytes: int):
+        self.file = SpooledTemporaryFile(max_size=spool_bytes)
+        self.size = 0
+        self.header = b""
+        self.filename: Optional[str] = None
+        self.fields: Dict[str, str] = {}
+        self.format: Optional[str] = None
+        self._hash = hashlib.blake2b(digest_size=16)
+
+    @property
+    def digest(self) -> str:
+        """Hex content digest of the image bytes"""
+        return self._hash.hexdigest()
+
+    def write(self, data: bytes, max_bytes: int):
+        """Append image bytes, aborting as soon as the upload exceeds max_bytes"""
+        self.size += len(data)
+        if self.size > max_bytes:
+            raise HTTPException(
+                status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+                detail=f"Image too large. Maximum allowed: {max_bytes / (1024 * 1024)}MB"
+            )
+        if len(self.header) < settings.probe_bytes:
+            self.header += data[:settings.probe_bytes - len(self.header)]
+        self._hash.update(data)
+        self.file.write(data)
+
+    def read(self) -> bytes:
+        """Read the whole image"""
+        self.file.seek(0)
+        return self.file.read()
+
+    def close(self):
+        self.file.close()
+
+
+class _FormReceiver:
+    """python-multipart callbacks that route the image part into an Upload"""
+
+    def __init__(self, upload: Upload, max_bytes: int):
+        self.upload = upload
+        self.max_bytes = max_bytes
+        self.headers: Dict[bytes, bytes] = {}
+        self.header_field = b""
+        self.header_value = b""
+        self.field_name: Optional[str] = None
+        self.field_value = b""
+        self.is_file = False
+        self.file_seen = False
+
+    def callbacks(self) -> dict:
+        return {
+            "on_part_begin": self.on_part_begin,
+            "on_header_field": self.on_header_field,
+            "on_header_value": self.on_header_value,
+            "on_header_end": self.on_header_end,
+            "on_headers_finished": self.on_headers_finished,
+            "on_part_data": self.on_part_data,
+            "on_part_end": self.on_part_end,
+        }
+
+    def on_part_begin(self):
+        self.headers = {}
+        self.field_name = None
+        self.field_value = b""
+        self.is_file = False
+
+    def on_header_field(self, data: bytes, start: int, end: int):
+        self.header_field += data[start:end]
+
+    def on_header_value(self, data: bytes, start: int, end: int):
+        self.header_value += data[start:end]
+
+    def on_header_end(self):
+        self.headers[self.header_field.lower()] = self.header_value
+        self.header_field = b""
+        self.header_value = b""
+
+    def on_headers_finished(self):
+        _, options = parse_options_header(self.headers.get(b"content-disposition", b""))
+        self.field_name = options.get(b"name", b"").decode("latin-1")
+        filename = options.get(b"filename")
+
+        if self.field_name in FILE_FIELDS or filename is not None:
+            if self.file_seen:
+                raise HTTPException(
+                    status_code=status.HTTP_400_BAD_REQUEST,
+                    detail="Upload exactly one image per request"
+                )
+            self.is_file = self.file_seen = True
+            self.upload.filename = filename.decode("utf-8", errors="replace") if filename else None
+
+    def on_part_data(self, data: bytes, start: int, end: int):
+        if self.is_file:
+            self.upload.write(data[start:end], self.max_bytes)
+            return
+
+        self.field_value += data[start:end]
+        if len(self.field_value) > MAX_FIELD_BYTES:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=f"Form field '{self.field_name}' is too long"
+            )
+
+    def on_part_end(self):
+        if not self.is_file and self.field_name:
+            self.upload.fields[self.field_name] = self.field_value.decode("utf-8", errors="replace")
+
+
+async def receive_upload(request: Request, max_bytes: Optional[int] = None) -> Upload:
+    """
+    Stream an uploaded image into a spooled temporary file.
+
+    Accepts multipart/form-data (image in an `image` or `file` field) or the
+    raw image as the request body. The size limit is enforced while the body
+    streams in, so oversized uploads are rejected without being buffered.
+    The format is sniffed from the image's magic bytes and must be allowed.
+    """
+    max_bytes = max_bytes or settings.max_image_size_mb * 1024 * 1024
+
+    # Reject up front when the client declares an oversized body
+    content_length = request.headers.get("content-length")
+    if content_length and content_length.isdigit() and int(content_length) > max_bytes + 64 * 1024:
+        raise HTTPException(
+            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            detail=f"Image too large. Maximum allowed: {max_bytes / (1024 * 1024)}MB"
+        )
+
+    upload = Upload(spool_bytes=settings.upload_spool_mb * 1024 * 1024)
+    try:
+        content_type, params = parse_options_header(request.headers.get("content-type", ""))
+
+        if content_type == b"multipart/form-data":
+            boundary = params.get(b"boundary")
+            if not boundary:
+                raise HTTPException(
+                    status_code=status.HTTP_400_BAD_REQUEST,
+                    detail="Missing multipart boundary"
+                )
+            receiver = _FormReceiver(upload, max_bytes)
+            parser = MultipartParser(boundary, receiver.callbacks())
+            async for chunk in request.stream():
+                parser.write(chunk)
+            parser.finalize()
+        else:
+            async for chunk in request.stream():
+                upload.write(chunk, max_bytes)
+
+        if upload.size == 0:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="No image uploaded"
+            )
+
+        upload.format, dimensions = probe_header(upload.header)
+        allowed = [image_format.lower() for image_format in settings.allowed_image_formats]
+        if upload.format is None or (upload.format not in allowed and not (upload.format == "jpeg" and "jpg" in allowed)):
+            raise HTTPException(
+                status_code=status.HTTP_415_UNSUPPORTED_MEDIA_TYPE,
+                detail=f"Unsupported image type. Allowed: {', '.join(settings.allowed_image_formats)}"
+            )
+
+        if dimensions is None:
+            dimensions = _read_dimensions(upload)
+        check_dimensions(*dimensions, settings.max_image_megapixels)
+    except Exception:
+        upload.close()
+        raise
+
+    logger.info(f"Upload received: {upload.size} bytes, {upload.format}, digest {upload.digest}")
+    return upload
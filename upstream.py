@@ -0,0 +1,119 @@
+"""
+Non-blocking upstream (Replicate) calls with bounded concurrency
+"""
+from typing import Any, Dict
+import asyncio
+import logging
+
+import replicate
+from replicate.exceptions import ModelError
+
+from config import settings
+
+logger = logging.getLogger(__name__)
+
+# Prediction states after which Replicate no longer changes the prediction
+TERMINAL_STATES = ("succeeded", "failed", "canceled")
+
+
+class UpstreamClient:
+    """
+    Async client for Replicate predictions.
+
+    Predictions are created and polled through the async HTTP API, sleeping
+    with asyncio between polls, so a single worker can hold many predictions
+    in flight. A semaphore caps how many run at once per worker.
+    """
+
+    def __init__(
+        self,
+        api_token: str,
+        model: str,
+        max_concurrency: int = 32,
+        poll_interval: float = 0.5
+    ):
+        self.client = replicate.Client(api_token=api_token)
+        self.model = model
+        self.max_concurrency = max_concurrency
+        self.poll_interval = poll_interval
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self.in_flight = 0
+        self.waiting = 0
+        self.completed = 0
+        self.failed = 0
+
+    async def _create_prediction(self, input: Dict[str, Any]):
+        """Create a prediction for the configured model (owner/name[:version])"""
+        model_name, _, version_id = self.model.partition(":")
+        if version_id:
+            return await self.client.predictions.async_create(version=version_id, input=input)
+
+        owner, _, name = model_name.partition("/")
+        return await self.client.models.predictions.async_create(model=(owner, name), input=input)
+
+    async def _wait(self, prediction):
+        """Poll a prediction until it reaches a terminal state"""
+        while prediction.status not in TERMINAL_STATES:
+            await asyncio.sleep(self.poll_interval)
+            prediction = await self.client.predictions.async_get(prediction.id)
+        return prediction
+
+    async def _cancel(self, prediction_id: str):
+        """Cancel a prediction nobody is waiting for anymore"""
+        try:
+            await self.client.predictions.async_cancel(prediction_id)
+            logger.info(f"Canceled abandoned prediction {prediction_id}")
+        except Exception as e:
+            logger.warning(f"Could not cancel prediction {prediction_id}: {str(e)}")
+
+    async def run(self, input: Dict[str, Any]) -> Any:
+        """
+        Run the model and return its output without blocking the event loop.
+        Raises ModelError if the prediction fails, like replicate.run does.
+        """
+        self.waiting += 1
+        try:
+            await self._semaphore.acquire()
+        finally:
+            self.waiting -= 1
+
+        self.in_flight += 1
+        try:
+            prediction = await self._create_prediction(input)
+            try:
+                prediction = await self._wait(prediction)
+            except asyncio.CancelledError:
+                # The caller went away - stop paying for the prediction
+                asyncio.ensure_future(self._cancel(prediction.id))
+                raise
+
+            if prediction.status != "succeeded":
+                raise ModelError(prediction.error or f"Prediction {prediction.status}")
+
+            self.completed += 1
+            return prediction.output
+        except Exception:
+            self.failed += 1
+            raise
+        finally:
+            self.in_flight -= 1
+            self._semaphore.release()
+
+    def stats(self) -> dict:
+        """Get upstream concurrency statistics"""
+        return {
+            "max_concurrency": self.max_concurrency,
+            "in_flight": self.in_flight,
+            "waiting": self.waiting,
+            "completed": self.completed,
+            "failed": self.failed
+        }
+
+
+# Global upstream client instance
+upstream = UpstreamClient(
+    api_token=settings.replicate_api_token,
+    model=settings.replicate_model,
+    max_concurrency=settings.upstream_max_concurrency,
+    poll_interval=settings.upstream_poll_interval
+)
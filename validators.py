@@ -2,24 +2,134 @@
 Validation utilities for API requests
 """
 from fastapi import HTTPException, status
-from typing import Optional
-import requests
+from contextlib import asynccontextmanager
+from typing import Dict, Optional, Tuple
 from urllib.parse import urlparse
+import asyncio
 import logging
-import urllib3
+import ssl
+import time
+
+import httpx
+
+from probe import probe_header, check_dimensions, jpeg_scan
 
 logger = logging.getLogger(__name__)
 
-# Disable SSL warnings when verification is disabled
-urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
+# HTTP/2 needs the h2 package (httpx[http2]); without it the client speaks HTTP/1.1
+try:
+    import h2  # noqa: F401
+    HTTP2_AVAILABLE = True
+except ImportError:
+    HTTP2_AVAILABLE = False
+
+
+# Further ranged reads allowed to reach a JPEG frame header past the probe
+JPEG_MAX_SEEKS = 4
+
+# Upstream statuses remembered (negatively cached) along with timeouts
+NEGATIVE_STATUSES = (404, 410)
+
+
+def _is_ssl_error(error: Exception) -> bool:
+    """Whether an httpx error was caused by TLS certificate verification"""
+    while error is not None:
+        if isinstance(error, ssl.SSLError):
+            return True
+        error = error.__cause__ or error.__context__
+    return False
 
 
 class ImageValidator:
     """Validate image URLs and properties"""
     
-    def __init__(self, max_size_mb: int = 10, allowed_formats: list = None):
+    def __init__(
+        self,
+        max_size_mb: int = 10,
+        allowed_formats: list = None,
+        output_formats: list = None,
+        max_megapixels: float = None,
+        probe_bytes: int = 16384,
+        timeout: float = 10,
+        max_connections: int = 100,
+        per_host_connections: int = 10,
+        keepalive_expiry: float = 30,
+        http2: bool = True,
+        cache=None,
+        cache_ttl: int = 60,
+        negative_ttl: int = 30
+    ):
         self.max_size_bytes = max_size_mb * 1024 * 1024
+        self.max_megapixels = max_megapixels
+        self.probe_bytes = probe_bytes
         self.allowed_formats = allowed_formats or ["jpg", "jpeg", "png", "webp", "gif"]
+        # Output formats default to the accepted input formats
+        self.output_formats = output_formats or self.allowed_formats
+        
+        self.timeout = timeout
+        self.limits = httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_connections,
+            keepalive_expiry=keepalive_expiry
+        )
+        self.per_host_connections = per_host_connections
+        self.http2 = http2 and HTTP2_AVAILABLE
+        if http2 and not HTTP2_AVAILABLE:
+            logger.warning("h2 is not installed, URL validation will use HTTP/1.1")
+        
+        self._client: Optional[httpx.AsyncClient] = None
+        # Only created if a host fails certificate verification
+        self._insecure_client: Optional[httpx.AsyncClient] = None
+        # Host -> (semaphore, requests holding or waiting for it); idle hosts are dropped
+        self._host_slots: Dict[str, Tuple[asyncio.Semaphore, int]] = {}
+        
+        # URL -> validation result (or error) cache; see validate_image_url
+        self.cache = cache
+        self.cache_ttl = cache_ttl
+        self.negative_ttl = negative_ttl
+        self.revalidations = 0
+        self.negative_hits = 0
+    
+    def _new_client(self, verify: bool) -> httpx.AsyncClient:
+        return httpx.AsyncClient(
+            http2=self.http2,
+            limits=self.limits,
+            timeout=self.timeout,
+            follow_redirects=True,
+            verify=verify
+        )
+    
+    async def start(self):
+        """Open the pooled HTTP client (at app startup)"""
+        if self._client is None:
+            self._client = self._new_client(verify=True)
+    
+    async def close(self):
+        """Close pooled connections (at app shutdown)"""
+        for client in (self._client, self._insecure_client):
+            if client is not None:
+                await client.aclose()
+        self._client = self._insecure_client = None
+    
+    @asynccontextmanager
+    async def _host_slot(self, url: str):
+        """
+        Bound concurrent validation requests to one host. A host's semaphore
+        only lives while requests hold or wait for it, so the map stays as
+        small as the set of hosts being validated right now.
+        """
+        host = urlparse(url).netloc
+        slot, users = self._host_slots.get(host) or (asyncio.Semaphore(self.per_host_connections), 0)
+        self._host_slots[host] = (slot, users + 1)
+        try:
+            async with slot:
+                yield
+        finally:
+            slot, users = self._host_slots[host]
+            if users == 1:
+                del self._host_slots[host]
+            else:
+                self._host_slots[host] = (slot, users - 1)
     
     def validate_url(self, url: str) -> bool:
         """Validate URL format"""
@@ -29,10 +139,15 @@ class ImageValidator:
         except Exception:
             return False
     
-    def validate_image_url(self, url: str, check_size: bool = True) -> dict:
+    async def validate_image_url(self, url: str, check_size: bool = True) -> dict:
         """
-        Validate image URL and optionally check file size
+        Validate image URL and optionally probe the image itself
         Returns dict with validation results
+
+        Probe results are cached by URL: reused as-is for cache_ttl seconds,
+        then revalidated with a conditional request (If-None-Match /
+        If-Modified-Since) while the cache keeps the entry. 404/410 and
+        timeouts are cached for negative_ttl seconds.
         """
         # Check URL format
         if not self.validate_url(url):
@@ -43,32 +158,85 @@ class ImageValidator:
         
         # Check if URL is accessible
         if check_size:
+            url = str(url)
+            entry = self.cache.get(url) if self.cache is not None else None
+            if entry is not None:
+                if "error" in entry:
+                    self.negative_hits += 1
+                    raise HTTPException(**entry["error"])
+                if time.time() - entry["checked"] < self.cache_ttl:
+                    return dict(entry["result"])
+            
+            # Stale entries are revalidated rather than probed again
+            conditional = {}
+            if entry is not None and entry["etag"]:
+                conditional["If-None-Match"] = entry["etag"]
+            if entry is not None and entry["last_modified"]:
+                conditional["If-Modified-Since"] = entry["last_modified"]
+            
             try:
-                # HEAD request to check size without downloading
+                # Ranged GET of the first bytes: the same round trip as a HEAD,
+                # but it also returns the header that holds the real format and size
                 # Try with SSL verification first
+                verify = True
                 try:
-                    response = requests.head(str(url), timeout=10, allow_redirects=True, verify=True)
-                except requests.exceptions.SSLError:
+                    status_code, headers, header = await self._probe(url, verify, headers=conditional)
+                except httpx.ConnectError as e:
+                    if not _is_ssl_error(e):
+                        raise
                     # If SSL verification fails, try without (for development/local testing)
                     logger.warning(f"SSL verification failed for {url}, retrying without verification")
-                    response = requests.head(str(url), timeout=10, allow_redirects=True, verify=False)
+                    verify = False
+                    status_code, headers, header = await self._probe(url, verify, headers=conditional)
                 
-                if response.status_code != 200:
-                    raise HTTPException(
+                if status_code == 304 and entry is not None:
+                    self.revalidations += 1
+                    self._remember(url, {**entry, "checked": time.time()})
+                    logger.debug(f"Validation of {url} revalidated (304)")
+                    return dict(entry["result"])
+                
+                if status_code not in (200, 206):
+                    error = HTTPException(
                         status_code=status.HTTP_400_BAD_REQUEST,
-                        detail=f"Image URL not accessible (status: {response.status_code})"
+                        detail=f"Image URL not accessible (status: {status_code})"
                     )
+                    if status_code in NEGATIVE_STATUSES:
+                        self._remember_error(url, error)
+                    raise error
+                
+                content_type = headers.get("Content-Type", "").lower()
+                image_format, dimensions = probe_header(header)
                 
-                # Check content type
-                content_type = response.headers.get("Content-Type", "").lower()
-                if not content_type.startswith("image/"):
-                    logger.warning(f"Non-image content type: {content_type}")
-                    # Don't fail, as some servers don't set correct content-type
+                # Trust the bytes, not the declared Content-Type
+                if image_format is None or not self._format_allowed(image_format):
+                    raise HTTPException(
+                        status_code=status.HTTP_415_UNSUPPORTED_MEDIA_TYPE,
+                        detail=f"Unsupported image type (Content-Type: {content_type or 'none'}). Allowed: {', '.join(self.allowed_formats)}"
+                    )
+                
+                if dimensions is None and image_format == "jpeg":
+                    # The frame header is behind large EXIF/ICC segments
+                    dimensions = await self._jpeg_dimensions(url, verify, header)
+                if dimensions is None:
+                    raise HTTPException(
+                        status_code=status.HTTP_415_UNSUPPORTED_MEDIA_TYPE,
+                        detail="Could not read the image dimensions"
+                    )
+                check_dimensions(*dimensions, self.max_megapixels)
+                
+                result = {
+                    "valid": True,
+                    "size_bytes": None,
+                    "size_mb": None,
+                    "content_type": content_type,
+                    "format": image_format,
+                    "width": dimensions[0],
+                    "height": dimensions[1]
+                }
                 
                 # Check file size
-                content_length = response.headers.get("Content-Length")
-                if content_length:
-                    size_bytes = int(content_length)
+                size_bytes = self._total_size(status_code, headers)
+                if size_bytes is not None:
                     size_mb = size_bytes / (1024 * 1024)
                     
                     if size_bytes > self.max_size_bytes:
@@ -77,29 +245,27 @@ class ImageValidator:
                             detail=f"Image too large ({size_mb:.2f}MB). Maximum allowed: {self.max_size_bytes / (1024 * 1024)}MB"
                         )
                     
-                    logger.info(f"Image size validated: {size_mb:.2f}MB")
-                    
-                    return {
-                        "valid": True,
-                        "size_bytes": size_bytes,
-                        "size_mb": size_mb,
-                        "content_type": content_type
-                    }
+                    logger.info(f"Image validated: {image_format}, {size_mb:.2f}MB, {dimensions[0]}x{dimensions[1]}")
+                    result.update(size_bytes=size_bytes, size_mb=size_mb)
                 else:
-                    logger.warning("Content-Length header not present, skipping size check")
-                    return {
-                        "valid": True,
-                        "size_bytes": None,
-                        "size_mb": None,
-                        "content_type": content_type
-                    }
+                    logger.warning("Image size not reported, skipping size check")
+                
+                self._remember(url, {
+                    "result": result,
+                    "etag": headers.get("ETag"),
+                    "last_modified": headers.get("Last-Modified"),
+                    "checked": time.time()
+                })
+                return dict(result)
                     
-            except requests.exceptions.Timeout:
-                raise HTTPException(
+            except httpx.TimeoutException:
+                error = HTTPException(
                     status_code=status.HTTP_408_REQUEST_TIMEOUT,
                     detail="Image URL request timed out"
                 )
-            except requests.exceptions.RequestException as e:
+                self._remember_error(url, error)
+                raise error
+            except httpx.HTTPError as e:
                 logger.error(f"Error validating image URL: {str(e)}")
                 raise HTTPException(
                     status_code=status.HTTP_400_BAD_REQUEST,
@@ -108,14 +274,105 @@ class ImageValidator:
         
         return {"valid": True}
     
+    def _remember(self, url: str, entry: dict):
+        if self.cache is not None:
+            self.cache.set(url, entry)
+    
+    def _remember_error(self, url: str, error: HTTPException):
+        if self.cache is not None:
+            self.cache.set(url, {"error": {"status_code": error.status_code, "detail": error.detail}}, ttl=self.negative_ttl)
+    
+    def probed(self, url: str) -> Optional[dict]:
+        """
+        Result of a recent validation of url (format and dimensions read
+        from the file header), if still cached
+        """
+        entry = self.cache.peek(str(url)) if self.cache is not None else None
+        if entry is None or "result" not in entry:
+            return None
+        return entry["result"]
+    
+    def stats(self) -> dict:
+        """Validation cache statistics"""
+        if self.cache is None:
+            return {"enabled": False}
+        return {
+            "enabled": True,
+            **self.cache.stats(),
+            "revalidations": self.revalidations,
+            "negative_hits": self.negative_hits
+        }
+    
+    async def _probe(self, url: str, verify: bool, headers: Optional[dict] = None, start: int = 0):
+        """
+        GET probe_bytes of an image from file offset start on the pooled
+        client, with any extra (conditional) headers. Returns (status code,
+        response headers, bytes from start).
+        """
+        if verify:
+            await self.start()
+            client = self._client
+        else:
+            if self._insecure_client is None:
+                self._insecure_client = self._new_client(verify=False)
+            client = self._insecure_client
+        
+        end = start + self.probe_bytes
+        data = b""
+        async with self._host_slot(str(url)):
+            async with client.stream(
+                "GET", str(url), headers={"Range": f"bytes={start}-{end - 1}", **(headers or {})}
+            ) as response:
+                if response.status_code in (200, 206):
+                    # Servers that ignore Range send the whole file from the
+                    # start; stop reading once the requested bytes are in
+                    skip = start if response.status_code == 200 else 0
+                    async for chunk in response.aiter_bytes():
+                        data += chunk
+                        if len(data) >= skip + self.probe_bytes:
+                            break
+                    data = data[skip:skip + self.probe_bytes]
+        return response.status_code, response.headers, data
+    
+    async def _jpeg_dimensions(self, url: str, verify: bool, header: bytes) -> Optional[Tuple[int, int]]:
+        """
+        Follow a JPEG's marker segments past the probed header with further
+        ranged reads, up to JPEG_MAX_SEEKS reads and the size limit
+        """
+        dimensions, offset = jpeg_scan(header)
+        for _ in range(JPEG_MAX_SEEKS):
+            if offset is None or offset >= self.max_size_bytes:
+                return None
+            status_code, _, data = await self._probe(url, verify, start=offset)
+            if status_code not in (200, 206) or not data:
+                return None
+            dimensions, offset = jpeg_scan(data, base=offset, offset=offset)
+            if dimensions is not None:
+                return dimensions
+        return None
+    
+    @staticmethod
+    def _total_size(status_code: int, headers) -> Optional[int]:
+        """Full file size: from Content-Range on a partial response, Content-Length otherwise"""
+        if status_code == 206:
+            # Content-Range: bytes 0-16383/2483921 (total may be "*" if unknown)
+            total = headers.get("Content-Range", "").rpartition("/")[2]
+            return int(total) if total.isdigit() else None
+        content_length = headers.get("Content-Length")
+        return int(content_length) if content_length and content_length.isdigit() else None
+    
+    def _format_allowed(self, image_format: str) -> bool:
+        """Whether a sniffed format is accepted (sniffing reports 'jpeg' for jpg files)"""
+        return image_format in self.allowed_formats or (image_format == "jpeg" and "jpg" in self.allowed_formats)
+    
     def validate_format(self, format_str: str) -> str:
         """Validate output format"""
         format_lower = format_str.lower()
         
-        if format_lower not in self.allowed_formats:
+        if format_lower not in self.output_formats:
             raise HTTPException(
                 status_code=status.HTTP_400_BAD_REQUEST,
-                detail=f"Invalid format '{format_str}'. Allowed: {', '.join(self.allowed_formats)}"
+                detail=f"Invalid format '{format_str}'. Allowed: {', '.join(self.output_formats)}"
             )
         
         return format_lower